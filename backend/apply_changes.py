@@ -12,11 +12,21 @@ logging.basicConfig(
 logger = logging.getLogger('file_organizer')
 
 def apply_changes(structure_path):
-    """Apply the file structure changes"""
+    """Apply the file structure changes from a JSON file"""
     try:
         with open(structure_path, 'r') as f:
             structure = json.load(f)
-        
+    except Exception as e:
+        error_msg = f"Error applying changes: {str(e)}"
+        print(error_msg)
+        logger.error(error_msg, exc_info=True)
+        return False
+    
+    return apply_structure(structure)
+
+def apply_structure(structure):
+    """Apply the file structure changes"""
+    try:
         logger.debug(f"Loaded structure: {json.dumps(structure, indent=2)}")
         
         # Get the base directory from the first file's source path
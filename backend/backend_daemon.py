@@ -0,0 +1,250 @@
+# backend/backend_daemon.py
+"""Long-lived backend process serving JSON-RPC 2.0 requests over stdio.
+
+Electron starts this once and sends one JSON request per line on stdin.
+Responses are written one per line on stdout. Anything the backend
+modules print while handling a request (TOKEN_USAGE:, PROGRESS:, logs) is
+forwarded as an "output" notification tagged with the request id, so the
+existing stdout markers keep working without corrupting the protocol.
+
+Backend modules are imported on first use and kept loaded, so clients,
+models, caches and the chat agent stay warm across calls. Per-run state
+that used to die with each process, such as the token and call budget,
+is reset before every request.
+
+Requests are handled one at a time, in order: a chat query sent while a
+long analyze_directory runs waits until the analysis has finished.
+"""
+import io
+import sys
+import json
+import logging
+import inspect
+import importlib
+import threading
+import traceback
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+class NotificationStream(io.TextIOBase):
+    """Text stream that turns printed lines into "output" notifications"""
+
+    def __init__(self, send):
+        self.send = send
+        self.request_id = None
+        self.captured = None
+        self.buffer = ''
+        self.lock = threading.RLock()
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        with self.lock:
+            self.buffer += text
+            while '\n' in self.buffer:
+                line, self.buffer = self.buffer.split('\n', 1)
+                self.emit(line)
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                line, self.buffer = self.buffer, ''
+                self.emit(line)
+
+    def emit(self, line):
+        if self.captured is not None:
+            self.captured.append(line)
+        self.send({
+            "jsonrpc": "2.0",
+            "method": "output",
+            "params": {"id": self.request_id, "line": line}
+        })
+
+class BackendDaemon:
+    def __init__(self, protocol_out):
+        self.protocol_out = protocol_out
+        self.write_lock = threading.Lock()
+        self.output = NotificationStream(self.send)
+        self.chat_agents = {}  # online_mode -> FileOrganizationAgent
+        self.running = True
+        self.methods = {
+            'ping': self.ping,
+            'warmup': self.warmup,
+            'shutdown': self.shutdown,
+            'analyze_directory': self.analyze_directory,
+            'chat_query': self.chat_query,
+            'generate_filenames': self.generate_filenames,
+            'rename_files': self.rename_files,
+            'apply_changes': self.apply_changes
+        }
+
+    def send(self, message):
+        """Write one protocol message to the real stdout"""
+        with self.write_lock:
+            self.protocol_out.write(json.dumps(message) + '\n')
+            self.protocol_out.flush()
+
+    def module(self, name):
+        """Import a backend module once and reuse it for every later call"""
+        return importlib.import_module(name)
+
+    def ping(self):
+        return "pong"
+
+    def warmup(self, modules=None):
+        """Import backend modules ahead of the first real request"""
+        loaded = {}
+        for name in modules or ['initial_organize_electron', 'rename_files', 'apply_changes', 'chat_agent']:
+            try:
+                self.module(name)
+                loaded[name] = True
+            except Exception as e:
+                print(f"Warmup failed for {name}: {str(e)}")
+                loaded[name] = False
+        return loaded
+
+    def shutdown(self):
+        self.running = False
+        return True
+
+    def analyze_directory(self, directory, online_mode=True, concurrency=None, batch_summaries=False,
+                          batch_token_budget=None, exclude_patterns=None, structure_mode="auto"):
+        organizer = self.module('initial_organize_electron')
+        if isinstance(online_mode, str):
+            online_mode = online_mode.lower() == 'true'
+        result = organizer.analyze_directory(
+            directory,
+            online_mode=online_mode,
+            max_workers=concurrency,
+            batch_mode=batch_summaries,
+            token_budget=batch_token_budget,
+            exclude_patterns=exclude_patterns,
+            structure_mode=structure_mode
+        )
+        return json.loads(result) if isinstance(result, str) else result
+
+    def chat_query(self, message, currentFileStructure, online_mode=False):
+        agent = self.chat_agents.get(online_mode)
+        if agent is None:
+            chat_agent = self.module('chat_agent')
+            print(f"Chat agent running in {'ONLINE' if online_mode else 'OFFLINE'} mode")
+            agent = chat_agent.FileOrganizationAgent(client=None, online_mode=online_mode)
+            self.chat_agents[online_mode] = agent
+        # Each query used to get a fresh agent; keep the warm chain but
+        # start every query with the same empty history as before
+        agent.memory.clear()
+        return agent.process_query(message, currentFileStructure)
+
+    def generate_filenames(self, files, online_mode=True):
+        return self.module('rename_files').generate_filenames(files, online_mode)
+
+    def rename_files(self, files, new_names, online_mode=True):
+        return self.module('rename_files').rename_files(files, new_names)
+
+    def apply_changes(self, structure):
+        self.output.captured = []
+        try:
+            success = self.module('apply_changes').apply_structure(structure)
+            return {"success": success, "message": '\n'.join(self.output.captured)}
+        finally:
+            self.output.captured = None
+
+    def handle(self, line):
+        """Handle one request line and return the response, or None for notifications"""
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            return self.error_response(None, PARSE_ERROR, f"Parse error: {str(e)}")
+
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return self.error_response(request.get('id') if isinstance(request, dict) else None,
+                                       INVALID_REQUEST, "Invalid request")
+
+        request_id = request.get('id')
+        method = self.methods.get(request['method'])
+        if method is None:
+            return self.error_response(request_id, METHOD_NOT_FOUND, f"Method not found: {request['method']}")
+
+        params = request.get('params') or {}
+        try:
+            if isinstance(params, list):
+                bound = inspect.signature(method).bind(*params)
+            else:
+                bound = inspect.signature(method).bind(**params)
+        except TypeError as e:
+            return self.error_response(request_id, INVALID_PARAMS, f"Invalid params: {str(e)}")
+
+        self.output.request_id = request_id
+        try:
+            self.reset_request_state()
+            result = method(*bound.args, **bound.kwargs)
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            return self.error_response(request_id, SERVER_ERROR, str(e))
+        finally:
+            self.output.flush()
+            self.output.request_id = None
+
+        if request_id is None:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def reset_request_state(self):
+        """Give each request the fresh usage budget it had as its own process"""
+        organizer = sys.modules.get('initial_organize_electron')
+        if organizer is not None:
+            organizer.reset_usage()
+
+    def error_response(self, request_id, code, message):
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+    def serve(self, stdin):
+        """Serve requests until stdin closes or shutdown is called.
+
+        Requests run serially on this thread, so a long request (an
+        analysis of a large directory) delays the ones queued behind it.
+        """
+        while self.running:
+            line = stdin.readline()
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            response = self.handle(line)
+            if response is not None:
+                self.send(response)
+
+def setup_logging():
+    """Log to the (redirected) stdout and to initial_organize.log, overwritten per daemon start"""
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler('initial_organize.log', mode='w')
+        ]
+    )
+
+def main():
+    protocol_out = sys.stdout
+    daemon = BackendDaemon(protocol_out)
+    # Redirect stdout before any backend module is imported so their
+    # print() calls and stdout logging handlers go through the daemon
+    sys.stdout = daemon.output
+    setup_logging()
+    try:
+        daemon.serve(sys.stdin)
+    finally:
+        sys.stdout = protocol_out
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import json
+import math
+import logging
+import numpy as np
+from summarizer import summarize_files
+from structure_mapreduce import normalize_category, parse_json_object, validate_plan
+
+logger = logging.getLogger('cluster_organizer')
+
+# Upper bound on the number of folders produced
+MAX_CLUSTERS = 12
+# Summaries shown to the LLM when naming a cluster
+REPRESENTATIVES_PER_CLUSTER = 5
+KMEANS_ITERATIONS = 50
+# Files whose summary could not be embedded are placed here
+UNCLUSTERED_CATEGORY = "Uncategorized"
+
+NAME_PROMPT = """
+You will be provided with a JSON array of summaries of files that belong in the same folder. Name the folder using known conventions and best practices. The name should be simple like: Academic, Research, Images, Documents, etc. Use underscores instead of spaces.
+
+Respond with ONLY valid JSON matching the following schema:
+
+```json
+{
+    "name": "Folder_Name"
+}
+```
+""".strip()
+
+def normalize_rows(vectors):
+    """Scale each row to unit length so k-means works on cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def squared_distances(vectors, centroids):
+    """Pairwise squared Euclidean distances, shape (len(vectors), len(centroids))"""
+    distances = (
+        np.einsum('ij,ij->i', vectors, vectors)[:, None]
+        - 2.0 * vectors @ centroids.T
+        + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+    )
+    return np.maximum(distances, 0.0)
+
+def kmeans(vectors, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """Vectorized k-means with k-means++ seeding.
+
+    Returns (labels, centroids). Clusters that end up empty are reseeded
+    with the point farthest from its centroid.
+    """
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    k = max(1, min(k, count))
+
+    centroids = np.empty((k, vectors.shape[1]), dtype=vectors.dtype)
+    centroids[0] = vectors[rng.integers(count)]
+    closest = squared_distances(vectors, centroids[:1])[:, 0]
+    for index in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            choice = rng.choice(count, p=closest / total)
+        else:
+            choice = rng.integers(count)
+        centroids[index] = vectors[choice]
+        closest = np.minimum(closest, squared_distances(vectors, centroids[index:index + 1])[:, 0])
+
+    labels = np.zeros(count, dtype=np.int64)
+    for iteration in range(iterations):
+        distances = squared_distances(vectors, centroids)
+        new_labels = distances.argmin(axis=1)
+        if iteration > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        sizes = np.bincount(labels, minlength=k)
+        empty = sizes == 0
+        centroids[~empty] = sums[~empty] / sizes[~empty, None]
+        if empty.any():
+            farthest = distances[np.arange(count), labels].argsort()[::-1]
+            centroids[empty] = vectors[farthest[:empty.sum()]]
+    return labels, centroids
+
+def choose_cluster_count(count, max_clusters=MAX_CLUSTERS):
+    """Rule-of-thumb number of clusters, sqrt(n / 2), capped at max_clusters"""
+    return max(1, min(max_clusters, int(round(math.sqrt(count / 2)))))
+
+def cluster_representatives(vectors, labels, centroids, cluster, count=REPRESENTATIVES_PER_CLUSTER):
+    """Indexes of the members closest to a cluster's centroid"""
+    members = np.flatnonzero(labels == cluster)
+    distances = squared_distances(vectors[members], centroids[cluster:cluster + 1])[:, 0]
+    return members[distances.argsort()[:count]]
+
+def name_cluster(summaries, chat_fn):
+    """Ask the LLM for a folder name given representative summaries"""
+    messages = [
+        {"role": "system", "content": NAME_PROMPT},
+        {"role": "user", "content": json.dumps(summaries)}
+    ]
+    content = chat_fn(messages, 64)
+    try:
+        name = parse_json_object(content).get('name')
+    except (ValueError, json.JSONDecodeError):
+        name = content.strip().splitlines()[0] if content.strip() else None
+    return normalize_category(name) if name else None
+
+def merge_names(names):
+    """Give clusters the LLM named alike (ignoring case) one shared folder name"""
+    spellings = {}
+    return [spellings.setdefault(name.lower(), name) for name in names]
+
+def cluster_structure(file_summaries, embeddings_generator, chat_fn, dst_builder, online_mode=False,
+                      max_workers=None, max_clusters=MAX_CLUSTERS):
+    """Generate a file structure by clustering summary embeddings.
+
+    Summaries are embedded with a search.EmbeddingsGenerator, grouped with
+    k-means, and the LLM is only asked to name each cluster from its most
+    central summaries, so the number of LLM calls follows the number of
+    folders rather than the number of files. Clusters given the same name
+    share a folder. Entries with a
+    "duplicate_group" share the folder of the group's first file.
+    chat_fn and dst_builder are the same as for
+    structure_mapreduce.build_structure, and the result has the same shape
+    as generate_file_structure. Returns None when no summary could be
+    embedded, so the caller can build the structure another way.
+    """
+    file_paths = [entry['file_path'] for entry in file_summaries]
+    representatives = {}
+    entries = []
+    for entry in file_summaries:
+        group = entry.get('duplicate_group')
+        if group is not None:
+            if group in representatives:
+                continue
+            representatives[group] = entry['file_path']
+        entries.append(entry)
+    if not entries:
+        return []
+
+    embeddings = embeddings_generator.generate_embeddings_batch([entry['summary'] for entry in entries])
+    embedded = [index for index, embedding in enumerate(embeddings) if embedding is not None]
+    if not embedded:
+        logger.error("No summaries could be embedded")
+        return None
+    vectors = normalize_rows(np.stack([embeddings[index] for index in embedded]).astype(np.float32))
+
+    k = choose_cluster_count(len(embedded), max_clusters)
+    labels, centroids = kmeans(vectors, k)
+    logger.info(f"Clustered {len(embedded)} summaries into {k} groups")
+
+    def name(cluster, mode):
+        members = cluster_representatives(vectors, labels, centroids, cluster)
+        summaries = [entries[embedded[member]]['summary'] for member in members]
+        try:
+            return name_cluster(summaries, chat_fn)
+        except Exception as e:
+            logger.error(f"Error naming cluster {cluster}: {str(e)}")
+            return None
+
+    names = summarize_files(list(range(k)), name, online_mode=online_mode, max_workers=max_workers)
+    names = merge_names([cluster_name or f"Group_{cluster + 1}" for cluster, cluster_name in enumerate(names)])
+    logger.info(f"Cluster folders: {', '.join(sorted(set(names)))}")
+
+    categories = {entries[index]['file_path']: names[label] for index, label in zip(embedded, labels)}
+    plan = []
+    for entry in file_summaries:
+        group = entry.get('duplicate_group')
+        source = representatives.get(group, entry['file_path']) if group is not None else entry['file_path']
+        category = categories.get(source)
+        if category:
+            plan.append({"src_path": entry['file_path'], "dst_path": dst_builder(entry['file_path'], category)})
+    return validate_plan(file_paths, plan, dst_builder, UNCLUSTERED_CATEGORY)
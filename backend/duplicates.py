@@ -0,0 +1,97 @@
+import os
+import hashlib
+import logging
+from fingerprints import get_fingerprint_index
+
+logger = logging.getLogger('duplicates')
+
+# Bytes read from each end of a file for the partial hash
+PARTIAL_HASH_BYTES = 64 * 1024
+
+def partial_hash(file_path, size, chunk_size=PARTIAL_HASH_BYTES):
+    """SHA-256 of the first and last chunk_size bytes of a file.
+
+    Files no larger than two chunks are read completely, so for them the
+    result is the SHA-256 of the whole content.
+    """
+    sha256_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        if size <= 2 * chunk_size:
+            sha256_hash.update(f.read())
+        else:
+            sha256_hash.update(f.read(chunk_size))
+            f.seek(size - chunk_size)
+            sha256_hash.update(f.read(chunk_size))
+    return sha256_hash.hexdigest()
+
+def group_by(file_paths, key_fn):
+    """Group paths by key_fn(path), skipping files that cannot be read"""
+    groups = {}
+    for file_path in file_paths:
+        try:
+            key = key_fn(file_path)
+        except OSError as e:
+            logger.error(f"Error reading {file_path}: {str(e)}")
+            continue
+        groups.setdefault(key, []).append(file_path)
+    return groups
+
+def find_duplicates(file_paths, stat_results=None, hash_fn=None):
+    """Find files with identical content.
+
+    Files are grouped by size first, then by a hash of their first and last
+    64 KB, and only files that still collide are fully hashed. stat_results
+    may map paths to os.stat results already collected by a scan. hash_fn
+    defaults to the persistent fingerprint index.
+
+    Returns a list of groups, each {"hash": sha256, "size": bytes,
+    "files": [paths]}, with files in input order.
+    """
+    stat_results = stat_results or {}
+    if hash_fn is None:
+        fingerprint_index = get_fingerprint_index()
+        hash_fn = lambda file_path: fingerprint_index.get_hash(file_path, stat_results.get(file_path))
+
+    def file_size(file_path):
+        stat_result = stat_results.get(file_path)
+        return stat_result.st_size if stat_result else os.path.getsize(file_path)
+
+    duplicate_groups = []
+    size_groups = group_by(file_paths, file_size)
+    candidates = sum(len(paths) for paths in size_groups.values() if len(paths) > 1)
+    logger.info(f"{candidates} of {len(file_paths)} files share a size with another file")
+
+    for size, same_size in size_groups.items():
+        if len(same_size) < 2:
+            continue
+        partial_groups = group_by(same_size, lambda file_path: partial_hash(file_path, size))
+        for partial, same_partial in partial_groups.items():
+            if len(same_partial) < 2:
+                continue
+            if size <= 2 * PARTIAL_HASH_BYTES:
+                # The partial hash already covered the whole file
+                duplicate_groups.append({"hash": partial, "size": size, "files": same_partial})
+                continue
+            for full, same_content in group_by(same_partial, hash_fn).items():
+                if len(same_content) > 1:
+                    duplicate_groups.append({"hash": full, "size": size, "files": same_content})
+
+    order = {file_path: index for index, file_path in enumerate(file_paths)}
+    duplicate_groups.sort(key=lambda group: order[group["files"][0]])
+    logger.info(f"Found {len(duplicate_groups)} groups of duplicate files")
+    return duplicate_groups
+
+def split_duplicates(file_paths, duplicate_groups):
+    """Pick one representative per distinct content.
+
+    Returns (unique_paths, copies) where unique_paths keeps input order and
+    contains a single file per duplicate group, and copies maps every other
+    member of a group to its representative.
+    """
+    copies = {}
+    for group in duplicate_groups:
+        representative = group["files"][0]
+        for file_path in group["files"][1:]:
+            copies[file_path] = representative
+    unique_paths = [file_path for file_path in file_paths if file_path not in copies]
+    return unique_paths, copies
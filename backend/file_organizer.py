@@ -2,16 +2,24 @@ import os
 import sys
 import json
 from pathlib import Path
-import PyPDF2
+from text_extraction import extract_text, get_extraction_pool
 from PIL import Image
 import mimetypes
-import hashlib
-import csv
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from dotenv import load_dotenv
 from ollama import Client
+from summarizer import summarize_files, summarize_texts_batched
+from summary_store import get_summary_store
+from fingerprints import get_fingerprint_index
+from duplicates import find_duplicates, split_duplicates
+from scanner import list_files
+from structure_mapreduce import build_structure, relative_destination, MAP_REDUCE_THRESHOLD
+from cluster_organizer import cluster_structure
+from search import EmbeddingsGenerator, select_embedding_backend
 
 # Load environment variables
 load_dotenv()
@@ -133,22 +141,7 @@ def get_file_summary(file_path, online_mode=True):
         else:
             # Handle text files
             logger.debug(f"File is a text document: {file_path}")
-            text = ""
-            if file_path.lower().endswith('.pdf'):
-                logger.debug("Extracting text from PDF file")
-                with open(file_path, 'rb') as file:
-                    reader = PyPDF2.PdfReader(file)
-                    for page in reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text
-                            if len(text) >= 1000:
-                                text = text[:1000]
-                                break
-            else:  # .txt file
-                logger.debug("Reading text file")
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    text = file.read(1000)  # Read only the first 1000 characters
+            text = extract_text(file_path)
             
             if text:
                 prompt = """
@@ -221,13 +214,104 @@ Write your response a JSON object with the following schema:
         logger.error(f"Error processing {file_path}: {str(e)}", exc_info=True)
         return None
 
-def get_file_hash(file_path):
-    """Calculate SHA-256 hash of a file"""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+def batch_summary_chat(messages, max_tokens, online_mode=True):
+    """Send a batched summary (or other multi-file) request to OpenAI or the local LLM"""
+    if online_mode:
+        response = openai_client.chat.completions.create(
+            model="gpt-4-turbo-preview",
+            messages=messages,
+            temperature=0,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content
+    response = ollama_client.chat(
+        model='mistral',
+        messages=messages,
+        options={"temperature": 0, "num_predict": max_tokens}
+    )
+    return response['message']['content']
+
+def extract_texts(file_paths):
+    """Extract the text of several files at once; returns texts (or None) in file_paths order.
+
+    Runs as many extractions in parallel as the extraction pool has workers,
+    so PDFs are parsed concurrently instead of one after another.
+    """
+    def extract(file_path):
+        try:
+            return extract_text(file_path)
+        except Exception as e:
+            logger.error(f"Error processing {file_path}: {str(e)}", exc_info=True)
+            return None
+
+    if not file_paths:
+        return []
+    workers = min(get_extraction_pool().max_workers, len(file_paths))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extract') as executor:
+        return list(executor.map(extract, file_paths))
+
+def get_file_summaries_batched(file_paths, online_mode=True, token_budget=None, max_workers=None, progress_callback=None):
+    """Summarize files with multi-file requests packed by token budget.
+
+    Returns summaries in file_paths order. Images keep their per-file
+    summary and go through summarize_files like the non-batched path; text
+    is extracted concurrently before being packed into batches.
+    progress_callback, if given, is called as progress_callback(completed, total).
+    """
+    total = len(file_paths)
+    summaries = [None] * total
+    progress = {'completed': 0}
+    progress_lock = threading.Lock()
+
+    def advance(count):
+        with progress_lock:
+            progress['completed'] += count
+            completed = progress['completed']
+        if progress_callback:
+            progress_callback(completed, total)
+
+    image_indexes = [index for index, file_path in enumerate(file_paths) if is_image_file(file_path)]
+    text_indexes = [index for index, file_path in enumerate(file_paths) if not is_image_file(file_path)]
+    image_summaries = summarize_files(
+        [file_paths[index] for index in image_indexes],
+        get_file_summary,
+        online_mode=online_mode,
+        max_workers=max_workers,
+        progress_callback=lambda completed, image_total, file_path, summary: advance(1)
+    )
+    for index, summary in zip(image_indexes, image_summaries):
+        summaries[index] = summary
+    
+    items = []
+    texts = extract_texts([file_paths[index] for index in text_indexes])
+    for index, text in zip(text_indexes, texts):
+        if text:
+            items.append({"id": str(index), "file_path": file_paths[index], "content": text})
+        else:
+            logger.warning(f"No text extracted from file: {file_paths[index]}")
+            advance(1)
+    
+    batched_progress = {'completed': 0}
+
+    def report_batch(completed, batch_total):
+        advance(completed - batched_progress['completed'])
+        batched_progress['completed'] = completed
+
+    batched = summarize_texts_batched(
+        items,
+        lambda messages, max_tokens: batch_summary_chat(messages, max_tokens, online_mode=online_mode),
+        online_mode=online_mode,
+        token_budget=token_budget,
+        max_workers=max_workers,
+        progress_callback=report_batch
+    )
+    for item_id, summary in batched.items():
+        summaries[int(item_id)] = summary
+    return summaries
+
+def get_file_hash(file_path, stat_result=None):
+    """Calculate SHA-256 hash of a file, reusing the stored fingerprint if unchanged"""
+    return get_fingerprint_index().get_hash(file_path, stat_result)
 
 def generate_file_name(summary, max_length=30, online_mode=True):
     """Generate a very concise file name based on the file summary"""
@@ -283,9 +367,47 @@ def generate_file_name(summary, max_length=30, online_mode=True):
     
     return filename.strip('_')
 
-def generate_file_structure(file_summaries, online_mode=True):
-    """Generate a proposed file structure based on file summaries"""
+def generate_file_structure(file_summaries, online_mode=True, max_workers=None, structure_mode="auto"):
+    """Generate a proposed file structure based on file summaries.
+
+    Past MAP_REDUCE_THRESHOLD files (or with structure_mode="map_reduce")
+    the structure is built with structure_mapreduce.build_structure so no
+    single request has to hold every summary. structure_mode="cluster"
+    groups summary embeddings instead and only asks the LLM for names,
+    falling back to the "auto" choice when nothing could be embedded.
+    """
     logger.info(f"Using {'OpenAI' if online_mode else 'Local LLM'} for file structure generation")
+    if structure_mode == "cluster":
+        logger.info(f"Generating file structure by clustering {len(file_summaries)} files")
+        try:
+            files = cluster_structure(
+                file_summaries,
+                EmbeddingsGenerator(ollama_client, select_embedding_backend(ollama_client)),
+                lambda messages, max_tokens: batch_summary_chat(messages, max_tokens, online_mode),
+                relative_destination,
+                online_mode=online_mode,
+                max_workers=max_workers
+            )
+        except Exception as e:
+            logger.error(f"Error generating file structure: {str(e)}")
+            return None
+        if files is not None:
+            return files
+        logger.warning("Clustering failed; generating the file structure with the LLM instead")
+        structure_mode = "auto"
+    if structure_mode == "map_reduce" or (structure_mode == "auto" and len(file_summaries) > MAP_REDUCE_THRESHOLD):
+        logger.info(f"Generating file structure with map-reduce for {len(file_summaries)} files")
+        try:
+            return build_structure(
+                file_summaries,
+                lambda messages, max_tokens: batch_summary_chat(messages, max_tokens, online_mode),
+                relative_destination,
+                online_mode=online_mode,
+                max_workers=max_workers
+            )
+        except Exception as e:
+            logger.error(f"Error generating file structure: {str(e)}")
+            return None
     try:
         summaries_json = json.dumps(file_summaries, indent=2)
         
@@ -375,83 +497,100 @@ def display_file_structure(file_structure):
             else:
                 print(f"{prefix}├── 📄 {file_info['filename']}")
 
-def analyze_and_organize_files(directory, online_mode=True):
-    """Main function to analyze and organize files"""
+def analyze_and_organize_files(directory, online_mode=True, max_workers=None, batch_mode=False, token_budget=None, exclude_patterns=None, structure_mode="auto"):
+    """Main function to analyze and organize files
+
+    With batch_mode, text files are summarized several per request up to
+    token_budget (the summarizer.py default when None).
+    """
     logger.info(f"Starting file organization in {'online' if online_mode else 'offline'} mode")
     if not os.path.isdir(directory):
         logger.error(f"Directory does not exist: {directory}")
         return
     
-    # Initialize lists for files and their summaries
-    files_to_process = []
-    
-    # Walk through directory
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file.lower().endswith(('.pdf', '.txt')) or is_image_file(file_path):
-                files_to_process.append(file_path)
+    # Walk through directory, keeping each file's stat result
+    records = list_files(directory, exclude_patterns)
+    files_to_process = [record.path for record in records]
+    stat_results = {record.path: record.stat for record in records}
     
     # Check for duplicates
     logger.info("Checking for duplicate files...")
-    file_hashes = {}
-    duplicates = {}
-    
-    for file_path in files_to_process:
-        file_hash = get_file_hash(file_path)
-        if file_hash in file_hashes:
-            if file_hash not in duplicates:
-                duplicates[file_hash] = [file_hashes[file_hash]]
-            duplicates[file_hash].append(file_path)
-        else:
-            file_hashes[file_path] = file_path
+    duplicate_groups = find_duplicates(files_to_process, stat_results)
+    unique_files, copies = split_duplicates(files_to_process, duplicate_groups)
+    content_hashes = {}
+    for group in duplicate_groups:
+        logger.info(f"Duplicate files ({group['size']} bytes): {', '.join(group['files'])}")
+        for file_path in group['files']:
+            content_hashes[file_path] = group['hash']
     
-    # Load existing summaries from CSV if it exists
-    summaries_cache = {}
-    csv_path = os.path.join(os.getcwd(), "file_summaries_cache.csv")
-    if os.path.exists(csv_path):
-        try:
-            with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    summaries_cache[row['file_hash']] = {
-                        'summary': row['summary'],
-                        'file_path': row['file_path'],
-                        'last_modified': float(row['last_modified'])
-                    }
-            logger.info(f"Loaded {len(summaries_cache)} cached file summaries.")
-        except Exception as e:
-            logger.error(f"Error loading summaries cache: {str(e)}")
+    # Open the persistent summary store (imports the legacy CSV cache once)
+    summary_store = get_summary_store()
     
     # Analyze files
     logger.info("Starting file analysis")
     file_summaries = []
     new_or_updated_summaries = []
     
-    for file_path in files_to_process:
+    # Resolve cached summaries first so only uncached files hit the LLM
+    summaries = {}
+    uncached_files = []
+    file_info = {}
+    for file_path in unique_files:
         logger.info(f"Analyzing: {file_path}")
-        
-        file_hash = get_file_hash(file_path)
-        last_modified = os.path.getmtime(file_path)
-        
-        use_cached = False
-        if file_hash in summaries_cache:
-            cached_entry = summaries_cache[file_hash]
-            if float(cached_entry['last_modified']) >= last_modified:
-                summary = cached_entry['summary']
-                logger.info("Using cached summary")
-                use_cached = True
-        
-        if not use_cached:
-            summary = get_file_summary(file_path, online_mode)
-            if summary:
-                new_or_updated_summaries.append({
-                    'file_hash': file_hash,
-                    'file_path': file_path,
-                    'summary': summary,
-                    'last_modified': last_modified
-                })
-        
+        file_hash = content_hashes.get(file_path) or get_file_hash(file_path, stat_results[file_path])
+        file_info[file_path] = (file_hash, stat_results[file_path].st_mtime)
+    get_fingerprint_index().flush()
+    
+    cached_summaries = summary_store.get_many(
+        [file_hash for file_hash, _ in file_info.values()],
+        {file_hash: last_modified for file_hash, last_modified in file_info.values()}
+    )
+    logger.info(f"Found {len(cached_summaries)} cached file summaries.")
+    for file_path in unique_files:
+        file_hash, _ = file_info[file_path]
+        if file_hash in cached_summaries:
+            summaries[file_path] = cached_summaries[file_hash]
+            logger.info(f"Using cached summary for {file_path}")
+        else:
+            uncached_files.append(file_path)
+    
+    def report_progress(completed, total, file_path, summary):
+        logger.info(f"Summarized {completed}/{total}: {file_path}")
+        print(f"PROGRESS:{completed}/{total}")
+    
+    if batch_mode:
+        new_summaries = get_file_summaries_batched(
+            uncached_files,
+            online_mode,
+            token_budget=token_budget,
+            max_workers=max_workers,
+            progress_callback=lambda completed, total: print(f"PROGRESS:{completed}/{total}")
+        )
+    else:
+        new_summaries = summarize_files(
+            uncached_files,
+            get_file_summary,
+            online_mode=online_mode,
+            max_workers=max_workers,
+            progress_callback=report_progress
+        )
+    for file_path, summary in zip(uncached_files, new_summaries):
+        summaries[file_path] = summary
+        if summary:
+            file_hash, last_modified = file_info[file_path]
+            new_or_updated_summaries.append({
+                'file_hash': file_hash,
+                'file_path': file_path,
+                'summary': summary,
+                'last_modified': last_modified
+            })
+    
+    # Identical copies share the summary of their representative
+    for file_path, representative in copies.items():
+        summaries[file_path] = summaries.get(representative)
+    
+    for file_path in files_to_process:
+        summary = summaries.get(file_path)
         if summary:
             logger.info(f"Summary: {summary}")
             file_summaries.append({
@@ -459,28 +598,17 @@ def analyze_and_organize_files(directory, online_mode=True):
                 "summary": summary
             })
     
-    # Update the CSV cache
+    # Update the summary store in a single transaction
     if new_or_updated_summaries:
         try:
-            file_exists = os.path.exists(csv_path)
-            
-            with open(csv_path, 'a', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['file_hash', 'file_path', 'summary', 'last_modified']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                if not file_exists:
-                    writer.writeheader()
-                
-                for entry in new_or_updated_summaries:
-                    writer.writerow(entry)
-            
+            summary_store.put_many(new_or_updated_summaries)
             logger.info(f"Updated cache with {len(new_or_updated_summaries)} new or modified file summaries.")
         except Exception as e:
             logger.error(f"Error updating summaries cache: {str(e)}")
     
     # Generate file structure
     if file_summaries:
-        file_structure = generate_file_structure(file_summaries, online_mode)
+        file_structure = generate_file_structure(file_summaries, online_mode, max_workers, structure_mode)
         if file_structure:
             display_file_structure(file_structure)
             return file_structure
@@ -548,7 +676,15 @@ if __name__ == "__main__":
                 if not directory or not os.path.isdir(directory):
                     print("Error: Invalid directory path")
                     sys.exit(1)
-                result = analyze_and_organize_files(directory, online_mode)
+                result = analyze_and_organize_files(
+                    directory,
+                    online_mode,
+                    max_workers=config.get('concurrency'),
+                    batch_mode=config.get('batch_summaries', False),
+                    token_budget=config.get('batch_token_budget'),
+                    exclude_patterns=config.get('exclude_patterns'),
+                    structure_mode=config.get('structure_mode', 'auto')
+                )
                 print(json.dumps(result))
                 
             elif action == 'rename':
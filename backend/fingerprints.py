@@ -0,0 +1,152 @@
+import os
+import time
+import atexit
+import hashlib
+import threading
+import logging
+from summary_store import CACHE_DB_PATH, connect_cache_db
+
+logger = logging.getLogger('fingerprints')
+
+# Read size used when a file has to be hashed
+HASH_BUFFER_SIZE = 1024 * 1024
+# Pending fingerprints are written in batches of this size
+FLUSH_BATCH_SIZE = 256
+# Fingerprints of files not seen for this long are pruned
+MAX_AGE_DAYS = 180
+# Device number of rows keyed by path, for files without an inode number
+PATH_KEY_DEVICE = -1
+
+def hash_file(file_path, buffer_size=HASH_BUFFER_SIZE):
+    """Calculate the SHA-256 hash of a file using large reads"""
+    sha256_hash = hashlib.sha256()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            sha256_hash.update(view[:size])
+    return sha256_hash.hexdigest()
+
+def fingerprint_key(file_path, stat_result):
+    """(device, inode) row key of a file.
+
+    scandir results on Windows report st_ino and st_dev as 0, so those
+    files are stat'ed again, and if there is still no inode number they
+    are keyed by a hash of their absolute path instead.
+    """
+    if stat_result.st_ino:
+        return stat_result.st_dev, stat_result.st_ino
+    if file_path is not None:
+        try:
+            full_stat = os.stat(file_path)
+            if full_stat.st_ino:
+                return full_stat.st_dev, full_stat.st_ino
+        except OSError:
+            pass
+        digest = hashlib.blake2b(os.path.abspath(file_path).encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+        return PATH_KEY_DEVICE, int.from_bytes(digest, 'little') & 0x7FFFFFFFFFFFFFFF
+    raise ValueError("A file path is needed to fingerprint a file without an inode number")
+
+class FingerprintIndex:
+    """Persistent SHA-256 fingerprints keyed by (device, inode, size, mtime_ns).
+
+    A file whose stat signature matches the stored row is not read at all;
+    any change in size or mtime causes it to be re-hashed. Files without
+    an inode number are keyed by path (see fingerprint_key).
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.connection = connect_cache_db(db_path)
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    device INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    last_seen REAL NOT NULL,
+                    PRIMARY KEY (device, inode)
+                )
+            """)
+
+    def lookup(self, stat_result, file_path=None):
+        """Return the stored hash for a stat signature, or None"""
+        key = fingerprint_key(file_path, stat_result)
+        with self.lock:
+            pending = self.pending.get(key)
+            if pending is not None:
+                row = pending[2:5]
+            else:
+                row = self.connection.execute(
+                    "SELECT size, mtime_ns, sha256 FROM fingerprints WHERE device = ? AND inode = ?",
+                    key
+                ).fetchone()
+        if row and row[0] == stat_result.st_size and row[1] == stat_result.st_mtime_ns:
+            return row[2]
+        return None
+
+    def record(self, stat_result, sha256, file_path=None):
+        """Queue a fingerprint to be written with the next batch"""
+        key = fingerprint_key(file_path, stat_result)
+        with self.lock:
+            self.pending[key] = key + (stat_result.st_size, stat_result.st_mtime_ns, sha256, time.time())
+            should_flush = len(self.pending) >= FLUSH_BATCH_SIZE
+        if should_flush:
+            self.flush()
+
+    def get_hash(self, file_path, stat_result=None):
+        """Return the SHA-256 of a file, reading it only if its stat changed"""
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+        sha256 = self.lookup(stat_result, file_path)
+        if sha256 is not None:
+            return sha256
+        sha256 = hash_file(file_path)
+        self.record(stat_result, sha256, file_path)
+        return sha256
+
+    def flush(self):
+        """Write pending fingerprints in a single transaction"""
+        with self.lock:
+            rows = list(self.pending.values())
+            self.pending.clear()
+            if not rows:
+                return
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO fingerprints (device, inode, size, mtime_ns, sha256, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+
+    def prune(self, max_age_days=MAX_AGE_DAYS):
+        """Drop fingerprints for files that have not been hashed recently"""
+        cutoff = time.time() - max_age_days * 86400
+        with self.lock, self.connection:
+            return self.connection.execute(
+                "DELETE FROM fingerprints WHERE last_seen < ?", (cutoff,)
+            ).rowcount
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+def get_fingerprint_index():
+    """Return the process-wide fingerprint index, opening it on first use"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = FingerprintIndex()
+            _default_index.prune()
+            atexit.register(_default_index.flush)
+        return _default_index
@@ -2,42 +2,53 @@ import os
 import sys
 import json
 from pathlib import Path
-import PyPDF2
+from text_extraction import extract_text
 from ollama import Client
 from openai import OpenAI
 from PIL import Image
 import mimetypes
-import hashlib
-import csv
 import time
 import base64
+import threading
 from dotenv import load_dotenv
 import logging
+from fingerprints import get_fingerprint_index
+from pipeline import SummaryPipeline
+from structure_mapreduce import build_structure, nested_destination, MAP_REDUCE_THRESHOLD
+from cluster_organizer import cluster_structure
+from search import EmbeddingsGenerator, select_embedding_backend
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.StreamHandler(sys.stdout),  # Output to console
-        logging.FileHandler('initial_organize.log', mode='w')  # Output to file, overwrite each run
-    ]
-)
 logger = logging.getLogger('initial_organizer')
 
-# Add a handler to ensure we see all logs
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.DEBUG)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+def setup_logging():
+    """Log to stdout and to initial_organize.log (overwritten each run).
 
-# Set the root logger level to DEBUG
-logging.getLogger().setLevel(logging.DEBUG)
+    Called by the entry point (this script's __main__ or the backend
+    daemon), never at import: extraction workers are spawned and re-import
+    this module, and would otherwise truncate the parent's log file.
+    """
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.StreamHandler(sys.stdout),  # Output to console
+            logging.FileHandler('initial_organize.log', mode='w')  # Output to file, overwrite each run
+        ]
+    )
+
+    # Add a handler to ensure we see all logs
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.DEBUG)
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
+
+    # Set the root logger level to DEBUG
+    logging.getLogger().setLevel(logging.DEBUG)
 
 # Token and call limits
 TOKEN_LIMIT = 30000
@@ -46,9 +57,24 @@ total_tokens_used = 0
 total_api_calls = 0
 start_time = None
 last_update_time = None
+# Summaries run concurrently, so usage updates must be serialized
+usage_lock = threading.Lock()
+
+def reset_usage():
+    """Start a new token and call budget (the daemon calls this before every request)"""
+    global total_tokens_used, total_api_calls, start_time, last_update_time
+    with usage_lock:
+        total_tokens_used = 0
+        total_api_calls = 0
+        start_time = None
+        last_update_time = None
 
 def update_token_usage(tokens, operation_name):
     """Update token usage and check limits"""
+    with usage_lock:
+        return _update_token_usage(tokens, operation_name)
+
+def _update_token_usage(tokens, operation_name):
     global total_tokens_used, total_api_calls, start_time, last_update_time
     
     # Initialize timing if first call
@@ -133,6 +159,7 @@ Rules for organizing:
 3. Use consistent naming conventions with underscores
 4. Categories should be simple like: Academic, Research, Images, Documents, etc.
 5. Do not create deep nested folders
+6. Files that share the same "duplicate_group" number are identical copies; put them in the same category
 
 Please return your response as a JSON object matching the following schema:
 
@@ -354,28 +381,23 @@ def generate_file_name(summary, online_mode=False, max_length=30):
 
 def get_file_summary(file_path, online_mode=False):
     """Get summary for a single file using OpenAI or local models"""
-    online_mode = log_mode_usage("get_file_summary", online_mode)
     try:
         if is_image_file(file_path):
+            online_mode = log_mode_usage("get_file_summary", online_mode)
             return classify_image(file_path, online_mode=online_mode)
-        else:
-            text = ""
-            if file_path.lower().endswith('.pdf'):
-                with open(file_path, 'rb') as file:
-                    reader = PyPDF2.PdfReader(file)
-                    for page in reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text
-                            if len(text) >= 1000:
-                                text = text[:1000]
-                                break
-            else:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    text = file.read(1000)
-            
-            if text:
-                prompt = """
+        text = extract_text(file_path)
+        if not text:
+            return None
+        return summarize_text(file_path, text, online_mode=online_mode)
+    except Exception as e:
+        logger.error(f"Error processing {file_path}: {str(e)}")
+        return None
+
+def summarize_text(file_path, text, online_mode=False):
+    """Summarize text already extracted from a file"""
+    online_mode = log_mode_usage("get_file_summary", online_mode)
+    try:
+        prompt = """
 You will be provided with the contents of a file along with its metadata. Provide a summary of the contents. The purpose of the summary is to organize files based on their content. To this end provide a concise but informative summary. Make the summary as specific to the file as possible.
 
 Write your response a JSON object with the following schema:
@@ -387,103 +409,131 @@ Write your response a JSON object with the following schema:
 }
 ```
 """.strip()
-                
-                file_content = {
-                    "file_path": file_path,
-                    "content": text
-                }
-                
-                if online_mode:
-                    # Check limits before making API call
-                    if not update_token_usage(0, "get_file_summary_precheck"):
-                        logger.warning("Token or call limit reached, switching to offline mode")
-                        online_mode = False
-                        print("MODE_SWITCH:offline")
+        
+        file_content = {
+            "file_path": file_path,
+            "content": text
+        }
+        
+        if online_mode:
+            # Check limits before making API call
+            if not update_token_usage(0, "get_file_summary_precheck"):
+                logger.warning("Token or call limit reached, switching to offline mode")
+                online_mode = False
+                print("MODE_SWITCH:offline")
+            
+            if online_mode:
+                logger.info(f"Using OpenAI for file summary: {file_path}")
+                try:
+                    response = openai_client.responses.create(
+                        model="gpt-4-turbo-preview",
+                        input=[
+                            {"role": "system", "content": prompt},
+                            {"role": "user", "content": json.dumps(file_content)}
+                        ],
+                        temperature=0,
+                        max_tokens=256
+                    )
+                    response_content = response.output_text
                     
-                    if online_mode:
-                        logger.info(f"Using OpenAI for file summary: {file_path}")
-                        try:
-                            response = openai_client.responses.create(
-                                model="gpt-4-turbo-preview",
-                                input=[
-                                    {"role": "system", "content": prompt},
-                                    {"role": "user", "content": json.dumps(file_content)}
-                                ],
-                                temperature=0,
-                                max_tokens=256
-                            )
-                            response_content = response.output_text
-                            
-                            # Update token usage
-                            if hasattr(response, 'usage'):
-                                if not update_token_usage(response.usage.total_tokens, "get_file_summary"):
-                                    logger.warning("Token limit reached during file summary")
-                                    return None
-                        except Exception as e:
-                            logger.error(f"Error using OpenAI responses API: {str(e)}")
-                            # Fallback to chat completions if responses API fails
-                            response = openai_client.chat.completions.create(
-                                model="gpt-4-turbo-preview",
-                                messages=[
-                                    {"role": "system", "content": prompt},
-                                    {"role": "user", "content": json.dumps(file_content)}
-                                ],
-                                temperature=0,
-                                max_tokens=256
-                            )
-                            response_content = response.choices[0].message.content
-                            
-                            # Update token usage
-                            if hasattr(response, 'usage'):
-                                if not update_token_usage(response.usage.total_tokens, "get_file_summary_fallback"):
-                                    logger.warning("Token limit reached during file summary fallback")
-                                    return None
-                else:
-                    logger.info(f"Using Ollama for file summary: {file_path}")
-                    summary_response = ollama_client.chat(
-                        model='mistral',
+                    # Update token usage
+                    if hasattr(response, 'usage'):
+                        if not update_token_usage(response.usage.total_tokens, "get_file_summary"):
+                            logger.warning("Token limit reached during file summary")
+                            return None
+                except Exception as e:
+                    logger.error(f"Error using OpenAI responses API: {str(e)}")
+                    # Fallback to chat completions if responses API fails
+                    response = openai_client.chat.completions.create(
+                        model="gpt-4-turbo-preview",
                         messages=[
                             {"role": "system", "content": prompt},
                             {"role": "user", "content": json.dumps(file_content)}
                         ],
-                        options={"temperature": 0, "num_predict": 256}
+                        temperature=0,
+                        max_tokens=256
                     )
-                    response_content = summary_response['message']['content']
-                
-                try:
-                    json_start = response_content.find('{')
-                    json_end = response_content.rfind('}') + 1
-                    if json_start >= 0 and json_end > json_start:
-                        json_str = response_content[json_start:json_end]
-                        result = json.loads(json_str)
-                        logger.info(f"Summary: {result['summary']}")
-                        return result["summary"]
-                    else:
-                        logger.info(f"Summary: {response_content.strip()}")
-                        return response_content.strip()
-                except Exception as e:
-                    logger.error(f"Error parsing JSON response: {str(e)}")
-                    logger.info(f"Using raw response as summary: {response_content.strip()}")
-                    return response_content.strip()
+                    response_content = response.choices[0].message.content
+                    
+                    # Update token usage
+                    if hasattr(response, 'usage'):
+                        if not update_token_usage(response.usage.total_tokens, "get_file_summary_fallback"):
+                            logger.warning("Token limit reached during file summary fallback")
+                            return None
+        else:
+            logger.info(f"Using Ollama for file summary: {file_path}")
+            summary_response = ollama_client.chat(
+                model='mistral',
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": json.dumps(file_content)}
+                ],
+                options={"temperature": 0, "num_predict": 256}
+            )
+            response_content = summary_response['message']['content']
+        
+        try:
+            json_start = response_content.find('{')
+            json_end = response_content.rfind('}') + 1
+            if json_start >= 0 and json_end > json_start:
+                json_str = response_content[json_start:json_end]
+                result = json.loads(json_str)
+                logger.info(f"Summary: {result['summary']}")
+                return result["summary"]
             else:
-                return None
+                logger.info(f"Summary: {response_content.strip()}")
+                return response_content.strip()
+        except Exception as e:
+            logger.error(f"Error parsing JSON response: {str(e)}")
+            logger.info(f"Using raw response as summary: {response_content.strip()}")
+            return response_content.strip()
     except Exception as e:
         logger.error(f"Error processing {file_path}: {str(e)}")
         return None
 
-def get_file_hash(file_path):
-    """Calculate SHA-256 hash of a file"""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+def batch_summary_chat(messages, max_tokens, online_mode=False, operation_name="batch_summary"):
+    """Send a batched summary (or other multi-file) request to OpenAI or the local LLM"""
+    if online_mode and openai_client:
+        if update_token_usage(0, f"{operation_name}_precheck"):
+            response = openai_client.chat.completions.create(
+                model="gpt-4-turbo-preview",
+                messages=messages,
+                temperature=0,
+                max_tokens=max_tokens
+            )
+            if hasattr(response, 'usage'):
+                update_token_usage(response.usage.total_tokens, operation_name)
+            return response.choices[0].message.content
+        logger.warning("Token or call limit reached, switching to offline mode")
+        print("MODE_SWITCH:offline")
+    response = ollama_client.chat(
+        model='mistral',
+        messages=messages,
+        options={"temperature": 0, "num_predict": max_tokens}
+    )
+    return response['message']['content']
+
+def get_file_hash(file_path, stat_result=None):
+    """Calculate SHA-256 hash of a file, reusing the stored fingerprint if unchanged"""
+    return get_fingerprint_index().get_hash(file_path, stat_result)
 
 def print_separator():
     print("\n" + "=" * 80)
 
-def analyze_directory(directory_path, online_mode=False):
-    """Analyze the directory and return the file structure data"""
+def analyze_directory(directory_path, online_mode=False, max_workers=None, batch_mode=False, token_budget=None, exclude_patterns=None, structure_mode="auto"):
+    """Analyze the directory and return the file structure data.
+
+    max_workers caps the number of concurrent summary requests; when None
+    the per-provider default from summarizer.py is used. With batch_mode,
+    text files are summarized several per request up to token_budget.
+    exclude_patterns are gitignore-style patterns; None uses the scanner
+    defaults (node_modules, .git, caches). structure_mode is "single" for
+    one structure request, "map_reduce" for the chunked taxonomy mode in
+    structure_mapreduce.py, "cluster" to group summary embeddings and only
+    ask the LLM for folder names (cluster_organizer.py; falls back to "auto"
+    when no summary can be embedded), or "auto" to use map-reduce past
+    MAP_REDUCE_THRESHOLD files.
+    """
     online_mode = log_mode_usage("analyze_directory", online_mode)
     logger.info(f"Starting directory analysis in {'ONLINE' if online_mode else 'OFFLINE'} mode")
     
@@ -526,27 +576,53 @@ def analyze_directory(directory_path, online_mode=False):
         logger.info("🖥️ OFFLINE MODE: Using Local LLM (Ollama) for file analysis and organization")
         print("🖥️ OFFLINE MODE: Using Local LLM (Ollama) for file analysis and organization")
     
-    files_to_process = []
+    def report_progress(completed, total, file_path, summary):
+        print(f"\nAnalyzed: {file_path}")
+        if summary:
+            print(f"Summary: {summary}")
+        print(f"PROGRESS:{completed}/{total}")
+    
+    batch_chat_fn = None
+    if batch_mode:
+        batch_chat_fn = lambda messages, max_tokens: batch_summary_chat(messages, max_tokens, online_mode=online_mode)
     
-    for root, _, files in os.walk(directory_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file.lower().endswith(('.pdf', '.txt')) or is_image_file(file_path):
-                files_to_process.append(file_path)
+    # Scanning, hashing, extraction and summaries overlap in a staged pipeline;
+    # cached content and identical copies never reach the LLM
+    print("GENERATING FILE SUMMARIES:")
+    pipeline = SummaryPipeline(
+        summarize_text,
+        lambda file_path, mode: classify_image(file_path, online_mode=mode),
+        is_image_file,
+        online_mode=online_mode,
+        max_workers=max_workers,
+        batch_chat_fn=batch_chat_fn,
+        token_budget=token_budget,
+        progress_callback=report_progress
+    )
+    pipeline_result = pipeline.run(directory_path, exclude_patterns)
+    files_to_process = pipeline_result["files"]
+    summaries = pipeline_result["summaries"]
+    duplicate_groups = pipeline_result["duplicates"]
     
     print_separator()
     logger.info(f"Found {len(files_to_process)} files to process")
     print(f"Found {len(files_to_process)} files to process")
+    for stage in pipeline_result["stats"]:
+        print(f"Stage {stage['stage']}: {stage['items']} files, {stage['items_per_second']} files/s")
     print_separator()
     
-    file_summaries = []
+    duplicate_group_ids = {}
+    for group_id, group in enumerate(duplicate_groups):
+        for file_path in group["files"]:
+            duplicate_group_ids[file_path] = group_id
+    if duplicate_groups:
+        copies = sum(len(group["files"]) - 1 for group in duplicate_groups)
+        logger.info(f"Found {copies} duplicate copies in {len(duplicate_groups)} groups")
     
-    print("GENERATING FILE SUMMARIES:")
+    file_summaries = []
     for file_path in files_to_process:
-        print(f"\nAnalyzing: {file_path}")
-        summary = get_file_summary(file_path, online_mode=online_mode)
+        summary = summaries.get(file_path)
         if summary:
-            print(f"Summary: {summary}")
             file_summaries.append({
                 "file_path": file_path,
                 "summary": summary
@@ -555,10 +631,57 @@ def analyze_directory(directory_path, online_mode=False):
     if file_summaries:
         formatted_input = []
         for summary in file_summaries:
-            formatted_input.append({
+            entry = {
                 "file_path": summary["file_path"],
                 "summary": summary["summary"]
-            })
+            }
+            if summary["file_path"] in duplicate_group_ids:
+                entry["duplicate_group"] = duplicate_group_ids[summary["file_path"]]
+            formatted_input.append(entry)
+        
+        structure_chat = lambda messages, max_tokens: batch_summary_chat(
+            messages, max_tokens, online_mode=online_mode, operation_name="file_structure"
+        )
+        if structure_mode == "cluster":
+            # Embeddings decide the grouping; the LLM only names each folder
+            print_separator()
+            print(f"GENERATING FILE STRUCTURE BY CLUSTERING {len(formatted_input)} FILES")
+            print_separator()
+            files = cluster_structure(
+                formatted_input,
+                EmbeddingsGenerator(ollama_client, select_embedding_backend(ollama_client)),
+                structure_chat,
+                nested_destination,
+                online_mode=online_mode,
+                max_workers=max_workers
+            )
+            if files is not None:
+                logger.info(f"Successfully generated file structure with {len(files)} files")
+                print(f"\nSuccessfully generated file structure with {len(files)} files")
+                return json.dumps({"files": files, "duplicates": duplicate_groups}, indent=2)
+            # Nothing could be embedded: build the structure as "auto" would
+            logger.warning("Clustering failed; generating the file structure with the LLM instead")
+            structure_mode = "auto"
+        
+        use_map_reduce = structure_mode == "map_reduce" or (
+            structure_mode == "auto" and len(formatted_input) > MAP_REDUCE_THRESHOLD
+        )
+        if use_map_reduce:
+            # One prompt cannot hold this many summaries; build the plan from
+            # a shared taxonomy with requests of bounded size instead
+            print_separator()
+            print(f"GENERATING FILE STRUCTURE WITH MAP-REDUCE FOR {len(formatted_input)} FILES")
+            print_separator()
+            files = build_structure(
+                formatted_input,
+                structure_chat,
+                nested_destination,
+                online_mode=online_mode,
+                max_workers=max_workers
+            )
+            logger.info(f"Successfully generated file structure with {len(files)} files")
+            print(f"\nSuccessfully generated file structure with {len(files)} files")
+            return json.dumps({"files": files, "duplicates": duplicate_groups}, indent=2)
         
         print_separator()
         print("SENDING TO LLM:")
@@ -664,6 +787,7 @@ def analyze_directory(directory_path, online_mode=False):
             if "files" in result and isinstance(result["files"], list):
                 logger.info(f"Successfully generated file structure with {len(result['files'])} files")
                 print(f"\nSuccessfully generated file structure with {len(result['files'])} files")
+                result["duplicates"] = duplicate_groups
                 return json.dumps(result, indent=2)
             else:
                 logger.error("Invalid structure in LLM response - missing 'files' array")
@@ -681,6 +805,7 @@ def analyze_directory(directory_path, online_mode=False):
     return json.dumps({"files": []})
 
 if __name__ == "__main__":
+    setup_logging()
     # Test logging
     logger.debug("Debug test message")
     logger.info("Info test message")
@@ -699,6 +824,11 @@ if __name__ == "__main__":
             config = json.load(config_file)
             directory = config.get('directory')
             online_mode = config.get('online_mode', True)  # Default to online mode if not specified
+            max_workers = config.get('concurrency')  # Optional cap on concurrent summary requests
+            batch_mode = config.get('batch_summaries', False)  # Pack several files into each summary request
+            token_budget = config.get('batch_token_budget')
+            exclude_patterns = config.get('exclude_patterns')
+            structure_mode = config.get('structure_mode', 'auto')  # single, map_reduce, cluster or auto
             
             # Debug the configuration that's being received
             logger.debug("="*50)
@@ -726,7 +856,15 @@ if __name__ == "__main__":
                 
             # Make sure we pass online_mode explicitly
             logger.info(f"📣 Explicitly passing online_mode={online_mode} to analyze_directory")
-            result = analyze_directory(directory, online_mode=online_mode)
+            result = analyze_directory(
+                directory,
+                online_mode=online_mode,
+                max_workers=max_workers,
+                batch_mode=batch_mode,
+                token_budget=token_budget,
+                exclude_patterns=exclude_patterns,
+                structure_mode=structure_mode
+            )
             print(result)
             
     except Exception as e:
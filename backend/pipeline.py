@@ -0,0 +1,431 @@
+import json
+import time
+import queue
+import asyncio
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from scanner import scan_directory
+from fingerprints import get_fingerprint_index
+from summary_store import get_summary_store
+from text_extraction import extract_text, get_extraction_pool
+from summarizer import (
+    get_concurrency_limit, get_provider, estimate_tokens, summarize_batch_with_retry,
+    DEFAULT_BATCH_TOKEN_BUDGET, MAX_BATCH_SIZE, BATCH_TOKENS_PER_SUMMARY, BATCH_SUMMARY_PROMPT
+)
+
+logger = logging.getLogger('pipeline')
+
+# Capacity of the queues between stages; a full queue blocks the stage feeding it
+DEFAULT_QUEUE_SIZE = 64
+# Threads hashing files; hashing is mostly disk reads
+DEFAULT_HASH_WORKERS = 4
+# A partly filled summary batch is sent once no new text arrives for this long
+BATCH_FLUSH_SECONDS = 0.5
+
+# Marks the end of a stage's output
+END = object()
+
+class StageStats:
+    """Item count and timing for one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def record(self, seconds, items=1):
+        with self.lock:
+            self.items += items
+            self.busy_seconds += seconds
+
+    def start(self):
+        with self.lock:
+            if self.started is None:
+                self.started = time.time()
+
+    def finish(self):
+        with self.lock:
+            self.finished = time.time()
+
+    def as_dict(self):
+        elapsed = 0.0
+        if self.started is not None:
+            elapsed = (self.finished or time.time()) - self.started
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "elapsed_seconds": round(elapsed, 3),
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+class SummaryPipeline:
+    """Streaming scan -> fingerprint -> extract -> summarize pipeline.
+
+    Stages are connected by bounded queues, so a slow stage holds back the
+    ones before it instead of letting work pile up in memory. Fingerprinting
+    runs on a few threads, PDF extraction in the extraction process pool
+    (see text_extraction.ExtractionPool) and LLM calls
+    on an asyncio loop limited to the provider's concurrency.
+
+    summarize_text_fn is called as summarize_text_fn(file_path, text, online_mode)
+    and summarize_image_fn as summarize_image_fn(file_path, online_mode).
+    When batch_chat_fn is given, text files are summarized several per
+    request with summarizer.summarize_batch_with_retry instead.
+    progress_callback, if given, is called as
+    progress_callback(completed, discovered, file_path, summary).
+    """
+
+    def __init__(self, summarize_text_fn, summarize_image_fn, is_image_fn, online_mode=False,
+                 max_workers=None, batch_chat_fn=None, token_budget=None,
+                 hash_workers=DEFAULT_HASH_WORKERS, extract_workers=None,
+                 queue_size=DEFAULT_QUEUE_SIZE, progress_callback=None,
+                 summary_store=None, fingerprint_index=None):
+        self.summarize_text_fn = summarize_text_fn
+        self.summarize_image_fn = summarize_image_fn
+        self.is_image_fn = is_image_fn
+        self.online_mode = online_mode
+        self.max_workers = max_workers
+        self.batch_chat_fn = batch_chat_fn
+        self.token_budget = token_budget or DEFAULT_BATCH_TOKEN_BUDGET
+        self.hash_workers = max(1, hash_workers)
+        self.extract_workers = max(1, extract_workers or get_extraction_pool().max_workers)
+        self.queue_size = queue_size
+        self.progress_callback = progress_callback
+        self.summary_store = summary_store
+        self.fingerprint_index = fingerprint_index
+
+    def run(self, directory, exclude_patterns=None):
+        """Run the pipeline over a directory.
+
+        Returns {"files": sorted paths, "summaries": {path: summary},
+        "duplicates": duplicate groups, "stats": per-stage stats}. Each
+        distinct content is summarized once and its summary shared with
+        identical copies.
+        """
+        self.summary_store = self.summary_store or get_summary_store()
+        self.fingerprint_index = self.fingerprint_index or get_fingerprint_index()
+        self.lock = threading.Lock()
+        self.aborted = threading.Event()
+        self.error = None
+        self.discovered = 0
+        self.completed = 0
+        self.stat_results = {}
+        self.hashes = {}
+        self.representatives = {}
+        self.summaries = {}
+        self.new_entries = []
+        self.stats = {name: StageStats(name) for name in ('scan', 'fingerprint', 'extract', 'summarize')}
+
+        scanned = queue.Queue(maxsize=self.queue_size)
+        fingerprinted = queue.Queue(maxsize=self.queue_size)
+        extracted = queue.Queue(maxsize=self.queue_size)
+
+        logger.info(f"Starting pipeline over {directory} with {self.hash_workers} hash threads, "
+                    f"{self.extract_workers} extraction threads and "
+                    f"{get_concurrency_limit(self.online_mode, self.max_workers)} concurrent {get_provider(self.online_mode)} requests")
+
+        scan_thread = threading.Thread(target=self.scan_stage, args=(directory, exclude_patterns, scanned),
+                                       name='pipeline-scan', daemon=True)
+        summarize_thread = threading.Thread(target=self.summarize_stage, args=(extracted,),
+                                            name='pipeline-summarize', daemon=True)
+        scan_thread.start()
+        threads = [scan_thread]
+        threads += self.start_stage('fingerprint', self.hash_workers, scanned, fingerprinted, self.fingerprint)
+        threads += self.start_stage('extract', self.extract_workers, fingerprinted, extracted, self.extract)
+        summarize_thread.start()
+        threads.append(summarize_thread)
+        for thread in threads:
+            thread.join()
+
+        self.fingerprint_index.flush()
+        if self.error is not None:
+            raise self.error
+
+        if self.new_entries:
+            try:
+                self.summary_store.put_many(self.new_entries)
+            except Exception as e:
+                logger.error(f"Error updating summaries cache: {str(e)}")
+
+        files = sorted(self.stat_results)
+        groups = {}
+        for file_path in files:
+            file_hash = self.hashes.get(file_path)
+            if file_hash is not None:
+                groups.setdefault(file_hash, []).append(file_path)
+        duplicate_groups = []
+        for file_hash, paths in groups.items():
+            if len(paths) < 2:
+                continue
+            duplicate_groups.append({"hash": file_hash, "size": self.stat_results[paths[0]].st_size, "files": paths})
+            # Fan the representative's summary out to the identical copies
+            summary = self.summaries.get(self.representatives[file_hash])
+            for file_path in paths:
+                if summary and file_path not in self.summaries:
+                    self.summaries[file_path] = summary
+        duplicate_groups.sort(key=lambda group: group["files"][0])
+
+        stats = [self.stats[name].as_dict() for name in self.stats]
+        for stage in stats:
+            logger.info(f"Stage {stage['stage']}: {stage['items']} items in {stage['elapsed_seconds']}s "
+                        f"({stage['items_per_second']}/s, busy {stage['busy_seconds']}s)")
+        return {
+            "files": files,
+            "summaries": self.summaries,
+            "duplicates": duplicate_groups,
+            "stats": stats
+        }
+
+    def abort(self, error):
+        """Stop every stage after an unexpected failure"""
+        logger.error(f"Pipeline failed: {str(error)}")
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.aborted.set()
+
+    def put(self, target, item):
+        """Put onto a bounded queue, waiting while it is full unless the run was aborted"""
+        while not self.aborted.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, source):
+        while not self.aborted.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return END
+
+    def complete(self, file_path, summary, new_entry=None):
+        """Record the outcome for one file and report progress"""
+        with self.lock:
+            if summary:
+                self.summaries[file_path] = summary
+            if new_entry:
+                self.new_entries.append(new_entry)
+            self.completed += 1
+            completed, discovered = self.completed, self.discovered
+            if self.progress_callback:
+                try:
+                    self.progress_callback(completed, discovered, file_path, summary)
+                except Exception as e:
+                    logger.error(f"Error in progress callback: {str(e)}")
+
+    def scan_stage(self, directory, exclude_patterns, output_queue):
+        stats = self.stats['scan']
+        stats.start()
+        records = scan_directory(directory, exclude_patterns)
+        try:
+            started = time.time()
+            for record in records:
+                with self.lock:
+                    self.discovered += 1
+                    self.stat_results[record.path] = record.stat
+                stats.record(time.time() - started)
+                if not self.put(output_queue, {"path": record.path, "stat": record.stat}):
+                    break
+                started = time.time()
+        except Exception as e:
+            self.abort(e)
+        finally:
+            records.close()
+            stats.finish()
+            self.put(output_queue, END)
+
+    def start_stage(self, name, workers, input_queue, output_queue, handle):
+        """Start worker threads that call handle(item, output_queue) for each item.
+
+        The last worker to see END passes it on to the next stage.
+        """
+        stats = self.stats[name]
+        remaining = {'workers': workers}
+
+        def work():
+            stats.start()
+            try:
+                while True:
+                    item = self.get(input_queue)
+                    if item is END:
+                        # Leave the marker in place for the sibling workers
+                        self.put(input_queue, END)
+                        break
+                    started = time.time()
+                    try:
+                        handle(item, output_queue)
+                    except Exception as e:
+                        logger.error(f"Error in {name} stage for {item['path']}: {str(e)}")
+                        self.complete(item['path'], None)
+                    stats.record(time.time() - started)
+            except Exception as e:
+                self.abort(e)
+            finally:
+                with self.lock:
+                    remaining['workers'] -= 1
+                    last = remaining['workers'] == 0
+                if last:
+                    stats.finish()
+                    self.put(output_queue, END)
+
+        threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=work, name=f"pipeline-{name}-{index}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def fingerprint(self, item, output_queue):
+        """Hash a file, skip copies of content already seen and serve cached summaries"""
+        file_path = item['path']
+        file_hash = self.fingerprint_index.get_hash(file_path, item['stat'])
+        item['hash'] = file_hash
+        with self.lock:
+            self.hashes[file_path] = file_hash
+            representative = self.representatives.setdefault(file_hash, file_path)
+        if representative != file_path:
+            # The summary is copied over from the representative at the end
+            self.complete(file_path, None)
+            return
+        cached = self.summary_store.get(file_hash, item['stat'].st_mtime)
+        if cached:
+            self.complete(file_path, cached)
+            return
+        self.put(output_queue, item)
+
+    def extract(self, item, output_queue):
+        """Extract text (PDFs are parsed by the extraction pool); images pass straight through"""
+        file_path = item['path']
+        if self.is_image_fn(file_path):
+            self.put(output_queue, item)
+            return
+        text = extract_text(file_path)
+        if not text:
+            self.complete(file_path, None)
+            return
+        item['text'] = text
+        self.put(output_queue, item)
+
+    def summary_entry(self, item, summary):
+        if not summary:
+            return None
+        return {
+            'file_hash': item['hash'],
+            'file_path': item['path'],
+            'summary': summary,
+            'last_modified': item['stat'].st_mtime
+        }
+
+    def summarize_stage(self, input_queue):
+        stats = self.stats['summarize']
+        stats.start()
+        try:
+            asyncio.run(self.summarize_async(input_queue))
+        except Exception as e:
+            self.abort(e)
+        finally:
+            stats.finish()
+
+    async def summarize_async(self, input_queue):
+        """Issue LLM calls from an event loop, bounded by the provider limit.
+
+        The clients are synchronous, so each call runs on a worker thread;
+        the loop only decides how many are in flight. Items are taken off
+        the queue only when there is room for them, which keeps the
+        earlier stages throttled to the speed of the LLM.
+        """
+        loop = asyncio.get_running_loop()
+        stats = self.stats['summarize']
+        limit = get_concurrency_limit(self.online_mode, self.max_workers)
+        executor = ThreadPoolExecutor(max_workers=limit + 1, thread_name_prefix='pipeline-summarize')
+        requests = asyncio.Semaphore(limit)
+        slots = asyncio.Semaphore(limit * (MAX_BATCH_SIZE if self.batch_chat_fn else 2))
+        tasks = set()
+        batch = []
+        batch_tokens = estimate_tokens(BATCH_SUMMARY_PROMPT)
+
+        async def call(items, fn, *args):
+            async with requests:
+                started = time.time()
+                try:
+                    return await loop.run_in_executor(executor, fn, *args)
+                finally:
+                    stats.record(time.time() - started, items)
+
+        async def summarize_one(item):
+            try:
+                if 'text' in item:
+                    summary = await call(1, self.summarize_text_fn, item['path'], item['text'], self.online_mode)
+                else:
+                    summary = await call(1, self.summarize_image_fn, item['path'], self.online_mode)
+            except Exception as e:
+                logger.error(f"Error summarizing {item['path']}: {str(e)}")
+                summary = None
+            self.complete(item['path'], summary, self.summary_entry(item, summary))
+            slots.release()
+
+        async def summarize_many(items):
+            by_id = {str(index): item for index, item in enumerate(items)}
+            requests_batch = [
+                {"id": item_id, "file_path": item['path'], "content": item['text']}
+                for item_id, item in by_id.items()
+            ]
+            try:
+                summaries = await call(len(items), summarize_batch_with_retry, requests_batch, self.batch_chat_fn)
+            except Exception as e:
+                logger.error(f"Batched summary request for {len(items)} files failed: {str(e)}")
+                summaries = {}
+            for item_id, item in by_id.items():
+                summary = summaries.get(item_id)
+                self.complete(item['path'], summary, self.summary_entry(item, summary))
+                slots.release()
+
+        def spawn(coroutine):
+            task = asyncio.ensure_future(coroutine)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        def flush():
+            nonlocal batch, batch_tokens
+            if batch:
+                spawn(summarize_many(batch))
+            batch = []
+            batch_tokens = estimate_tokens(BATCH_SUMMARY_PROMPT)
+
+        try:
+            while not self.aborted.is_set():
+                await slots.acquire()
+                try:
+                    item = await loop.run_in_executor(executor, input_queue.get, True, BATCH_FLUSH_SECONDS)
+                except queue.Empty:
+                    slots.release()
+                    flush()
+                    continue
+                if item is END:
+                    slots.release()
+                    break
+                if not self.batch_chat_fn or 'text' not in item:
+                    spawn(summarize_one(item))
+                    continue
+                item_tokens = estimate_tokens(json.dumps({"id": "0", "file_path": item['path'], "content": item['text']}))
+                item_tokens += BATCH_TOKENS_PER_SUMMARY
+                if batch and batch_tokens + item_tokens > self.token_budget:
+                    flush()
+                batch.append(item)
+                batch_tokens += item_tokens
+                if len(batch) >= MAX_BATCH_SIZE:
+                    flush()
+            flush()
+            while tasks:
+                await asyncio.gather(*list(tasks))
+        finally:
+            executor.shutdown(wait=True)
@@ -6,7 +6,9 @@ import logging
 from openai import OpenAI
 from ollama import Client
 from dotenv import load_dotenv
-from file_organizer import get_file_summary, generate_file_name
+from file_organizer import get_file_summary, generate_file_name, get_file_hash
+from summary_store import get_summary_store
+from duplicates import find_duplicates, split_duplicates
 import base64
 from PIL import Image
 
@@ -178,6 +180,14 @@ def generate_filenames(files, online_mode=True):
         logger.info(f"Starting filename generation in {'online' if online_mode else 'offline'} mode")
         logger.info(f"Processing {len(files)} files")
         
+        summary_store = get_summary_store()
+        
+        # Identical files only need one summary and one generated name
+        file_paths = [file['path'] for file in files if os.path.isfile(file['path'])]
+        duplicate_groups = find_duplicates(file_paths)
+        _, copies = split_duplicates(file_paths, duplicate_groups)
+        generated_bases = {}
+        
         generated_names = {}
         for file in files:
             file_path = file['path']
@@ -185,8 +195,26 @@ def generate_filenames(files, online_mode=True):
             
             logger.info(f"Processing file: {file_path}")
             
+            representative = copies.get(file_path)
+            if representative in generated_bases:
+                logger.info(f"Identical to {representative}, reusing its generated name")
+                generated_names[file['name']] = f"{generated_bases[representative]}{extension}"
+                continue
+            
+            try:
+                file_hash = get_file_hash(file_path)
+                last_modified = os.path.getmtime(file_path)
+                summary = summary_store.get(file_hash, last_modified)
+            except Exception as e:
+                logger.error(f"Error looking up cached summary for {file_path}: {str(e)}")
+                file_hash = None
+                summary = None
+            
+            cached = summary is not None
+            if cached:
+                logger.info("Using cached summary")
             # For images, use appropriate model based on mode
-            if is_image_file(file_path):
+            elif is_image_file(file_path):
                 if online_mode:
                     logger.info("Using OpenAI Vision for image analysis")
                     summary = analyze_image_with_openai(file_path)
@@ -208,6 +236,9 @@ def generate_filenames(files, online_mode=True):
                 logger.warning(f"No summary found for {file['name']}, skipping")
                 continue
             
+            if file_hash and not cached:
+                summary_store.put(file_hash, file_path, summary, last_modified)
+            
             logger.info(f"Generated summary: {summary}")
             
             # Generate new filename using the function from file_organizer.py
@@ -219,11 +250,13 @@ def generate_filenames(files, online_mode=True):
             
             logger.info(f"Generated new base name: {new_base}")
             generated_names[file['name']] = f"{new_base}{extension}"
+            generated_bases[file_path] = new_base
             
         logger.info(f"Successfully generated names for {len(generated_names)} files")
         return {
             "success": True,
-            "generated_names": generated_names
+            "generated_names": generated_names,
+            "duplicates": duplicate_groups
         }
         
     except Exception as e:
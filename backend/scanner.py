@@ -0,0 +1,202 @@
+import os
+import re
+import queue
+import threading
+import mimetypes
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('scanner')
+
+# Directories and files skipped unless the caller passes its own patterns
+DEFAULT_EXCLUDES = [
+    '.git/',
+    '.svn/',
+    '.hg/',
+    'node_modules/',
+    '__pycache__/',
+    '.cache/',
+    '.venv/',
+    'venv/',
+    '.Trash/',
+    '.Trashes/',
+    '.DS_Store',
+    '*.tmp',
+    '~$*'
+]
+
+DEFAULT_SCAN_WORKERS = 8
+
+mimetypes.init()
+IMAGE_EXTENSIONS = frozenset(
+    extension for extension, mime_type in mimetypes.types_map.items() if mime_type.startswith('image/')
+)
+SUPPORTED_EXTENSIONS = frozenset({'.pdf', '.txt'}) | IMAGE_EXTENSIONS
+
+FileRecord = namedtuple('FileRecord', ['path', 'name', 'size', 'mtime_ns', 'stat'])
+
+def is_supported_file(name):
+    """Check whether a file name has an extension the organizers can summarize"""
+    return os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS
+
+def glob_to_regex(pattern):
+    """Translate a gitignore-style glob (*, **, ?, [...]) into a regex string"""
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                regex += '[' + pattern[i + 1:end].replace('\\', '\\\\') + ']'
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+class ExcludeRules:
+    """A set of gitignore-style exclude patterns compiled into single regexes.
+
+    Patterns without a slash match a name at any depth, patterns with a
+    slash are anchored at the scan root, and a trailing slash restricts a
+    pattern to directories. Negation (!) is not supported.
+    """
+
+    def __init__(self, patterns):
+        any_type = {'name': [], 'path': []}
+        dirs_only = {'name': [], 'path': []}
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            target = any_type
+            if pattern.endswith('/'):
+                target = dirs_only
+                pattern = pattern.rstrip('/')
+            if '/' in pattern:
+                target['path'].append(glob_to_regex(pattern.lstrip('/')))
+            else:
+                target['name'].append(glob_to_regex(pattern))
+        self.any_name = self.compile(any_type['name'])
+        self.any_path = self.compile(any_type['path'])
+        self.dir_name = self.compile(dirs_only['name'])
+        self.dir_path = self.compile(dirs_only['path'])
+
+    @staticmethod
+    def compile(regexes):
+        if not regexes:
+            return None
+        return re.compile('(?:' + '|'.join(regexes) + r')\Z')
+
+    def excludes(self, relative_path, name, is_dir):
+        """Check whether an entry is excluded; relative_path uses '/' separators"""
+        if self.any_name is not None and self.any_name.match(name):
+            return True
+        if self.any_path is not None and self.any_path.match(relative_path):
+            return True
+        if is_dir:
+            if self.dir_name is not None and self.dir_name.match(name):
+                return True
+            if self.dir_path is not None and self.dir_path.match(relative_path):
+                return True
+        return False
+
+def scan_directory(directory, exclude_patterns=None, file_filter=is_supported_file, max_workers=DEFAULT_SCAN_WORKERS):
+    """Yield FileRecords for files under directory as they are found.
+
+    Subdirectories are listed in parallel with os.scandir and the stat
+    result of each entry is kept on the record so later stages do not
+    stat the file again. Records are yielded in no particular order.
+    """
+    rules = ExcludeRules(DEFAULT_EXCLUDES if exclude_patterns is None else exclude_patterns)
+    root = os.path.abspath(directory)
+    results = queue.Queue(maxsize=256)
+    done = object()
+    state = {'pending': 0}
+    state_lock = threading.Lock()
+    stopped = threading.Event()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='scanner')
+
+    def submit(path, relative_path):
+        with state_lock:
+            state['pending'] += 1
+        executor.submit(scan_one, path, relative_path)
+
+    def emit(item):
+        # Block while the consumer is behind, but give up once it has stopped
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def scan_one(path, relative_path):
+        # relative_path is the directory below the root with a trailing '/'.
+        # Records are handed over one directory at a time to keep queue traffic low
+        records = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if stopped.is_set():
+                        break
+                    name = entry.name
+                    entry_relative = relative_path + name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not rules.excludes(entry_relative, name, True):
+                                submit(entry.path, entry_relative + '/')
+                        elif entry.is_file():
+                            if file_filter and not file_filter(name):
+                                continue
+                            if rules.excludes(entry_relative, name, False):
+                                continue
+                            stat_result = entry.stat()
+                            records.append(FileRecord(entry.path, name, stat_result.st_size,
+                                                      stat_result.st_mtime_ns, stat_result))
+                    except OSError as e:
+                        logger.error(f"Error reading {entry.path}: {str(e)}")
+        except OSError as e:
+            logger.error(f"Error scanning directory {path}: {str(e)}")
+        finally:
+            if records:
+                emit(records)
+            with state_lock:
+                state['pending'] -= 1
+                finished = state['pending'] == 0
+            if finished:
+                emit(done)
+
+    try:
+        submit(root, '')
+        while True:
+            records = results.get()
+            if records is done:
+                break
+            yield from records
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def list_files(directory, exclude_patterns=None, file_filter=is_supported_file, max_workers=DEFAULT_SCAN_WORKERS):
+    """Scan a directory and return its FileRecords sorted by path"""
+    records = list(scan_directory(directory, exclude_patterns, file_filter, max_workers))
+    records.sort(key=lambda record: record.path)
+    return records
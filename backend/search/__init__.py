@@ -1,5 +1,23 @@
-from .search_manager import SearchManager
-from .embeddings import EmbeddingsGenerator
+from .search_manager import SearchManager, select_embedding_backend
+from .embeddings import EmbeddingsGenerator, EmbeddingBackend, OllamaEmbeddingBackend, OpenAIEmbeddingBackend
+from .hashing_embedder import HashingEmbeddingBackend
+from .embedding_cache import EmbeddingCache
 from .faiss_index import FaissIndexManager
+from .lexical_index import LexicalIndex
+from .metadata_store import MetadataStore
+from .chunking import ChunkIndex
 
-__all__ = ['SearchManager', 'EmbeddingsGenerator', 'FaissIndexManager'] 
\ No newline at end of file
+__all__ = [
+    'SearchManager',
+    'select_embedding_backend',
+    'EmbeddingsGenerator',
+    'EmbeddingBackend',
+    'OllamaEmbeddingBackend',
+    'OpenAIEmbeddingBackend',
+    'HashingEmbeddingBackend',
+    'EmbeddingCache',
+    'FaissIndexManager',
+    'LexicalIndex',
+    'MetadataStore',
+    'ChunkIndex'
+] 
\ No newline at end of file
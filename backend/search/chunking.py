@@ -0,0 +1,440 @@
+import os
+import re
+import json
+import zlib
+import atexit
+import threading
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .faiss_index import FaissIndexManager, path_id, similarity
+from .path_mapping import PathMapping, mapping_files
+
+# Chunks are at most this long (about 300 tokens) and, unless the text
+# ends first, at least MIN_CHUNK_CHARS
+MAX_CHUNK_CHARS = 1200
+MIN_CHUNK_CHARS = 300
+# A unit whose hash is divisible by this ends a chunk, so boundaries follow
+# the content and an edit only changes the chunks around it
+BOUNDARY_DIVISOR = 3
+# Chunk hits fetched per requested file, so files with several matching
+# chunks can be aggregated
+CHUNK_FETCH_FACTOR = 8
+CHUNK_AGGREGATIONS = ('max', 'sum')
+# Chunks summed per file by the 'sum' aggregation
+TOP_CHUNKS = 3
+
+TABLE_COLUMNS = {
+    'chunk_ids': np.int64,
+    'file_ids': np.int64,
+    'starts': np.int64,
+    'ends': np.int64,
+}
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+def split_spans(text: str, pattern, start: int, end: int) -> List[Tuple[int, int]]:
+    """Non-empty spans of text[start:end] between matches of pattern"""
+    spans = []
+    position = start
+    for match in pattern.finditer(text, start, end):
+        spans.append(strip_span(text, position, match.start()))
+        position = match.end()
+    spans.append(strip_span(text, position, end))
+    return [(span_start, span_end) for span_start, span_end in spans if span_end > span_start]
+
+def text_units(text: str, max_chars: int) -> List[Tuple[int, int]]:
+    """Paragraph spans; paragraphs over max_chars are split into sentences, and sentences at whitespace"""
+    units = []
+    for start, end in split_spans(text, PARAGRAPH_BREAK, 0, len(text)):
+        if end - start <= max_chars:
+            units.append((start, end))
+            continue
+        for sentence_start, sentence_end in split_spans(text, SENTENCE_END, start, end):
+            while sentence_end - sentence_start > max_chars:
+                limit = sentence_start + max_chars
+                cut = max(text.rfind(' ', sentence_start + 1, limit), text.rfind('\n', sentence_start + 1, limit))
+                if cut <= sentence_start:
+                    cut = limit
+                units.append(strip_span(text, sentence_start, cut))
+                sentence_start, sentence_end = strip_span(text, cut, sentence_end)
+            if sentence_end > sentence_start:
+                units.append((sentence_start, sentence_end))
+    return units
+
+def chunk_spans(text: str, max_chars: int = MAX_CHUNK_CHARS, min_chars: int = MIN_CHUNK_CHARS) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of the chunks of text.
+
+    Text that fits in one chunk is returned whole. Longer text is cut between
+    paragraphs, or sentences within long paragraphs. A chunk ends at a
+    unit whose hash marks a boundary once it has min_chars, or before
+    the unit that would take it past max_chars.
+    """
+    if not text.strip():
+        return []
+    if len(text) <= max_chars:
+        return [(0, len(text))]
+    units = text_units(text, max_chars)
+    chunks = []
+    chunk_start = None
+    for position, (start, end) in enumerate(units):
+        if chunk_start is None:
+            chunk_start = start
+        last = position + 1 == len(units)
+        if (last or units[position + 1][1] - chunk_start > max_chars
+                or (end - chunk_start >= min_chars
+                    and zlib.crc32(text[start:end].encode('utf-8')) % BOUNDARY_DIVISOR == 0)):
+            chunks.append((chunk_start, end))
+            chunk_start = None
+    return chunks
+
+def chunk_id(file_path: str, passage: str, occurrence: int = 0) -> int:
+    """Stable id of a chunk: the same passage in the same file keeps its id when the file changes elsewhere"""
+    return path_id(f"{file_path}\x00{occurrence}\x00{passage}")
+
+class ChunkTable:
+    """Chunk id -> (file id, start, end) rows plus each chunk's passage text.
+
+    Rows live in growable numpy columns with replaced rows flagged dead
+    until the next save, and passages in a PathMapping keyed by chunk id.
+    Saved as a new generation of .npy columns behind an atomically
+    replaced manifest, like MetadataStore.
+    """
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.dirty = False
+        self.clear()
+        self.load()
+
+    @property
+    def manifest_path(self) -> str:
+        return f"{self.index_path}.manifest"
+
+    def generation_prefix(self, generation: int) -> str:
+        return f"{self.index_path}.{generation}"
+
+    def clear(self):
+        self.columns = {name: np.zeros(0, dtype=dtype) for name, dtype in TABLE_COLUMNS.items()}
+        self.live = np.zeros(0, dtype=bool)
+        self.count = 0
+        self.live_count = 0
+        self.rows: Dict[int, int] = {}  # chunk id -> live row
+        self.file_rows: Dict[int, List[int]] = {}  # file id -> live rows in text order
+        self.passages = PathMapping()
+
+    def load(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        try:
+            prefix = os.path.join(os.path.dirname(self.index_path), manifest['prefix'])
+            self.columns = {name: np.load(f"{prefix}.{name}.npy") for name in TABLE_COLUMNS}
+            self.count = len(self.columns['chunk_ids'])
+            self.live = np.ones(self.count, dtype=bool)
+            self.live_count = self.count
+            self.rows = dict(zip(self.columns['chunk_ids'].tolist(), range(self.count)))
+            for row, file_id in enumerate(self.columns['file_ids'].tolist()):
+                self.file_rows.setdefault(file_id, []).append(row)
+            self.passages = PathMapping.load(f"{prefix}.passages")
+            self.generation = int(manifest['generation'])
+        except Exception as e:
+            print(f"Error loading chunk table: {str(e)}")
+            self.clear()
+
+    def grow(self, count: int):
+        capacity = len(self.live)
+        if count <= capacity:
+            return
+        capacity = max(count, capacity * 2, 1024)
+        for name in TABLE_COLUMNS:
+            self.columns[name] = np.resize(self.columns[name], capacity)
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self.live)] = self.live
+        self.live = live
+
+    def chunks_of(self, file_id: int) -> List[Tuple[int, int, int]]:
+        """(chunk id, start, end) of a file's chunks"""
+        rows = self.file_rows.get(file_id, [])
+        return [(int(self.columns['chunk_ids'][row]), int(self.columns['starts'][row]), int(self.columns['ends'][row]))
+                for row in rows]
+
+    def set_file(self, file_id: int, chunks: List[Tuple[int, int, int]], passages: Dict[int, str]):
+        """Replace a file's chunks; passages holds the text of chunks not stored yet"""
+        with self.lock:
+            kept = {chunk for chunk, _, _ in chunks}
+            for chunk, _, _ in self.chunks_of(file_id):
+                if chunk not in kept and chunk in self.passages:
+                    del self.passages[chunk]
+            self.remove_rows(file_id)
+            self.grow(self.count + len(chunks))
+            rows = []
+            for chunk, start, end in chunks:
+                row = self.count
+                self.columns['chunk_ids'][row] = chunk
+                self.columns['file_ids'][row] = file_id
+                self.columns['starts'][row] = start
+                self.columns['ends'][row] = end
+                self.live[row] = True
+                self.rows[chunk] = row
+                rows.append(row)
+                self.count += 1
+            if rows:
+                self.file_rows[file_id] = rows
+                self.live_count += len(rows)
+            for chunk, passage in passages.items():
+                self.passages[chunk] = passage
+            self.dirty = True
+
+    def remove_rows(self, file_id: int) -> List[int]:
+        rows = self.file_rows.pop(file_id, [])
+        chunks = self.columns['chunk_ids'][rows].tolist()
+        for chunk in chunks:
+            self.rows.pop(chunk, None)
+        self.live[rows] = False
+        self.live_count -= len(rows)
+        return chunks
+
+    def remove_file(self, file_id: int) -> List[int]:
+        """Drop a file's chunks; returns their ids"""
+        with self.lock:
+            chunks = self.remove_rows(file_id)
+            for chunk in chunks:
+                if chunk in self.passages:
+                    del self.passages[chunk]
+            if chunks:
+                self.dirty = True
+            return chunks
+
+    def locate(self, chunk: int) -> Optional[Tuple[int, int, int]]:
+        """(file id, start, end) of a chunk"""
+        row = self.rows.get(chunk)
+        if row is None:
+            return None
+        return int(self.columns['file_ids'][row]), int(self.columns['starts'][row]), int(self.columns['ends'][row])
+
+    def passage(self, chunk: int) -> Optional[str]:
+        return self.passages.get(chunk)
+
+    def chunk_ids_of(self, file_ids: np.ndarray) -> np.ndarray:
+        """Sorted ids of the chunks of the given files"""
+        with self.lock:
+            rows = self.live[:self.count] & np.isin(self.columns['file_ids'][:self.count], file_ids)
+            return np.sort(self.columns['chunk_ids'][:self.count][rows])
+
+    def file_ids(self) -> np.ndarray:
+        """Sorted ids of the files that have chunks"""
+        return np.sort(np.fromiter(self.file_rows.keys(), dtype=np.int64, count=len(self.file_rows)))
+
+    def file_count(self) -> int:
+        return len(self.file_rows)
+
+    def save(self):
+        """Write live rows and passages as a new generation"""
+        with self.lock:
+            try:
+                directory = os.path.dirname(self.index_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                live = self.live[:self.count]
+                generation = self.generation + 1
+                prefix = self.generation_prefix(generation)
+                for name in TABLE_COLUMNS:
+                    with open(f"{prefix}.{name}.npy", 'wb') as f:
+                        np.save(f, self.columns[name][:self.count][live])
+                        f.flush()
+                        os.fsync(f.fileno())
+                self.passages.save(f"{prefix}.passages")
+
+                temp_path = f"{self.manifest_path}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump({'generation': generation, 'prefix': os.path.basename(prefix)}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.manifest_path)
+
+                previous = self.generation_prefix(self.generation)
+                self.clear()
+                self.load()
+                self.dirty = False
+                for path in [f"{previous}.{name}.npy" for name in TABLE_COLUMNS] + list(mapping_files(f"{previous}.passages")):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            except Exception as e:
+                print(f"Error saving chunk table: {str(e)}")
+
+    def commit(self):
+        with self.lock:
+            if self.dirty:
+                self.save()
+
+    def __len__(self) -> int:
+        return self.live_count
+
+class ChunkIndex:
+    """Several vectors per file, one per content-defined chunk of its text.
+
+    Chunk vectors are kept in their own FaissIndexManager, keyed by chunk
+    id and mapped to the parent file's path, so they get the same storage
+    modes, tiering and filtered search as file vectors; a ChunkTable maps
+    each chunk to its file, character offsets and passage. Chunk ids come
+    from the file path and the chunk text, so re-indexing a changed file
+    only embeds and adds the chunks whose text changed and removes the
+    ones that disappeared.
+
+    search() fetches CHUNK_FETCH_FACTOR chunks per requested file, groups
+    them by file and scores each file by its best chunk ('max') or the
+    sum of its TOP_CHUNKS best chunks ('sum'), returning the best chunk as
+    the file's passage.
+    """
+
+    def __init__(self, index_path: str = "data/search_index_chunks", dimension: int = 384,
+                 model_id: Optional[str] = None, storage: str = 'float32',
+                 max_chars: int = MAX_CHUNK_CHARS, min_chars: int = MIN_CHUNK_CHARS):
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.lock = threading.RLock()
+        self.vectors = FaissIndexManager(index_path, dimension=dimension, model_id=model_id, storage=storage)
+        self.table = ChunkTable(f"{index_path}_table")
+        if len(self.table) and not self.vectors.get_total_files():
+            # The vectors were started over for a new embedding model
+            self.table.clear()
+            self.table.dirty = True
+        atexit.register(self.commit)
+
+    def update(self, files: List[Tuple[str, str]],
+               embed: Callable[[List[str]], List[Optional[np.ndarray]]]) -> Dict[str, bool]:
+        """Re-chunk (file path, content) pairs, embedding new chunks in one batch.
+
+        embed returns one vector (or None on failure) per text. Returns
+        whether every chunk of each file is indexed.
+        """
+        with self.lock:
+            plans = []
+            texts = []
+            for file_path, content in files:
+                file_id = path_id(file_path)
+                existing = {chunk for chunk, _, _ in self.table.chunks_of(file_id)}
+                chunks = []
+                occurrences = {}
+                for start, end in chunk_spans(content or '', self.max_chars, self.min_chars):
+                    passage = content[start:end]
+                    occurrence = occurrences[passage] = occurrences.get(passage, -1) + 1
+                    chunk = chunk_id(file_path, passage, occurrence)
+                    # Chunks already indexed keep their vectors and only get new offsets
+                    indexed = chunk in existing and chunk in self.vectors.file_mapping
+                    chunks.append((chunk, start, end, None if indexed else len(texts)))
+                    if not indexed:
+                        texts.append(passage)
+                plans.append((file_path, file_id, existing, chunks))
+
+            embeddings = embed(texts) if texts else []
+            results = {}
+            vectors, vector_paths, vector_ids = [], [], []
+            stale = []
+            for file_path, file_id, existing, chunks in plans:
+                rows = []
+                passages = {}
+                for chunk, start, end, text_position in chunks:
+                    if text_position is not None:
+                        embedding = embeddings[text_position]
+                        if embedding is None:
+                            continue
+                        vectors.append(embedding)
+                        vector_paths.append(file_path)
+                        vector_ids.append(chunk)
+                        passages[chunk] = texts[text_position]
+                    rows.append((chunk, start, end))
+                current = {chunk for chunk, _, _ in rows}
+                stale.extend(chunk for chunk in existing if chunk not in current)
+                self.table.set_file(file_id, rows, passages)
+                results[file_path] = len(rows) == len(chunks)
+
+            self.vectors.remove_ids(stale)
+            self.vectors.add_vectors(vectors, vector_paths, vector_ids)
+            return results
+
+    def remove(self, file_path: str) -> bool:
+        """Remove a file's chunks; returns False if it had none"""
+        with self.lock:
+            chunks = self.table.remove_file(path_id(file_path))
+            self.vectors.remove_ids(chunks)
+            return bool(chunks)
+
+    def search(self, query_vectors: np.ndarray, k: int, allowed_file_ids: Optional[np.ndarray] = None,
+               aggregation: str = 'max') -> List[List[Dict[str, Any]]]:
+        """Best k files for each query row.
+
+        Each hit has 'file_path', 'score' (the aggregated similarity),
+        'similarity' and 'distance' of the best chunk, and its 'passage'
+        with 'passage_start'/'passage_end' offsets into the file's content.
+        """
+        if aggregation not in CHUNK_AGGREGATIONS:
+            raise ValueError(f"Unknown chunk aggregation {aggregation!r}, expected one of {', '.join(CHUNK_AGGREGATIONS)}")
+        with self.lock:
+            allowed_ids = None if allowed_file_ids is None else self.table.chunk_ids_of(allowed_file_ids)
+            return [self.file_hits(hits, aggregation)[:k]
+                    for hits in self.vectors.search_vectors(query_vectors, k * CHUNK_FETCH_FACTOR, allowed_ids=allowed_ids)]
+
+    def range_search(self, query_vectors: np.ndarray, min_similarity: float,
+                     allowed_file_ids: Optional[np.ndarray] = None) -> List[List[Dict[str, Any]]]:
+        """Every file with a chunk of at least min_similarity to each query row, hits as in search()"""
+        with self.lock:
+            allowed_ids = None if allowed_file_ids is None else self.table.chunk_ids_of(allowed_file_ids)
+            return [self.file_hits(hits, 'max')
+                    for hits in self.vectors.range_search_vectors(query_vectors, min_similarity, allowed_ids)]
+
+    def file_hits(self, hits: List[Tuple[int, float]], aggregation: str) -> List[Dict[str, Any]]:
+        """Group (chunk id, distance) hits, nearest first, into file hits sorted by score"""
+        files = {}
+        # A file's first hit is its best chunk
+        for chunk, distance in hits:
+            location = self.table.locate(chunk)
+            if location is None:
+                continue
+            file_hit = files.get(location[0])
+            if file_hit is None:
+                files[location[0]] = {
+                    'file_path': self.vectors.file_mapping[chunk],
+                    'score': similarity(distance),
+                    'similarity': similarity(distance),
+                    'distance': distance,
+                    'passage': self.table.passage(chunk),
+                    'passage_start': location[1],
+                    'passage_end': location[2],
+                    'chunks': 1
+                }
+            elif aggregation == 'sum' and file_hit['chunks'] < TOP_CHUNKS:
+                file_hit['score'] += similarity(distance)
+                file_hit['chunks'] += 1
+        for file_hit in files.values():
+            del file_hit['chunks']
+        return sorted(files.values(), key=lambda file_hit: file_hit['score'], reverse=True)
+
+    def file_ids(self) -> np.ndarray:
+        return self.table.file_ids()
+
+    def file_count(self) -> int:
+        return self.table.file_count()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def commit(self):
+        """Save the chunk vectors and table if they changed"""
+        with self.lock:
+            self.vectors.commit()
+            self.table.commit()
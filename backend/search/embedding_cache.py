@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+class EmbeddingCache:
+    """Embeddings keyed by (content SHA-256, model id), stored memory-mapped.
+
+    Vectors for one model live in a float32 slot file of shape
+    (capacity, dimension); a JSON index maps content hashes to slots in
+    least-recently-used order. A parallel array holds a fingerprint of the
+    key stored in each slot, so an index that is older than the slot file
+    (after a crash) can never return another text's vector. The slot file
+    grows by doubling up to max_entries, after which the least recently
+    used slots are reused.
+    """
+
+    def __init__(self, cache_dir: str, model_id: str, dimension: int, max_entries: int = 100000):
+        self.model_id = model_id
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        name = hashlib.sha256(model_id.encode('utf-8')).hexdigest()[:16]
+        self.vectors_path = os.path.join(cache_dir, f"{name}.f32")
+        self.keys_path = os.path.join(cache_dir, f"{name}.keys")
+        self.index_path = os.path.join(cache_dir, f"{name}.json")
+        self.slots = OrderedDict()
+        self.free_slots = []
+        self.capacity = 0
+        self.vectors = None
+        self.key_fingerprints = None
+        self.dirty = False
+        self.load()
+
+    @staticmethod
+    def content_key(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def fingerprint(key: str) -> int:
+        return int(key[:16], 16) & 0x7FFFFFFFFFFFFFFF
+
+    def load(self):
+        capacity = 0
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            if index.get('model_id') == self.model_id and index.get('dimension') == self.dimension:
+                capacity = int(index['capacity'])
+                self.slots = OrderedDict((key, int(slot)) for key, slot in index['slots'])
+        except (OSError, ValueError, KeyError):
+            self.slots = OrderedDict()
+        expected_size = capacity * self.dimension * 4
+        if capacity and os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) >= expected_size:
+            self.open_arrays(capacity)
+            used = set(self.slots.values())
+            self.free_slots = [slot for slot in range(capacity - 1, -1, -1) if slot not in used]
+        else:
+            self.slots = OrderedDict()
+            self.open_arrays(min(1024, self.max_entries), reset=True)
+
+    def open_arrays(self, capacity: int, reset: bool = False):
+        """Map the slot files, creating or growing them to capacity"""
+        for path, itemsize in ((self.vectors_path, 4 * self.dimension), (self.keys_path, 8)):
+            mode = 'wb' if reset or not os.path.exists(path) else 'r+b'
+            with open(path, mode) as f:
+                f.truncate(capacity * itemsize)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dimension))
+        self.key_fingerprints = np.memmap(self.keys_path, dtype=np.int64, mode='r+', shape=(capacity,))
+        if reset:
+            self.free_slots = list(range(capacity - 1, -1, -1))
+        self.capacity = capacity
+
+    def grow(self):
+        new_capacity = min(self.max_entries, max(1, self.capacity * 2))
+        self.vectors.flush()
+        self.key_fingerprints.flush()
+        old_capacity = self.capacity
+        self.vectors = None
+        self.key_fingerprints = None
+        self.open_arrays(new_capacity)
+        self.free_slots = list(range(new_capacity - 1, old_capacity - 1, -1)) + self.free_slots
+
+    def allocate(self) -> int:
+        if not self.free_slots and self.capacity < self.max_entries:
+            self.grow()
+        if self.free_slots:
+            return self.free_slots.pop()
+        # Full: reuse the least recently used slot
+        _, slot = self.slots.popitem(last=False)
+        return slot
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors (as copies) for the keys that are present"""
+        results = {}
+        with self.lock:
+            for key in keys:
+                slot = self.slots.get(key)
+                if slot is None:
+                    continue
+                if self.key_fingerprints[slot] != self.fingerprint(key):
+                    del self.slots[key]
+                    self.free_slots.append(slot)
+                    continue
+                self.slots.move_to_end(key)
+                results[key] = np.array(self.vectors[slot])
+            if results:
+                self.dirty = True
+        return results
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        with self.lock:
+            for key, vector in zip(keys, vectors):
+                slot = self.slots.get(key)
+                if slot is None:
+                    slot = self.allocate()
+                self.vectors[slot] = vector
+                self.key_fingerprints[slot] = self.fingerprint(key)
+                self.slots[key] = slot
+                self.slots.move_to_end(key)
+            self.dirty = True
+
+    def flush(self):
+        """Write vectors, then atomically replace the index"""
+        with self.lock:
+            if not self.dirty:
+                return
+            self.vectors.flush()
+            self.key_fingerprints.flush()
+            temp_path = f"{self.index_path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({
+                    'model_id': self.model_id,
+                    'dimension': self.dimension,
+                    'capacity': self.capacity,
+                    'slots': list(self.slots.items())
+                }, f)
+            os.replace(temp_path, self.index_path)
+            self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+def cached_embeddings(cache: Optional[EmbeddingCache], texts: List[str], embed_fn) -> np.ndarray:
+    """Embed texts, calling embed_fn only for texts missing from the cache"""
+    if cache is None:
+        return embed_fn(texts)
+    keys = [EmbeddingCache.content_key(text) for text in texts]
+    cached = cache.get_many(keys)
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    if missing:
+        vectors = embed_fn(list(missing.values()))
+        cache.put_many(list(missing.keys()), vectors)
+        cached.update(zip(missing.keys(), vectors))
+    return np.stack([cached[key] for key in keys]) if keys else embed_fn(texts)
@@ -1,57 +1,151 @@
 import numpy as np
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional
+from .embedding_cache import EmbeddingCache, cached_embeddings
+
+# Output dimension of well-known embedding models
+KNOWN_DIMENSIONS = {
+    'nomic-embed-text': 768,
+    'mxbai-embed-large': 1024,
+    'all-minilm': 384,
+    'snowflake-arctic-embed': 1024,
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072,
+    'text-embedding-ada-002': 1536,
+}
+
+DEFAULT_OLLAMA_EMBEDDING_MODEL = 'nomic-embed-text'
+DEFAULT_OPENAI_EMBEDDING_MODEL = 'text-embedding-3-small'
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit L2 norm; zero rows are left as they are"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class EmbeddingBackend:
+    """Interface for embedding models.
+
+    Implementations set model_id (a string that changes whenever the vector
+    space changes) and dimension, and embed a list of texts into a float32
+    array of shape (len(texts), dimension) with a minimal number of requests.
+    """
+    model_id: str = ''
+    dimension: int = 0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+class OllamaEmbeddingBackend(EmbeddingBackend):
+    """Embeddings from a local Ollama server through its /api/embed endpoint"""
+
+    def __init__(self, client, model: str = DEFAULT_OLLAMA_EMBEDDING_MODEL,
+                 dimension: Optional[int] = None, batch_size: int = 64):
+        self.client = client
+        self.model = model
+        self.model_id = f"ollama:{model}"
+        self.batch_size = batch_size
+        self._dimension = dimension or KNOWN_DIMENSIONS.get(model.split(':')[0])
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            # Unknown model: ask it once for the size of its vectors
+            self._dimension = int(self.embed(['dimension probe']).shape[1])
+        return self._dimension
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embed(model=self.model, input=texts[start:start + self.batch_size])
+            vectors.extend(response['embeddings'])
+        return np.array(vectors, dtype=np.float32)
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Embeddings from the OpenAI embeddings API"""
+
+    def __init__(self, client, model: str = DEFAULT_OPENAI_EMBEDDING_MODEL,
+                 dimension: Optional[int] = None, batch_size: int = 256):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        # text-embedding-3 models can return shortened vectors
+        self.requested_dimension = dimension
+        self.model_id = f"openai:{model}" + (f":{dimension}" if dimension else '')
+        self._dimension = dimension or KNOWN_DIMENSIONS.get(model)
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = int(self.embed(['dimension probe']).shape[1])
+        return self._dimension
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        extra = {'dimensions': self.requested_dimension} if self.requested_dimension else {}
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(
+                model=self.model,
+                input=texts[start:start + self.batch_size],
+                **extra
+            )
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return np.array(vectors, dtype=np.float32)
 
 class EmbeddingsGenerator:
-    def __init__(self, client):
+    def __init__(self, client=None, backend: Optional[EmbeddingBackend] = None,
+                 cache: Optional[EmbeddingCache] = None):
         self.client = client
-        self.embedding_prompt = """
-        You are a text embedding model. Your task is to convert the following text into a meaningful vector representation.
-        The text should be embedded in a way that captures its semantic meaning and can be used for similarity search.
-        
-        Text to embed:
-        {text}
-        
-        Return ONLY a JSON array of 384 floating point numbers representing the embedding vector.
-        Do not include any other text or explanation.
+        self.backend = backend or OllamaEmbeddingBackend(client)
+        # Optional cache keyed by content hash; must belong to this backend's model
+        self.cache = cache
+
+    @property
+    def model_id(self) -> str:
+        return self.backend.model_id
+
+    @property
+    def dimension(self) -> int:
+        return self.backend.dimension
+
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embed texts with batched backend requests.
+
+        Returns L2-normalized float32 vectors of shape (len(texts), dimension).
+        Texts already in the cache are not sent to the backend. Raises if the
+        backend fails or returns vectors of the wrong size.
         """
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return cached_embeddings(self.cache, list(texts), self.embed_uncached)
     
+    def embed_uncached(self, texts: List[str]) -> np.ndarray:
+        vectors = self.backend.embed(texts)
+        if vectors.shape != (len(texts), self.dimension):
+            raise ValueError(
+                f"{self.model_id} returned vectors of shape {vectors.shape}, "
+                f"expected ({len(texts)}, {self.dimension})"
+            )
+        return normalize_vectors(vectors)
+
     def generate_embedding(self, text: str) -> np.ndarray:
-        """Generate embedding for a given text using Ollama"""
+        """Generate embedding for a given text"""
         try:
-            # Prepare the prompt
-            prompt = self.embedding_prompt.format(text=text)
-            
-            # Get response from Ollama
-            response = self.client.chat(
-                model='mistral',
-                messages=[{'role': 'user', 'content': prompt}],
-                options={"temperature": 0}
-            )
-            
-            # Parse the response
-            embedding = json.loads(response['message']['content'])
-            
-            # Convert to numpy array
-            return np.array(embedding, dtype=np.float32)
-            
+            return self.generate_embeddings([text])[0]
         except Exception as e:
             print(f"Error generating embedding: {str(e)}")
             return None
-    
-    def generate_embeddings_batch(self, texts: List[str], batch_size: int = 5) -> List[np.ndarray]:
-        """Generate embeddings for a batch of texts"""
+
+    def generate_embeddings_batch(self, texts: List[str], batch_size: int = 64) -> List[np.ndarray]:
+        """Generate embeddings for a batch of texts, one vector per text"""
         embeddings = []
-        
+
         for i in range(0, len(texts), batch_size):
             batch = texts[i:i + batch_size]
-            batch_embeddings = []
-            
-            for text in batch:
-                embedding = self.generate_embedding(text)
-                if embedding is not None:
-                    batch_embeddings.append(embedding)
-            
-            embeddings.extend(batch_embeddings)
-        
-        return embeddings 
\ No newline at end of file
+            try:
+                embeddings.extend(self.generate_embeddings(batch))
+            except Exception as e:
+                print(f"Error generating embeddings: {str(e)}")
+                embeddings.extend([None] * len(batch))
+
+        return embeddings
@@ -2,105 +2,845 @@ import faiss
 import numpy as np
 import json
 import os
-from typing import List, Dict, Any, Tuple
+import math
+import hashlib
+import time
+import atexit
+import threading
+from typing import List, Dict, Any, Tuple, Optional
 import pickle
+from .vector_store import VectorStore
+from .embeddings import normalize_vectors
+from .path_mapping import PathMapping, mapping_files
+
+# Pending changes are written once this many have accumulated...
+DEFAULT_FLUSH_THRESHOLD = 1000
+# ...or once the oldest pending change is this old (seconds)
+DEFAULT_FLUSH_INTERVAL = 30.0
+# Removed ids are hidden from results at once and physically dropped
+# from the FAISS index in batches of this size (or at the next save)
+DELETE_BATCH_SIZE = 1024
+# Indexes with fewer files than this are searched exactly; larger ones are
+# moved to an IVF index trained in the background
+APPROXIMATE_THRESHOLD = 50000
+# IVF indexes with more lists than this use an HNSW graph as coarse quantizer
+HNSW_QUANTIZER_NLIST = 4096
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+# After training, nprobe is doubled until sampled recall@10 against exact
+# search reaches TARGET_RECALL
+TARGET_RECALL = 0.95
+RECALL_SAMPLE_SIZE = 200
+# How vectors are encoded in the FAISS index. Anything but float32 keeps
+# the full vectors in a memory-mapped VectorStore for re-ranking.
+STORAGE_MODES = ('float32', 'fp16', 'sq8', 'pq')
+# Candidates fetched per requested result when re-ranking
+RERANK_FACTOR = 8
+# Filters matching at most this many files are searched exactly over
+# just their vectors instead of through an ID selector
+EXACT_FILTER_LIMIT = 20000
+# Approximate per-vector cost of the id bookkeeping (id array plus the
+# id -> position hash table of IndexIDMap2 or the IVF direct map)
+ID_OVERHEAD_BYTES = 40
+# PQ codebooks need this many training vectors per centroid (the least
+# FAISS accepts without warning); IVF indexes with fewer vectors than that
+# are encoded as sq8
+PQ_POINTS_PER_CENTROID = 39
+PQ_CENTROIDS = 256
+# Vectors compared with their decoded codes to measure the encoding error
+ENCODING_ERROR_SAMPLE_SIZE = 1000
+# Vectors compared at a time by exact range search
+RANGE_BLOCK_SIZE = 8192
+
+def path_id(file_path: str) -> int:
+    """Stable non-negative 63-bit id for a file path"""
+    digest = hashlib.blake2b(file_path.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') & 0x7FFFFFFFFFFFFFFF
+
+def similarity(distance: float) -> float:
+    """Cosine similarity from the squared L2 distance between normalized vectors"""
+    return 1.0 - distance / 2.0
+
+def similarity_radius(min_similarity: float) -> float:
+    """Squared L2 distance within which normalized vectors have at least min_similarity"""
+    return 2.0 - 2.0 * min_similarity
+
+def range_margin(radius: float, encoding_error: float) -> float:
+    """Extra squared-L2 radius that keeps every vector within radius a range search candidate.
+
+    A code decodes to within encoding_error of its vector, so by the
+    triangle inequality a vector at squared distance radius from the query
+    has a code at most (sqrt(radius) + encoding_error) ** 2 away.
+    """
+    return 2.0 * encoding_error * math.sqrt(radius) + encoding_error ** 2
+
+def ivf_list_count(count: int) -> int:
+    return int(min(65536, max(64, 4 * math.sqrt(count))))
+
+def read_index_mapped(index_file: str):
+    """Open an index with its inverted lists memory-mapped, or read it into RAM
+    for index types that cannot be mapped"""
+    try:
+        return faiss.read_index(index_file, faiss.IO_FLAG_MMAP)
+    except Exception:
+        return faiss.read_index(index_file)
+
+def storage_code(storage: str, dimension: int) -> str:
+    """index_factory encoding for a storage mode"""
+    if storage == 'float32':
+        return 'Flat'
+    if storage == 'fp16':
+        return 'SQfp16'
+    if storage == 'sq8':
+        return 'SQ8'
+    if storage == 'pq':
+        # About one byte per 8 dimensions, e.g. 96 bytes for 768 dimensions.
+        # "np" skips polysemous training, which only speeds up Hamming
+        # filtering (unused here) and dominated the build time
+        subquantizers = next(m for m in range(max(1, dimension // 8), 0, -1) if dimension % m == 0)
+        return f"PQ{subquantizers}np"
+    raise ValueError(f"Unknown storage mode {storage!r}, expected one of {', '.join(STORAGE_MODES)}")
+
+def ivf_factory_string(count: int, storage: str = 'float32', dimension: int = 384) -> str:
+    """index_factory description of an IVF index sized for count vectors"""
+    nlist = ivf_list_count(count)
+    quantizer = f"IVF{nlist}_HNSW32" if nlist > HNSW_QUANTIZER_NLIST else f"IVF{nlist}"
+    return f"{quantizer},{storage_code(storage, dimension)}"
+
+def recall_at_k(search_fn, vectors: np.ndarray, ids: np.ndarray, k: int = 10,
+                sample_size: int = RECALL_SAMPLE_SIZE, seed: int = 0) -> float:
+    """Fraction of the exact k nearest neighbours that search_fn returns.
+
+    search_fn(queries, k) returns a list of result id lists, one per query.
+
+    Queries are a random sample of the stored vectors; the exact
+    neighbours come from a brute-force search over all of them.
+    """
+    if len(ids) == 0:
+        return 1.0
+    k = min(k, len(ids))
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(ids), size=min(sample_size, len(ids)), replace=False)]
+    _, exact_positions = faiss.knn(queries, vectors, k)
+    found = search_fn(queries, k)
+    hits = sum(len(set(ids[exact].tolist()) & set(row)) for exact, row in zip(exact_positions, found))
+    return hits / float(len(queries) * k)
 
 class FaissIndexManager:
-    def __init__(self, index_path: str = "data/search_index"):
+    """FAISS index plus id -> path mapping with write-behind persistence.
+
+    Vectors are stored in an IndexIDMap2 under ids derived from the file
+    path (see path_id), so re-indexing a file replaces its vector and
+    looking a file up or removing it only needs its id. Removals
+    are hidden from search results immediately and applied to the FAISS
+    index in batches, because removing from a flat index compacts it.
+
+    Below approximate_threshold files the index is searched exactly. Past
+    it an IVF index (IndexIVFFlat, which takes the path ids directly) is
+    trained on a background thread from a snapshot of the vectors; changes
+    made meanwhile are journaled and replayed before the new index is
+    swapped in. nprobe is tuned against exact search on a sample and can
+    be changed with set_search_params, together with efSearch when the
+    coarse quantizer is an HNSW graph. The IVF index is rebuilt when the
+    corpus outgrows its number of lists.
+
+    Vectors and queries are L2-normalized, so the squared L2 distances
+    FAISS returns rank exactly like cosine similarity (similarity() turns
+    one into the other) and a similarity threshold is a fixed search
+    radius for range_search_vectors.
+
+    storage selects how the index encodes vectors: float32, fp16, sq8
+    (8-bit scalar quantization) or pq (product quantization, about 1 byte
+    per 8 dimensions). sq8 and pq need training, so until the IVF index is
+    built they are stored as fp16, and pq uses sq8 codes until there are
+    enough vectors to train its codebooks (PQ_POINTS_PER_CENTROID each). With compressed storage the full
+    vectors are kept in a memory-mapped VectorStore and the top
+    RERANK_FACTOR * k candidates are re-ranked by exact distance.
+
+    Changes are kept in memory and written when flush_threshold changes
+    have accumulated, when the oldest unsaved change is older than
+    flush_interval seconds, on commit(), or at interpreter exit.
+
+    Every save writes a new generation of files
+    (<index_path>.<generation>.index / .mapping.*) and then atomically
+    replaces <index_path>.manifest to point at them, so a crash leaves
+    either the previous or the new generation, never a mix of the two.
+
+    Loading is memory-mapped: the id -> path mapping is a PathMapping
+    over sorted ids and a path blob, and IVF inverted lists are mapped
+    read-only, so opening a large index for search reads almost nothing
+    and the pages are shared with other processes. The first change
+    reads the IVF index into RAM (ensure_writable).
+    """
+
+    def __init__(self, index_path: str = "data/search_index", dimension: int = 384, model_id: Optional[str] = None,
+                 flush_threshold: int = DEFAULT_FLUSH_THRESHOLD, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 approximate_threshold: int = APPROXIMATE_THRESHOLD, nprobe: int = DEFAULT_NPROBE,
+                 ef_search: int = DEFAULT_EF_SEARCH, storage: str = 'float32'):
+        storage_code(storage, dimension)
         self.index_path = index_path
-        self.dimension = 384  # Mistral embedding dimension
+        self.dimension = dimension  # Set by the embedding model
+        self.model_id = model_id
+        self.flush_threshold = flush_threshold
+        self.flush_interval = flush_interval
+        self.approximate_threshold = approximate_threshold
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.storage = storage
+        self.store = None  # Full vectors for re-ranking compressed storage
+        self.recall = None  # Last measured recall@10
+        self.encoding_error = None  # Largest sampled distance between a vector and its IVF code
+        self.builder = None  # Thread training a new IVF index
+        self.journal = None  # Changes made while the builder runs
         self.index = None
-        self.file_mapping = {}  # Maps index IDs to file paths
+        self.file_mapping = PathMapping()  # Maps index IDs to file paths
+        self.mapped_index_file = None  # Set while the index is memory-mapped read-only
+        self.deleted_ids = set()  # Removed but still in the FAISS index
+        self.generation = 0
+        self.pending_changes = 0
+        self.first_pending_time = None
+        self.lock = threading.RLock()
         self.load_or_create_index()
-    
+        atexit.register(self.commit)
+
+    @property
+    def manifest_path(self) -> str:
+        return f"{self.index_path}.manifest"
+
+    def generation_paths(self, generation: int) -> Tuple[str, str]:
+        return f"{self.index_path}.{generation}.index", f"{self.index_path}.{generation}.mapping"
+
+    def read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def read_legacy_meta(self) -> Dict[str, Any]:
+        try:
+            with open(f"{self.index_path}.meta", 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def matches_model(self, meta: Dict[str, Any]) -> bool:
+        """Check that a saved index was built with the current embedding model"""
+        dimension = meta.get('dimension', 384)  # indexes saved before the model was recorded
+        if dimension != self.dimension or (self.model_id and meta.get('model_id') != self.model_id):
+            print(f"Search index was built with {meta.get('model_id', 'an older model')} "
+                  f"({dimension} dimensions); starting a new index for {self.model_id} ({self.dimension} dimensions)")
+            return False
+        return True
+
+    @property
+    def store_path(self) -> str:
+        return f"{self.index_path}.vectors"
+
+    def open_store(self):
+        """Open the re-ranking store if it is needed or left over from another storage mode"""
+        if self.storage != 'float32' or os.path.exists(f"{self.store_path}.ids"):
+            self.store = VectorStore(self.store_path, self.dimension)
+
+    def create_index(self):
+        if self.storage == 'float32':
+            flat = faiss.IndexFlatL2(self.dimension)
+        else:
+            flat = faiss.index_factory(self.dimension, storage_code('fp16', self.dimension))
+        self.index = faiss.IndexIDMap2(flat)
+        self.mapped_index_file = None
+        self.file_mapping = PathMapping()
+        self.deleted_ids = set()
+        self.recall = None
+        self.encoding_error = None
+        if self.store is not None:
+            self.store.delete()
+        self.store = VectorStore(self.store_path, self.dimension) if self.storage != 'float32' else None
+
+    def convert_storage(self, previous_storage: str):
+        """Re-encode a loaded index for the configured storage mode"""
+        ids, vectors = self.snapshot()
+        file_paths = [self.file_mapping[index_id] for index_id in ids.tolist()]
+        self.create_index()
+        self.add_vectors(list(vectors), file_paths)
+        print(f"Converted search index from {previous_storage} to {self.storage} storage ({len(ids)} files)")
+
+    def migrate_sequential_index(self, index, file_mapping: Dict[int, str]):
+        """Rebuild an index that used positions as ids under path ids.
+
+        Older indexes were plain IndexFlatL2 with the position of each
+        vector as its id. A path indexed more than once keeps its last
+        vector.
+        """
+        vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, self.dimension), dtype=np.float32)
+        latest = {}
+        for position in range(index.ntotal):
+            file_path = file_mapping.get(position)
+            if file_path is not None:
+                latest[file_path] = position
+        self.create_index()
+        self.add_vectors([vectors[position] for position in latest.values()], list(latest.keys()))
+        print(f"Migrated search index to path ids ({len(latest)} files)")
+
     def load_or_create_index(self):
         """Load existing index or create a new one"""
         try:
-            if os.path.exists(f"{self.index_path}.index"):
-                # Load the FAISS index
-                self.index = faiss.read_index(f"{self.index_path}.index")
-                
-                # Load the file mapping
-                with open(f"{self.index_path}.mapping", 'rb') as f:
-                    self.file_mapping = pickle.load(f)
+            self.open_store()
+            manifest = self.read_manifest()
+            if manifest is not None:
+                directory = os.path.dirname(self.index_path)
+                index_file = os.path.join(directory, manifest['index'])
+                mapping_file = os.path.join(directory, manifest['mapping'])
+                self.generation = int(manifest['generation'])
+                meta = manifest
+            else:
+                # Layout used before manifests: <index_path>.index/.mapping/.meta
+                index_file, mapping_file = f"{self.index_path}.index", f"{self.index_path}.mapping"
+                meta = self.read_legacy_meta()
+
+            if os.path.exists(index_file) and self.matches_model(meta):
+                # Load the FAISS index and the file mapping
+                index = read_index_mapped(index_file)
+                if meta.get('mapping_format') == 'compact':
+                    file_mapping = PathMapping.load(mapping_file)
+                else:
+                    # Pickled dict written by older versions; replaced on the next save
+                    with open(mapping_file, 'rb') as f:
+                        file_mapping = pickle.load(f)
+
+                if isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF)):
+                    self.index = index
+                    self.mapped_index_file = index_file if isinstance(index, faiss.IndexIVF) else None
+                    if not isinstance(file_mapping, PathMapping):
+                        file_mapping = PathMapping.from_dict(file_mapping)
+                    self.file_mapping = file_mapping
+                    self.deleted_ids = set()
+                    self.nprobe = meta.get('nprobe', self.nprobe)
+                    self.ef_search = meta.get('ef_search', self.ef_search)
+                    self.recall = meta.get('recall')
+                    self.encoding_error = meta.get('encoding_error')
+                    self.apply_search_params(self.index)
+                    if meta.get('storage', 'float32') != self.storage:
+                        self.convert_storage(meta.get('storage', 'float32'))
+                else:
+                    self.migrate_sequential_index(index, file_mapping)
             else:
                 # Create a new index
-                self.index = faiss.IndexFlatL2(self.dimension)
-                self.file_mapping = {}
+                self.create_index()
         except Exception as e:
             print(f"Error loading/creating index: {str(e)}")
-            self.index = faiss.IndexFlatL2(self.dimension)
-            self.file_mapping = {}
-    
+            self.create_index()
+
     def save_index(self):
-        """Save the index and file mapping to disk"""
-        try:
-            # Save the FAISS index
-            faiss.write_index(self.index, f"{self.index_path}.index")
-            
-            # Save the file mapping
-            with open(f"{self.index_path}.mapping", 'wb') as f:
-                pickle.dump(self.file_mapping, f)
-        except Exception as e:
-            print(f"Error saving index: {str(e)}")
-    
-    def add_vectors(self, vectors: List[np.ndarray], file_paths: List[str]):
-        """Add vectors and their corresponding file paths to the index"""
+        """Write the index and mapping as a new generation and switch the manifest to it"""
+        with self.lock:
+            try:
+                directory = os.path.dirname(self.index_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+
+                self.purge_deleted()
+                previous = self.read_manifest()
+                generation = self.generation + 1
+                index_file, mapping_file = self.generation_paths(generation)
+
+                # Save the FAISS index and the file mapping, both synced
+                # to disk before the manifest points at them
+                with open(index_file, 'wb') as f:
+                    f.write(faiss.serialize_index(self.index).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.file_mapping.save(mapping_file)
+                if self.store is not None:
+                    self.store.flush()
+
+                manifest = {
+                    'generation': generation,
+                    'index': os.path.basename(index_file),
+                    'mapping': os.path.basename(mapping_file),
+                    'mapping_format': 'compact',
+                    'dimension': self.dimension,
+                    'model_id': self.model_id,
+                    'storage': self.storage,
+                    'nprobe': self.nprobe,
+                    'ef_search': self.ef_search,
+                    'recall': self.recall,
+                    'encoding_error': self.encoding_error
+                }
+                temp_path = f"{self.manifest_path}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(manifest, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.manifest_path)
+
+                self.generation = generation
+                self.pending_changes = 0
+                self.first_pending_time = None
+                # Drop the overlay by mapping the merged files just written
+                self.file_mapping = PathMapping.load(mapping_file)
+                self.remove_old_files(previous)
+            except Exception as e:
+                print(f"Error saving index: {str(e)}")
+
+    def remove_old_files(self, previous: Optional[Dict[str, Any]]):
+        """Delete the generation (or legacy files) replaced by the last save"""
+        directory = os.path.dirname(self.index_path)
+        if previous is not None:
+            mapping = os.path.join(directory, previous['mapping'])
+            stale = [os.path.join(directory, previous['index'])]
+            stale += mapping_files(mapping) if previous.get('mapping_format') == 'compact' else [mapping]
+        else:
+            stale = [f"{self.index_path}.index", f"{self.index_path}.mapping", f"{self.index_path}.meta"]
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def mark_changed(self, changes: int = 1):
+        """Record unsaved changes and save if a threshold has been crossed"""
+        with self.lock:
+            self.pending_changes += changes
+            if self.first_pending_time is None:
+                self.first_pending_time = time.time()
+            if (self.pending_changes >= self.flush_threshold
+                    or time.time() - self.first_pending_time >= self.flush_interval):
+                self.save_index()
+
+    def commit(self):
+        """Save any pending changes now"""
+        with self.lock:
+            if self.pending_changes:
+                self.save_index()
+
+    def ensure_writable(self):
+        """Replace a memory-mapped (read-only) index with an in-memory copy before changing it"""
+        with self.lock:
+            if self.mapped_index_file is not None:
+                self.index = faiss.read_index(self.mapped_index_file)
+                self.apply_search_params(self.index)
+                self.mapped_index_file = None
+
+    def purge_deleted(self):
+        """Drop removed vectors from the FAISS index in one pass"""
+        with self.lock:
+            if self.deleted_ids:
+                self.ensure_writable()
+                self.index.remove_ids(np.fromiter(self.deleted_ids, dtype=np.int64, count=len(self.deleted_ids)))
+                self.deleted_ids.clear()
+
+    def overwrite_vectors(self, ids: np.ndarray, vectors: np.ndarray):
+        """Re-encode the vectors of ids already in a flat index in place.
+
+        Removing from IndexIDMap2 compacts the whole index, so replacing a
+        vector that way would cost O(n); overwriting its code keeps the id
+        at the same position.
+        """
+        flat = faiss.downcast_index(self.index.index)
+        position_ids = faiss.vector_to_array(self.index.id_map)
+        found = np.flatnonzero(np.isin(position_ids, ids))
+        positions = dict(zip(position_ids[found].tolist(), found.tolist()))
+        codes = flat.sa_encode(vectors)
+        code_size = flat.code_size
+        stored = faiss.rev_swig_ptr(flat.codes.data(), flat.ntotal * code_size)
+        for index_id, code in zip(ids.tolist(), codes):
+            position = positions[index_id]
+            stored[position * code_size:(position + 1) * code_size] = code
+
+    def add_vectors(self, vectors: List[np.ndarray], file_paths: List[str], ids: Optional[List[int]] = None):
+        """Add or replace the vectors of the given file paths
+
+        ids default to the path_id of each path; passing them lets several
+        vectors (e.g. the chunks of a file) map back to the same path.
+        """
         if not vectors or not file_paths:
             return
-        
-        # Convert vectors to numpy array if they aren't already
-        vectors_array = np.array(vectors, dtype=np.float32)
-        
-        # Add vectors to the index
-        start_id = self.index.ntotal
-        self.index.add(vectors_array)
-        
-        # Update file mapping
-        for i, file_path in enumerate(file_paths):
-            self.file_mapping[start_id + i] = file_path
-        
-        # Save the updated index
-        self.save_index()
-    
-    def search(self, query_vector: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
-        """Search for similar vectors and return file paths with distances"""
-        if self.index.ntotal == 0:
-            return []
-        
-        # Ensure query vector is the right shape
-        query_vector = query_vector.reshape(1, -1).astype(np.float32)
-        
-        # Search the index
-        distances, indices = self.index.search(query_vector, k)
-        
-        # Map indices to file paths and combine with distances
-        results = []
-        for idx, distance in zip(indices[0], distances[0]):
-            if idx in self.file_mapping:
-                results.append((self.file_mapping[idx], float(distance)))
-        
+        if ids is None:
+            ids = [path_id(file_path) for file_path in file_paths]
+
+        # An id listed twice keeps its last vector
+        positions = {}
+        for position, index_id in enumerate(ids):
+            positions[int(index_id)] = position
+        file_paths = [file_paths[position] for position in positions.values()]
+        vectors_array = normalize_vectors(np.array([vectors[position] for position in positions.values()], dtype=np.float32))
+        ids = np.fromiter(positions.keys(), dtype=np.int64, count=len(positions))
+
+        with self.lock:
+            self.ensure_writable()
+            # Ids still in the FAISS index: vectors being replaced and removals
+            # not purged yet. Other pending removals are left for the batched purge.
+            present = np.fromiter((index_id in self.file_mapping or index_id in self.deleted_ids
+                                   for index_id in ids.tolist()), dtype=bool, count=len(ids))
+            if present.any():
+                self.deleted_ids.difference_update(ids[present].tolist())
+                if self.is_approximate:
+                    self.index.remove_ids(ids[present])
+                    self.index.add_with_ids(vectors_array, ids)
+                else:
+                    self.overwrite_vectors(ids[present], vectors_array[present])
+                    if not present.all():
+                        self.index.add_with_ids(vectors_array[~present], ids[~present])
+            else:
+                self.index.add_with_ids(vectors_array, ids)
+            if self.store is not None:
+                self.store.put(ids, vectors_array)
+            for index_id, file_path in zip(ids.tolist(), file_paths):
+                self.file_mapping[index_id] = file_path
+            if self.journal is not None:
+                self.journal.append((ids, vectors_array))
+
+            self.mark_changed(len(file_paths))
+            if self.needs_rebuild():
+                self.start_builder()
+
+    def filtered_search(self, index, queries: np.ndarray, fetch: int, allowed_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """index.search restricted to allowed_ids, returning path ids as labels.
+
+        Small selections are searched exactly over their own vectors. Larger
+        ones are pushed down into FAISS: IVF indexes take the ids through an
+        IDSelectorBatch; IndexIDMap2 does not accept search parameters, so
+        its inner index is searched with a bitmap of the allowed positions.
+        """
+        if len(allowed_ids) <= EXACT_FILTER_LIMIT:
+            allowed_ids = np.array([index_id for index_id in allowed_ids.tolist() if index_id in self.file_mapping],
+                                   dtype=np.int64)
+            if not len(allowed_ids):
+                return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+            if self.store is not None:
+                vectors = self.store.get(allowed_ids)
+            else:
+                vectors = index.reconstruct_batch(allowed_ids)
+            distances, positions = faiss.knn(queries, vectors, min(fetch, len(allowed_ids)))
+            return distances, allowed_ids[positions]
+        if isinstance(index, faiss.IndexIVF):
+            selector = faiss.IDSelectorBatch(allowed_ids)
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+            return index.search(queries, fetch, params=params)
+        position_ids = faiss.vector_to_array(index.id_map)
+        bitmap = np.packbits(np.isin(position_ids, allowed_ids), bitorder='little')
+        selector = faiss.IDSelectorBitmap(len(position_ids), faiss.swig_ptr(bitmap))
+        distances, positions = index.index.search(queries, fetch, params=faiss.SearchParameters(sel=selector))
+        return distances, np.where(positions >= 0, position_ids[np.maximum(positions, 0)], -1)
+
+    def search_vectors(self, queries: np.ndarray, k: int, index=None,
+                       allowed_ids: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """(id, distance) results for each query row, re-ranked when storage is compressed.
+
+        allowed_ids (sorted path ids, e.g. from MetadataStore.select)
+        restricts the results to those files.
+        """
+        queries = normalize_vectors(np.asarray(queries, dtype=np.float32).reshape(-1, self.dimension))
+        with self.lock:
+            index = self.index if index is None else index
+            if index.ntotal == 0:
+                return [[] for _ in queries]
+
+            # Ask for extra neighbours to make up for removed vectors
+            # and to give re-ranking candidates to choose from
+            fetch = k * RERANK_FACTOR if self.store is not None else k
+            fetch = min(index.ntotal, fetch + len(self.deleted_ids))
+            if allowed_ids is None:
+                distances, indices = index.search(queries, fetch)
+            else:
+                distances, indices = self.filtered_search(index, queries, fetch, np.asarray(allowed_ids, dtype=np.int64))
+
+            results = []
+            for query, row_indices, row_distances in zip(queries, indices, distances):
+                hits = [(idx, float(distance)) for idx, distance in zip(row_indices.tolist(), row_distances.tolist())
+                        if idx in self.file_mapping]
+                if self.store is not None and hits:
+                    candidates = np.array([idx for idx, _ in hits], dtype=np.int64)
+                    exact = ((self.store.get(candidates) - query) ** 2).sum(axis=1)
+                    hits = [(int(candidates[i]), float(exact[i])) for i in np.argsort(exact, kind='stable')]
+                results.append(hits[:k])
         return results
-    
-    def remove_file(self, file_path: str):
-        """Remove a file's vector from the index"""
-        # Find the index ID for this file
-        index_id = None
-        for idx, path in self.file_mapping.items():
-            if path == file_path:
-                index_id = idx
+
+    def range_search_vectors(self, queries: np.ndarray, min_similarity: float,
+                             allowed_ids: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """(id, distance) of every vector with at least min_similarity to each query row, nearest first.
+
+        Uses FAISS range search with the matching radius (see
+        similarity_radius). Flat indexes with compressed storage, which
+        FAISS cannot range-search, and small allowed_ids selections are
+        checked exactly over their full vectors instead; compressed IVF
+        indexes are searched wider by the range_margin for their measured
+        encoding error and then checked exactly.
+        """
+        queries = normalize_vectors(np.asarray(queries, dtype=np.float32).reshape(-1, self.dimension))
+        radius = similarity_radius(min_similarity)
+        with self.lock:
+            index = self.index
+            if index.ntotal == 0:
+                return [[] for _ in queries]
+            if allowed_ids is not None:
+                allowed_ids = np.asarray(allowed_ids, dtype=np.int64)
+            if (allowed_ids is not None and len(allowed_ids) <= EXACT_FILTER_LIMIT) or \
+                    (self.store is not None and not self.is_approximate):
+                ids = self.file_mapping.ids() if allowed_ids is None else allowed_ids
+                return self.exact_range_search(queries, radius, ids)
+
+            search_radius = radius
+            if self.store is not None:
+                if self.encoding_error is None:
+                    # Indexes saved before the error was recorded
+                    self.encoding_error = self.measure_encoding_error(index, self.file_mapping.ids())
+                search_radius += range_margin(radius, self.encoding_error)
+            if isinstance(index, faiss.IndexIVF):
+                params = faiss.SearchParametersIVF(nprobe=self.nprobe)
+                if allowed_ids is not None:
+                    params.sel = faiss.IDSelectorBatch(allowed_ids)
+                limits, distances, labels = index.range_search(queries, search_radius, params=params)
+            elif allowed_ids is not None:
+                position_ids = faiss.vector_to_array(index.id_map)
+                bitmap = np.packbits(np.isin(position_ids, allowed_ids), bitorder='little')
+                selector = faiss.IDSelectorBitmap(len(position_ids), faiss.swig_ptr(bitmap))
+                limits, distances, positions = index.index.range_search(queries, search_radius,
+                                                                        params=faiss.SearchParameters(sel=selector))
+                labels = position_ids[positions]
+            else:
+                limits, distances, labels = index.range_search(queries, search_radius)
+
+            results = []
+            for row, query in enumerate(queries):
+                start, end = int(limits[row]), int(limits[row + 1])
+                hits = [(idx, float(distance)) for idx, distance in zip(labels[start:end].tolist(), distances[start:end].tolist())
+                        if idx in self.file_mapping]
+                if self.store is not None and hits:
+                    candidates = np.array([idx for idx, _ in hits], dtype=np.int64)
+                    exact = ((self.store.get(candidates) - query) ** 2).sum(axis=1)
+                    hits = list(zip(candidates.tolist(), exact.tolist()))
+                results.append(sorted((hit for hit in hits if hit[1] < radius), key=lambda hit: hit[1]))
+        return results
+
+    def exact_range_search(self, queries: np.ndarray, radius: float, ids: np.ndarray) -> List[List[Tuple[int, float]]]:
+        """Range search by brute force over the full vectors of ids, RANGE_BLOCK_SIZE at a time"""
+        ids = np.array([index_id for index_id in ids.tolist() if index_id in self.file_mapping], dtype=np.int64)
+        results = [[] for _ in queries]
+        for block_start in range(0, len(ids), RANGE_BLOCK_SIZE):
+            block_ids = ids[block_start:block_start + RANGE_BLOCK_SIZE]
+            if self.store is not None:
+                vectors = self.store.get(block_ids)
+            else:
+                vectors = self.index.reconstruct_batch(block_ids)
+            distances = faiss.pairwise_distances(queries, vectors)
+            for row, positions in enumerate(distances < radius):
+                for position in np.flatnonzero(positions).tolist():
+                    results[row].append((int(block_ids[position]), float(distances[row, position])))
+        return [sorted(hits, key=lambda hit: hit[1]) for hits in results]
+
+    def range_search(self, query_vector: np.ndarray, min_similarity: float,
+                     allowed_ids: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """File paths and distances of all vectors with at least min_similarity to the query"""
+        with self.lock:
+            return [(self.file_mapping[idx], distance)
+                    for idx, distance in self.range_search_vectors(query_vector, min_similarity, allowed_ids)[0]]
+
+    def search(self, query_vector: np.ndarray, k: int = 5,
+               allowed_ids: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """Search for similar vectors and return file paths with distances"""
+        return self.search_many(query_vector, k, allowed_ids)[0]
+
+    def search_many(self, query_vectors: np.ndarray, k: int = 5,
+                    allowed_ids: Optional[np.ndarray] = None) -> List[List[Tuple[str, float]]]:
+        """search() for each row of query_vectors, as one matrix search"""
+        with self.lock:
+            return [[(self.file_mapping[idx], distance) for idx, distance in hits]
+                    for hits in self.search_vectors(query_vectors, k, allowed_ids=allowed_ids)]
+
+    def contains(self, file_path: str) -> bool:
+        return path_id(file_path) in self.file_mapping
+
+    def remove_file(self, file_path: str) -> bool:
+        """Remove a file's vector from the index; returns False if it was not indexed"""
+        return self.remove_ids([path_id(file_path)]) > 0
+
+    def remove_ids(self, ids: List[int]) -> int:
+        """Remove the vectors with the given ids; returns how many were indexed"""
+        with self.lock:
+            removed = [index_id for index_id in dict.fromkeys(ids) if index_id in self.file_mapping]
+            if not removed:
+                return 0
+            for index_id in removed:
+                del self.file_mapping[index_id]
+            self.deleted_ids.update(removed)
+            if self.store is not None:
+                self.store.remove(removed)
+            if self.journal is not None:
+                self.journal.append((np.array(removed, dtype=np.int64), None))
+            if len(self.deleted_ids) >= DELETE_BATCH_SIZE:
+                self.purge_deleted()
+            self.mark_changed(len(removed))
+            return len(removed)
+
+    @property
+    def is_approximate(self) -> bool:
+        return isinstance(self.index, faiss.IndexIVF)
+
+    def apply_search_params(self, index):
+        """Set nprobe (and the quantizer's efSearch) on an IVF index"""
+        if not isinstance(index, faiss.IndexIVF):
+            return
+        index.nprobe = self.nprobe
+        quantizer = faiss.downcast_index(index.quantizer)
+        if isinstance(quantizer, faiss.IndexHNSW):
+            quantizer.hnsw.efSearch = self.ef_search
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Trade speed for recall on the IVF index: lists probed and quantizer efSearch"""
+        with self.lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            self.apply_search_params(self.index)
+            self.recall = None
+
+    def needs_rebuild(self) -> bool:
+        """Whether the index should move to (or be retrained as) an IVF index"""
+        count = len(self.file_mapping)
+        if self.builder is not None and self.builder.is_alive():
+            return False
+        if not self.is_approximate:
+            return count >= self.approximate_threshold
+        # Retrain once the corpus is four times what the lists were sized for
+        nlist = self.index.nlist
+        return nlist < ivf_list_count(count) and count > 4 * (nlist / 4) ** 2
+
+    def start_builder(self):
+        self.builder = threading.Thread(target=self.build_approximate_index, daemon=True)
+        self.builder.start()
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids and full vectors of all indexed files"""
+        with self.lock:
+            ids = self.file_mapping.ids()
+            if not len(ids):
+                vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            elif self.store is not None and all(index_id in self.store for index_id in ids.tolist()):
+                vectors = self.store.get(ids)
+            else:
+                vectors = self.index.reconstruct_batch(ids)
+        return ids, vectors
+
+    def build_approximate_index(self):
+        """Train an IVF index from a snapshot and swap it in (runs on self.builder)"""
+        try:
+            with self.lock:
+                ids, vectors = self.snapshot()
+                self.journal = []
+            start_time = time.time()
+
+            storage = self.storage
+            if storage == 'pq' and len(ids) < PQ_POINTS_PER_CENTROID * PQ_CENTROIDS:
+                storage = 'sq8'
+            description = ivf_factory_string(len(ids), storage, self.dimension)
+            index = faiss.index_factory(self.dimension, description)
+            rng = np.random.default_rng(0)
+            training_size = min(len(ids), 64 * ivf_list_count(len(ids)))
+            index.train(vectors[rng.choice(len(ids), size=training_size, replace=False)])
+            # A hash table direct map keeps reconstruct() and remove_ids() working with path ids
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            index.add_with_ids(vectors, ids)
+            recall = self.tune_nprobe(index, vectors, ids)
+            encoding_error = self.measure_encoding_error(index, ids, vectors) if self.store is not None else None
+            del vectors
+
+            with self.lock:
+                for journal_ids, journal_vectors in self.journal:
+                    index.remove_ids(journal_ids)
+                    if journal_vectors is not None:
+                        index.add_with_ids(journal_vectors, journal_ids)
+                self.index = index
+                self.mapped_index_file = None
+                self.deleted_ids = set()
+                self.recall = recall
+                self.encoding_error = encoding_error
+                self.journal = None
+                self.save_index()
+            print(f"Search index moved to {description} for {len(ids)} files "
+                  f"in {time.time() - start_time:.1f}s (nprobe={self.nprobe}, recall@10={recall:.3f})")
+        except Exception as e:
+            print(f"Error building approximate index: {str(e)}")
+            with self.lock:
+                self.journal = None
+
+    def tune_nprobe(self, index, vectors: np.ndarray, ids: np.ndarray) -> float:
+        """Double nprobe until sampled recall reaches TARGET_RECALL or stops improving; returns that recall"""
+        def search_fn(queries, k):
+            return [[idx for idx, _ in hits] for hits in self.search_vectors(queries, k, index)]
+
+        self.apply_search_params(index)
+        recall = recall_at_k(search_fn, vectors, ids)
+        while recall < TARGET_RECALL and self.nprobe < index.nlist:
+            nprobe = self.nprobe
+            self.nprobe = min(index.nlist, nprobe * 2)
+            self.apply_search_params(index)
+            new_recall = recall_at_k(search_fn, vectors, ids)
+            if new_recall - recall < 0.005:
+                # The remaining loss comes from the encoding, not from probing too few lists
+                self.nprobe = nprobe
+                self.apply_search_params(index)
                 break
-        
-        if index_id is not None:
-            # Remove the vector from the index
-            self.index.remove_ids(np.array([index_id]))
-            
-            # Update the file mapping
-            del self.file_mapping[index_id]
-            
-            # Save the updated index
-            self.save_index()
-    
+            recall = new_recall
+        return recall
+
+    def measure_encoding_error(self, index, ids: np.ndarray, vectors: Optional[np.ndarray] = None) -> float:
+        """Largest L2 distance between a sample of vectors and their decoded codes in index.
+
+        vectors are the full vectors of ids, read from the store when not given.
+        """
+        if not len(ids):
+            return 0.0
+        rng = np.random.default_rng(0)
+        positions = np.sort(rng.choice(len(ids), size=min(ENCODING_ERROR_SAMPLE_SIZE, len(ids)), replace=False))
+        full = vectors[positions] if vectors is not None else self.store.get(ids[positions])
+        decoded = index.reconstruct_batch(ids[positions])
+        return float(np.sqrt(((decoded - full) ** 2).sum(axis=1)).max())
+
+    def measure_recall(self, k: int = 10, sample_size: int = RECALL_SAMPLE_SIZE) -> float:
+        """Recall@k of the current index against exact search over the same vectors"""
+        def search_fn(queries, k):
+            return [[idx for idx, _ in hits] for hits in self.search_vectors(queries, k)]
+
+        ids, vectors = self.snapshot()
+        with self.lock:
+            recall = recall_at_k(search_fn, vectors, ids, k, sample_size)
+            if k == 10:
+                self.recall = recall
+        return recall
+
+    def bytes_per_vector(self) -> int:
+        """Approximate RAM per vector in the FAISS index"""
+        index = self.index if self.is_approximate else faiss.downcast_index(self.index.index)
+        return index.code_size + ID_OVERHEAD_BYTES
+
+    def describe(self) -> Dict[str, Any]:
+        """Index type and search settings, for statistics"""
+        with self.lock:
+            exact = not self.is_approximate and self.storage == 'float32'
+            recall = 1.0 if exact else self.recall
+            description = {
+                'index_type': 'flat',
+                'storage': self.storage,
+                'index_memory_bytes': self.index.ntotal * self.bytes_per_vector(),
+                'rerank_store_bytes': self.store.nbytes if self.store is not None else 0,
+                'recall': recall,
+                'recall_loss': None if recall is None else 1.0 - recall,
+                'encoding_error': self.encoding_error,
+                'building': self.journal is not None
+            }
+            if self.is_approximate:
+                quantizer = faiss.downcast_index(self.index.quantizer)
+                description.update({
+                    'index_type': 'ivf_hnsw' if isinstance(quantizer, faiss.IndexHNSW) else 'ivf',
+                    'nlist': self.index.nlist,
+                    'nprobe': self.nprobe,
+                    'ef_search': self.ef_search
+                })
+            return description
+
     def get_total_files(self) -> int:
         """Get the total number of files in the index"""
-        return len(self.file_mapping) 
\ No newline at end of file
+        return len(self.file_mapping)
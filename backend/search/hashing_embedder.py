@@ -0,0 +1,143 @@
+import re
+import zlib
+import hashlib
+import numpy as np
+from typing import List, Optional, Tuple
+from .embeddings import EmbeddingBackend
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """Model-free embeddings from hashed n-grams, TF-IDF and a random projection.
+
+    Word n-grams (and optionally character n-grams) are hashed into
+    n_features buckets, weighted with sublinear TF times IDF, and projected
+    to `dimension` with a sparse random projection: every bucket adds its
+    weight, with a random sign, to a few fixed output dimensions. All the
+    arithmetic runs on NumPy arrays for the whole batch.
+
+    Without fit()/partial_fit() every IDF is 1. Fitting changes the vector
+    space, which is reflected in model_id, so indexes built before the fit
+    are rebuilt.
+    """
+
+    def __init__(self, dimension: int = 384, n_features: int = 2 ** 18,
+                 ngram_range: Tuple[int, int] = (1, 2), char_ngram: Optional[int] = None,
+                 nonzeros_per_feature: int = 4, seed: int = 0):
+        if n_features & (n_features - 1):
+            raise ValueError("n_features must be a power of two")
+        self.dimension = dimension
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.char_ngram = char_ngram
+        self.nonzeros_per_feature = nonzeros_per_feature
+        self.seed = seed
+        self.document_frequency = np.zeros(n_features, dtype=np.int64)
+        self.document_count = 0
+        self._idf = None
+        self._projection = None
+
+    @property
+    def model_id(self) -> str:
+        config = f"hashing:{self.dimension}:{self.n_features}:{self.ngram_range[0]}-{self.ngram_range[1]}"
+        config += f":{self.char_ngram or 0}:{self.nonzeros_per_feature}:{self.seed}"
+        if self.document_count:
+            digest = hashlib.blake2b(self.document_frequency.tobytes(), digest_size=6).hexdigest()
+            config += f":idf-{digest}"
+        return config
+
+    def features(self, text: str) -> List[str]:
+        """Word n-grams (and character n-grams of each word) of a text"""
+        words = TOKEN_PATTERN.findall(text.lower())
+        features = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            if n == 1:
+                features.extend(words)
+            else:
+                features.extend(' '.join(words[i:i + n]) for i in range(len(words) - n + 1))
+        if self.char_ngram:
+            size = self.char_ngram
+            for word in words:
+                padded = f"<{word}>"
+                features.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+        return features
+
+    def hash_batch(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sparse term counts for a batch as (rows, buckets, counts)"""
+        rows = []
+        hashes = []
+        for row, text in enumerate(texts):
+            features = self.features(text)
+            rows.append(np.full(len(features), row, dtype=np.int64))
+            hashes.append(np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features),
+                                      dtype=np.int64, count=len(features)))
+        if not hashes:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        rows = np.concatenate(rows)
+        buckets = np.concatenate(hashes) & (self.n_features - 1)
+        keys, counts = np.unique(rows * self.n_features + buckets, return_counts=True)
+        return keys // self.n_features, keys % self.n_features, counts
+
+    def partial_fit(self, texts: List[str]) -> 'HashingEmbeddingBackend':
+        """Add the documents' n-grams to the document frequencies"""
+        _, buckets, _ = self.hash_batch(texts)
+        self.document_frequency += np.bincount(buckets, minlength=self.n_features)
+        self.document_count += len(texts)
+        self._idf = None
+        return self
+
+    def fit(self, texts: List[str]) -> 'HashingEmbeddingBackend':
+        """Recompute document frequencies from scratch"""
+        self.document_frequency[:] = 0
+        self.document_count = 0
+        return self.partial_fit(texts)
+
+    @property
+    def idf(self) -> np.ndarray:
+        if self._idf is None:
+            if self.document_count:
+                self._idf = (np.log((1.0 + self.document_count) / (1.0 + self.document_frequency)) + 1.0).astype(np.float32)
+            else:
+                self._idf = np.ones(self.n_features, dtype=np.float32)
+        return self._idf
+
+    @property
+    def projection(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Output dimensions and signs for every bucket, fixed by the seed"""
+        if self._projection is None:
+            rng = np.random.default_rng(self.seed)
+            shape = (self.n_features, self.nonzeros_per_feature)
+            dims = rng.integers(0, self.dimension, size=shape, dtype=np.int32)
+            signs = rng.integers(0, 2, size=shape, dtype=np.int8) * 2 - 1
+            self._projection = (dims, signs)
+        return self._projection
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        count = len(texts)
+        rows, buckets, counts = self.hash_batch(texts)
+        weights = (1.0 + np.log(counts)).astype(np.float32) * self.idf[buckets]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=count))
+        norms[norms == 0] = 1.0
+        weights /= norms[rows]
+
+        dims, signs = self.projection
+        contributions = weights[:, None] * signs[buckets] / np.sqrt(self.nonzeros_per_feature)
+        flat_index = rows[:, None] * self.dimension + dims[buckets]
+        vectors = np.bincount(flat_index.ravel(), weights=contributions.ravel(), minlength=count * self.dimension)
+        return vectors.reshape(count, self.dimension).astype(np.float32)
+
+    def save(self, path: str):
+        """Save the fitted document frequencies"""
+        np.savez_compressed(path, document_frequency=self.document_frequency,
+                            document_count=np.array(self.document_count))
+
+    def load(self, path: str) -> 'HashingEmbeddingBackend':
+        with np.load(path) as data:
+            if data['document_frequency'].shape != (self.n_features,):
+                raise ValueError(f"{path} was saved for a different n_features")
+            self.document_frequency = data['document_frequency'].astype(np.int64)
+            self.document_count = int(data['document_count'])
+        self._idf = None
+        return self
@@ -0,0 +1,333 @@
+import os
+import json
+import math
+import atexit
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .hashing_embedder import TOKEN_PATTERN
+from .path_mapping import PathMapping, mapping_files
+from .faiss_index import path_id
+
+# Longer tokens are truncated so the vocabulary fits a fixed-width array
+MAX_TOKEN_LENGTH = 32
+# Term frequencies are stored as uint16
+MAX_TERM_FREQUENCY = 65535
+# MaxScore pruning is only tried while the candidates found so far are few
+PRUNE_CHECK_LIMIT = 4096
+ARRAY_NAMES = ('terms', 'offsets', 'docs', 'frequencies', 'doc_ids', 'doc_lengths')
+
+def tokenize(text: str) -> List[str]:
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_PATTERN.findall(text.lower())]
+
+class LexicalIndex:
+    """BM25 inverted index over file names, summaries and extracted text.
+
+    Documents are keyed by file path and numbered internally. Postings
+    are stored compactly as CSR arrays: a sorted vocabulary, offsets into
+    int32 document numbers and uint16 term frequencies (file name tokens
+    count filename_boost times), all memory-mapped from disk. Documents
+    added since the last save are kept in small per-term lists; removed
+    and replaced documents are only flagged. save() merges everything
+    into new arrays with vectorised NumPy operations, dropping removed
+    documents, and switches a manifest to them atomically.
+
+    A query looks up each of its terms with a binary search over the
+    vocabulary and scores the posting lists with NumPy, so it needs no
+    model call and answers in well under a millisecond for typical
+    keyword queries.
+    """
+
+    def __init__(self, index_path: str = "data/search_index_lexical", k1: float = 1.2, b: float = 0.75,
+                 filename_boost: int = 3):
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+        self.filename_boost = filename_boost
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.dirty = False
+        self.clear()
+        self.load()
+        atexit.register(self.commit)
+
+    @property
+    def manifest_path(self) -> str:
+        return f"{self.index_path}.manifest"
+
+    def generation_prefix(self, generation: int) -> str:
+        return f"{self.index_path}.{generation}"
+
+    def clear(self):
+        self.terms = np.zeros(0, dtype=f"U{MAX_TOKEN_LENGTH}")
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.docs = np.zeros(0, dtype=np.int32)
+        self.frequencies = np.zeros(0, dtype=np.uint16)
+        self.doc_ids = np.zeros(0, dtype=np.int64)  # Path id of each document number
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.doc_count = 0
+        self.live_count = 0
+        self.total_length = 0.0
+        self.pending: Dict[str, Tuple[List[int], List[int]]] = {}  # term -> (docs, frequencies) since the last save
+        self.doc_numbers: Dict[int, int] = {}  # path id -> live document number
+        self.paths = PathMapping()
+
+    def load(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        try:
+            prefix = os.path.join(os.path.dirname(self.index_path), manifest['prefix'])
+            arrays = {name: np.load(f"{prefix}.{name}.npy", mmap_mode='r') for name in ARRAY_NAMES}
+            self.terms, self.offsets = arrays['terms'], arrays['offsets']
+            self.docs, self.frequencies = arrays['docs'], arrays['frequencies']
+            # Per-document arrays change as documents come and go, so they are copied
+            self.doc_ids = np.array(arrays['doc_ids'])
+            self.doc_lengths = np.array(arrays['doc_lengths'])
+            self.doc_count = len(self.doc_ids)
+            self.deleted = np.zeros(self.doc_count, dtype=bool)
+            self.live_count = self.doc_count
+            self.total_length = float(self.doc_lengths.sum())
+            self.doc_numbers = dict(zip(self.doc_ids.tolist(), range(self.doc_count)))
+            self.paths = PathMapping.load(f"{prefix}.paths")
+            self.generation = int(manifest['generation'])
+        except Exception as e:
+            print(f"Error loading lexical index: {str(e)}")
+            self.clear()
+
+    def document_tokens(self, file_path: str, summary: str = '', text: str = '') -> Dict[str, int]:
+        frequencies = {}
+        for token in tokenize(os.path.basename(file_path)):
+            frequencies[token] = frequencies.get(token, 0) + self.filename_boost
+        for token in tokenize(summary) + tokenize(text):
+            frequencies[token] = frequencies.get(token, 0) + 1
+        return frequencies
+
+    def grow_documents(self, count: int):
+        capacity = len(self.doc_ids)
+        if count <= capacity:
+            return
+        capacity = max(count, capacity * 2, 1024)
+        self.doc_ids = np.resize(self.doc_ids, capacity)
+        self.doc_lengths = np.resize(self.doc_lengths, capacity)
+        deleted = np.ones(capacity, dtype=bool)
+        deleted[:len(self.deleted)] = self.deleted
+        self.deleted = deleted
+
+    def add_documents(self, documents: List[Dict[str, str]]):
+        """Add or replace documents given as {"path", "summary", "text"} dicts"""
+        with self.lock:
+            for document in documents:
+                file_path = document['path']
+                index_id = path_id(file_path)
+                self.remove_document(index_id)
+                frequencies = self.document_tokens(file_path, document.get('summary') or '', document.get('text') or '')
+
+                doc = self.doc_count
+                self.grow_documents(doc + 1)
+                length = float(sum(frequencies.values()))
+                self.doc_ids[doc] = index_id
+                self.doc_lengths[doc] = length
+                self.deleted[doc] = False
+                self.doc_count += 1
+                self.live_count += 1
+                self.total_length += length
+                self.doc_numbers[index_id] = doc
+                self.paths[index_id] = file_path
+                for term, frequency in frequencies.items():
+                    docs, term_frequencies = self.pending.setdefault(term, ([], []))
+                    docs.append(doc)
+                    term_frequencies.append(min(frequency, MAX_TERM_FREQUENCY))
+            self.dirty = True
+
+    def remove_document(self, index_id: int) -> bool:
+        doc = self.doc_numbers.pop(index_id, None)
+        if doc is None:
+            return False
+        self.deleted[doc] = True
+        self.live_count -= 1
+        self.total_length -= float(self.doc_lengths[doc])
+        del self.paths[index_id]
+        self.dirty = True
+        return True
+
+    def remove(self, file_path: str) -> bool:
+        with self.lock:
+            return self.remove_document(path_id(file_path))
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Document numbers and frequencies of a term, saved and pending"""
+        position = int(np.searchsorted(self.terms, term))
+        if position < len(self.terms) and self.terms[position] == term:
+            start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+            docs, frequencies = self.docs[start:end], self.frequencies[start:end]
+        else:
+            docs, frequencies = self.docs[:0], self.frequencies[:0]
+        pending = self.pending.get(term)
+        if pending:
+            docs = np.concatenate((docs, np.array(pending[0], dtype=np.int32)))
+            frequencies = np.concatenate((frequencies, np.array(pending[1], dtype=np.uint16)))
+        return docs, frequencies
+
+    def term_scores(self, idf: float, docs: np.ndarray, frequencies: np.ndarray, average_length: float) -> np.ndarray:
+        frequencies = frequencies.astype(np.float32)
+        norms = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[docs] / average_length)
+        return idf * frequencies * (self.k1 + 1.0) / (frequencies + norms)
+
+    def search(self, query: str, k: int = 10, allowed_ids: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """BM25 ranking of the documents containing any query term.
+
+        allowed_ids (sorted path ids, e.g. from MetadataStore.select)
+        restricts the results to those files.
+
+        Terms are scored rarest first (MaxScore): once the best possible
+        score of the remaining terms is below the current k-th score, they
+        can no longer bring new documents into the top k and are only
+        looked up for the existing candidates, by binary search in their
+        doc-sorted postings.
+        """
+        with self.lock:
+            if not self.live_count:
+                return []
+            average_length = self.total_length / self.live_count
+            terms = []
+            for term in set(tokenize(query)):
+                docs, frequencies = self.postings(term)
+                if len(docs):
+                    # Document frequency counts removed documents until the next save, as Lucene does
+                    idf = math.log(1.0 + (self.live_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                    terms.append((idf, docs, frequencies))
+            if not terms:
+                return []
+            terms.sort(key=lambda item: -item[0])
+            excluded = self.deleted[:self.doc_count]
+            if allowed_ids is not None:
+                excluded = excluded | ~np.isin(self.doc_ids[:self.doc_count], allowed_ids)
+            # Highest score the terms from i onwards can add to a document
+            remaining_bounds = np.cumsum([idf * (self.k1 + 1.0) for idf, _, _ in terms][::-1])[::-1].tolist() + [0.0]
+
+            # A document appears at most once in each term's postings, so
+            # plain fancy-index adds into a dense array are safe
+            scores = np.zeros(self.doc_count, dtype=np.float32)
+            found = []
+            found_count = 0
+            candidates = None
+            for position, (idf, docs, frequencies) in enumerate(terms):
+                if candidates is None:
+                    scores[docs] += self.term_scores(idf, docs, frequencies, average_length)
+                    found.append(docs)
+                    found_count += len(docs)
+                    if remaining_bounds[position + 1] > 0 and found_count <= PRUNE_CHECK_LIMIT:
+                        current = np.unique(np.concatenate(found))
+                        current = current[~excluded[current]]
+                        if len(current) >= k:
+                            threshold = np.partition(scores[current], len(current) - k)[len(current) - k]
+                            if remaining_bounds[position + 1] < threshold:
+                                candidates = current
+                else:
+                    matches = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                    hit = docs[matches] == candidates
+                    matches = matches[hit]
+                    scores[candidates[hit]] += self.term_scores(idf, docs[matches], frequencies[matches], average_length)
+
+            if candidates is None:
+                candidates = np.concatenate(found)
+                candidates = candidates[~excluded[candidates]]
+                # Each document is listed at most once per term, so the best
+                # k * terms entries contain the k best distinct documents
+                count = min(len(candidates), k * len(found))
+                if count < len(candidates):
+                    candidates = candidates[np.argpartition(-scores[candidates], count - 1)[:count]]
+                candidates = np.unique(candidates)
+            top = candidates[np.argsort(-scores[candidates], kind='stable')[:k]]
+            return [(self.paths[int(self.doc_ids[doc])], float(scores[doc])) for doc in top]
+
+    def merged_arrays(self) -> Dict[str, np.ndarray]:
+        """Saved and pending postings merged into new CSR arrays without removed documents"""
+        base_terms = np.repeat(np.arange(len(self.terms)), np.diff(np.asarray(self.offsets)))
+        pending_terms = np.array(sorted(self.pending), dtype=self.terms.dtype)
+        vocabulary = np.union1d(np.asarray(self.terms), pending_terms)
+
+        term_parts = [np.searchsorted(vocabulary, np.asarray(self.terms))[base_terms]]
+        doc_parts = [np.asarray(self.docs)]
+        frequency_parts = [np.asarray(self.frequencies)]
+        for term in pending_terms.tolist():
+            docs, frequencies = self.pending[term]
+            term_parts.append(np.full(len(docs), np.searchsorted(vocabulary, term), dtype=np.int64))
+            doc_parts.append(np.array(docs, dtype=np.int32))
+            frequency_parts.append(np.array(frequencies, dtype=np.uint16))
+        term_numbers = np.concatenate(term_parts).astype(np.int64)
+        docs = np.concatenate(doc_parts)
+        frequencies = np.concatenate(frequency_parts)
+
+        # Renumber the live documents 0..n-1 and drop postings of removed ones
+        live = ~self.deleted[:self.doc_count]
+        renumber = np.cumsum(live) - 1
+        keep = live[docs]
+        term_numbers, docs, frequencies = term_numbers[keep], renumber[docs[keep]].astype(np.int32), frequencies[keep]
+
+        order = np.lexsort((docs, term_numbers))
+        term_numbers, docs, frequencies = term_numbers[order], docs[order], frequencies[order]
+        used = np.bincount(term_numbers, minlength=len(vocabulary)) > 0
+        vocabulary = vocabulary[used]
+        term_numbers = (np.cumsum(used) - 1)[term_numbers]
+        offsets = np.searchsorted(term_numbers, np.arange(len(vocabulary) + 1)).astype(np.int64)
+        return {
+            'terms': vocabulary,
+            'offsets': offsets,
+            'docs': docs,
+            'frequencies': frequencies,
+            'doc_ids': self.doc_ids[:self.doc_count][live],
+            'doc_lengths': self.doc_lengths[:self.doc_count][live]
+        }
+
+    def save(self):
+        """Write a merged generation and switch the manifest to it"""
+        with self.lock:
+            try:
+                directory = os.path.dirname(self.index_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                generation = self.generation + 1
+                prefix = self.generation_prefix(generation)
+                for name, array in self.merged_arrays().items():
+                    with open(f"{prefix}.{name}.npy", 'wb') as f:
+                        np.save(f, array)
+                        f.flush()
+                        os.fsync(f.fileno())
+                self.paths.save(f"{prefix}.paths")
+
+                temp_path = f"{self.manifest_path}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump({'generation': generation, 'prefix': os.path.basename(prefix)}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.manifest_path)
+
+                previous = self.generation_prefix(self.generation)
+                self.clear()
+                self.load()
+                self.dirty = False
+                for path in [f"{previous}.{name}.npy" for name in ARRAY_NAMES] + list(mapping_files(f"{previous}.paths")):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            except Exception as e:
+                print(f"Error saving lexical index: {str(e)}")
+
+    def commit(self):
+        """Save if anything changed since the last save"""
+        with self.lock:
+            if self.dirty:
+                self.save()
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    def term_count(self) -> int:
+        with self.lock:
+            return len(np.union1d(np.asarray(self.terms), np.array(list(self.pending), dtype=self.terms.dtype)))
@@ -0,0 +1,310 @@
+import os
+import json
+import bisect
+import atexit
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from .faiss_index import path_id
+
+COLUMNS = {
+    'ids': np.int64,
+    'sizes': np.int64,
+    'mtimes': np.float64,
+    'extension_codes': np.int32,
+    'folder_codes': np.int32,
+}
+FILTER_KEYS = ('extensions', 'folders', 'min_size', 'max_size', 'modified_after', 'modified_before')
+# Folder bitmaps computed for queries are kept for this many folders
+MAX_CACHED_FOLDERS = 64
+
+def file_extension(file_path: str) -> str:
+    return os.path.splitext(file_path)[1].lower().lstrip('.')
+
+def file_folder(file_path: str) -> str:
+    return os.path.dirname(file_path).rstrip('/\\')
+
+def as_list(value) -> list:
+    return [value] if isinstance(value, (str, int, float)) else list(value)
+
+def prefix_range(sorted_values: List[str], prefix: str) -> Tuple[int, int]:
+    """Positions of the values that start with prefix in a sorted list"""
+    return bisect.bisect_left(sorted_values, prefix), bisect.bisect_left(sorted_values, prefix + '\uffff')
+
+def set_bit(bitmap: np.ndarray, row: int):
+    bitmap[row >> 3] |= np.uint8(1 << (row & 7))
+
+class MetadataStore:
+    """Columnar file metadata (extension, folder, size, mtime) for filtered search.
+
+    One row per file, keyed by the same path ids as the FAISS index.
+    Filters are evaluated on packed row bitmaps (little-endian bit order):
+    one bitmap per extension, maintained as rows are added; one per
+    queried folder, derived from folder codes that are numbered in sorted
+    folder order at every save so that a folder and all its subfolders
+    are a contiguous code range; and size and mtime ranges found by
+    binary search in argsort orders of those columns. Replaced and removed
+    rows are flagged dead and dropped at the next save, which writes a new
+    generation of .npy columns behind an atomically replaced manifest.
+    """
+
+    def __init__(self, index_path: str = "data/search_index_metadata"):
+        self.index_path = index_path
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.dirty = False
+        self.clear()
+        self.load()
+        atexit.register(self.commit)
+
+    @property
+    def manifest_path(self) -> str:
+        return f"{self.index_path}.manifest"
+
+    def generation_prefix(self, generation: int) -> str:
+        return f"{self.index_path}.{generation}"
+
+    def clear(self):
+        self.columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.live = np.zeros(0, dtype=bool)
+        self.count = 0
+        self.live_count = 0
+        self.rows: Dict[int, int] = {}  # path id -> live row
+        self.extensions: List[str] = []
+        self.extension_numbers: Dict[str, int] = {}
+        self.folders: List[str] = []  # folders[:sorted_folder_count] are sorted
+        self.folder_numbers: Dict[str, int] = {}
+        self.sorted_folder_count = 0
+        self.extension_bitmaps: Dict[int, np.ndarray] = {}
+        self.folder_bitmaps: Dict[str, np.ndarray] = {}
+        self.sorted_orders: Dict[str, np.ndarray] = {}
+
+    def load(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        try:
+            prefix = os.path.join(os.path.dirname(self.index_path), manifest['prefix'])
+            self.columns = {name: np.load(f"{prefix}.{name}.npy") for name in COLUMNS}
+            self.count = len(self.columns['ids'])
+            self.live = np.ones(self.count, dtype=bool)
+            self.live_count = self.count
+            self.rows = dict(zip(self.columns['ids'].tolist(), range(self.count)))
+            with open(f"{prefix}.vocabulary.json", 'r') as f:
+                vocabulary = json.load(f)
+            self.extensions = vocabulary['extensions']
+            self.extension_numbers = {extension: code for code, extension in enumerate(self.extensions)}
+            self.folders = vocabulary['folders']
+            self.folder_numbers = {folder: code for code, folder in enumerate(self.folders)}
+            self.sorted_folder_count = len(self.folders)
+            for code in range(len(self.extensions)):
+                self.extension_bitmaps[code] = np.packbits(self.columns['extension_codes'] == code, bitorder='little')
+            self.generation = int(manifest['generation'])
+        except Exception as e:
+            print(f"Error loading metadata store: {str(e)}")
+            self.clear()
+
+    def grow(self, count: int):
+        capacity = len(self.live)
+        if count <= capacity:
+            return
+        capacity = max(count, capacity * 2, 1024)
+        for name in COLUMNS:
+            self.columns[name] = np.resize(self.columns[name], capacity)
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self.live)] = self.live
+        self.live = live
+        bitmap_size = (capacity + 7) // 8
+        for bitmaps in (self.extension_bitmaps, self.folder_bitmaps):
+            for key, bitmap in bitmaps.items():
+                bitmaps[key] = np.concatenate((bitmap, np.zeros(bitmap_size - len(bitmap), dtype=np.uint8)))
+
+    def code(self, vocabulary: List[str], numbers: Dict[str, int], value: str) -> int:
+        number = numbers.get(value)
+        if number is None:
+            number = numbers[value] = len(vocabulary)
+            vocabulary.append(value)
+        return number
+
+    def add_files(self, entries: List[Dict[str, Any]]):
+        """Add or replace files given as {"path", "size", "mtime"} dicts"""
+        with self.lock:
+            for entry in entries:
+                file_path = entry['path']
+                index_id = path_id(file_path)
+                self.remove_row(index_id)
+                row = self.count
+                self.grow(row + 1)
+                extension_code = self.code(self.extensions, self.extension_numbers, file_extension(file_path))
+                folder = file_folder(file_path)
+                self.columns['ids'][row] = index_id
+                self.columns['sizes'][row] = int(entry.get('size') or 0)
+                self.columns['mtimes'][row] = float(entry.get('mtime') or 0.0)
+                self.columns['extension_codes'][row] = extension_code
+                self.columns['folder_codes'][row] = self.code(self.folders, self.folder_numbers, folder)
+                self.live[row] = True
+                self.rows[index_id] = row
+                self.count += 1
+                self.live_count += 1
+
+                bitmap = self.extension_bitmaps.get(extension_code)
+                if bitmap is None:
+                    bitmap = self.extension_bitmaps[extension_code] = np.zeros((len(self.live) + 7) // 8, dtype=np.uint8)
+                set_bit(bitmap, row)
+                for prefix, bitmap in self.folder_bitmaps.items():
+                    if self.folder_matches(folder, prefix):
+                        set_bit(bitmap, row)
+            self.sorted_orders.clear()
+            self.dirty = True
+
+    def remove_row(self, index_id: int) -> bool:
+        row = self.rows.pop(index_id, None)
+        if row is None:
+            return False
+        self.live[row] = False
+        self.live_count -= 1
+        self.dirty = True
+        return True
+
+    def remove(self, file_path: str) -> bool:
+        with self.lock:
+            return self.remove_row(path_id(file_path))
+
+    @staticmethod
+    def folder_matches(folder: str, prefix: str) -> bool:
+        return folder == prefix or folder.startswith(prefix + '/') or folder.startswith(prefix + '\\')
+
+    def folder_bitmap(self, prefix: str) -> np.ndarray:
+        """Rows in prefix or any folder below it"""
+        prefix = prefix.rstrip('/\\')
+        bitmap = self.folder_bitmaps.get(prefix)
+        if bitmap is not None:
+            return bitmap
+        sorted_folders = self.folders[:self.sorted_folder_count]
+        codes = self.columns['folder_codes'][:self.count]
+        mask = np.zeros(self.count, dtype=bool)
+        exact = self.folder_numbers.get(prefix)
+        if exact is not None:
+            mask |= codes == exact
+        for separator in ('/', '\\'):
+            start, end = prefix_range(sorted_folders, prefix + separator)
+            mask |= (codes >= start) & (codes < end)
+        # Folders first seen since the last save are not in sorted order
+        unsorted = [code for code in range(self.sorted_folder_count, len(self.folders))
+                    if self.folder_matches(self.folders[code], prefix)]
+        if unsorted:
+            mask |= np.isin(codes, unsorted)
+        bitmap = self.pack(mask)
+        if len(self.folder_bitmaps) >= MAX_CACHED_FOLDERS:
+            self.folder_bitmaps.pop(next(iter(self.folder_bitmaps)))
+        self.folder_bitmaps[prefix] = bitmap
+        return bitmap
+
+    def pack(self, mask: np.ndarray) -> np.ndarray:
+        """Pack a row mask into a bitmap the size of the columns"""
+        bitmap = np.packbits(mask, bitorder='little')
+        size = (len(self.live) + 7) // 8
+        return np.concatenate((bitmap, np.zeros(size - len(bitmap), dtype=np.uint8)))
+
+    def range_bitmap(self, column: str, low: Optional[float], high: Optional[float]) -> np.ndarray:
+        """Rows with low <= value <= high, by binary search in the column's sorted order"""
+        order = self.sorted_orders.get(column)
+        if order is None:
+            order = self.sorted_orders[column] = np.argsort(self.columns[column][:self.count], kind='stable')
+        values = self.columns[column][:self.count][order]
+        start = 0 if low is None else int(np.searchsorted(values, low, side='left'))
+        end = self.count if high is None else int(np.searchsorted(values, high, side='right'))
+        mask = np.zeros(self.count, dtype=bool)
+        mask[order[start:end]] = True
+        return self.pack(mask)
+
+    def select(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Sorted path ids of the files matching every filter.
+
+        filters may contain 'extensions' (e.g. ["pdf", ".docx"]) and
+        'folders' (files in or below any of them), each matching any of
+        their values, plus 'min_size'/'max_size' in bytes and
+        'modified_after'/'modified_before' as Unix timestamps (inclusive).
+        """
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown filters {', '.join(sorted(unknown))}, expected {', '.join(FILTER_KEYS)}")
+        with self.lock:
+            bitmap = self.pack(self.live[:self.count])
+            if filters.get('extensions') is not None:
+                matches = np.zeros_like(bitmap)
+                for extension in as_list(filters['extensions']):
+                    code = self.extension_numbers.get(str(extension).lower().lstrip('.'))
+                    if code is not None:
+                        matches |= self.extension_bitmaps[code]
+                bitmap &= matches
+            if filters.get('folders') is not None:
+                matches = np.zeros_like(bitmap)
+                for folder in as_list(filters['folders']):
+                    matches |= self.folder_bitmap(folder)
+                bitmap &= matches
+            if filters.get('min_size') is not None or filters.get('max_size') is not None:
+                bitmap &= self.range_bitmap('sizes', filters.get('min_size'), filters.get('max_size'))
+            if filters.get('modified_after') is not None or filters.get('modified_before') is not None:
+                bitmap &= self.range_bitmap('mtimes', filters.get('modified_after'), filters.get('modified_before'))
+            rows = np.flatnonzero(np.unpackbits(bitmap, count=self.count, bitorder='little'))
+            return np.sort(self.columns['ids'][rows])
+
+    def save(self):
+        """Write live rows as a new generation, folders renumbered in sorted order"""
+        with self.lock:
+            try:
+                directory = os.path.dirname(self.index_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                live = self.live[:self.count]
+                columns = {name: self.columns[name][:self.count][live] for name in COLUMNS}
+                folder_codes, folder_positions = np.unique(columns['folder_codes'], return_inverse=True)
+                folders = [self.folders[code] for code in folder_codes.tolist()]
+                order = np.argsort(np.array(folders, dtype=object), kind='stable')
+                rank = np.empty(len(order), dtype=np.int32)
+                rank[order] = np.arange(len(order), dtype=np.int32)
+                columns['folder_codes'] = rank[folder_positions].astype(np.int32)
+                vocabulary = {'extensions': self.extensions, 'folders': [folders[position] for position in order.tolist()]}
+
+                generation = self.generation + 1
+                prefix = self.generation_prefix(generation)
+                for name, column in columns.items():
+                    with open(f"{prefix}.{name}.npy", 'wb') as f:
+                        np.save(f, column)
+                        f.flush()
+                        os.fsync(f.fileno())
+                with open(f"{prefix}.vocabulary.json", 'w') as f:
+                    json.dump(vocabulary, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                temp_path = f"{self.manifest_path}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump({'generation': generation, 'prefix': os.path.basename(prefix)}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.manifest_path)
+
+                previous = self.generation_prefix(self.generation)
+                self.clear()
+                self.load()
+                self.dirty = False
+                for path in [f"{previous}.{name}.npy" for name in COLUMNS] + [f"{previous}.vocabulary.json"]:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            except Exception as e:
+                print(f"Error saving metadata store: {str(e)}")
+
+    def commit(self):
+        """Save if anything changed since the last save"""
+        with self.lock:
+            if self.dirty:
+                self.save()
+
+    def __len__(self) -> int:
+        return self.live_count
@@ -0,0 +1,155 @@
+import os
+import numpy as np
+from typing import Dict, Iterator, Optional, Tuple
+
+EMPTY_IDS = np.zeros(0, dtype=np.int64)
+EMPTY_OFFSETS = np.zeros(1, dtype=np.int64)
+EMPTY_BLOB = np.zeros(0, dtype=np.uint8)
+
+def mapping_files(prefix: str) -> Tuple[str, str, str]:
+    return f"{prefix}.ids.npy", f"{prefix}.offsets.npy", f"{prefix}.paths"
+
+def gather_segments(blob: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenate blob[start:start + length] for every segment, without a Python loop"""
+    total = int(lengths.sum())
+    if total == 0:
+        return EMPTY_BLOB
+    # Index of every output byte: its segment's start plus its position within the segment
+    segment_starts = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return blob[segment_starts + np.arange(total)]
+
+def write_synced(path: str, data: np.ndarray, as_npy: bool = True):
+    with open(path, 'wb') as f:
+        if as_npy:
+            np.save(f, data)
+        else:
+            f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+class PathMapping:
+    """Index id -> file path mapping stored in a compact, memory-mapped form.
+
+    On disk a mapping is three files: the ids sorted ascending
+    (<prefix>.ids.npy), the offset of each path in a byte blob
+    (<prefix>.offsets.npy, one entry more than there are ids) and the
+    UTF-8 paths back to back (<prefix>.paths). All three are opened
+    memory-mapped, so loading costs nothing up front, a lookup is a
+    binary search, and processes reading the same generation share the
+    pages. Changes since loading live in a small overlay (added or
+    replaced entries, removed ids) that save() merges into new files.
+    """
+
+    def __init__(self, ids: np.ndarray = EMPTY_IDS, offsets: np.ndarray = EMPTY_OFFSETS,
+                 blob: np.ndarray = EMPTY_BLOB):
+        self.base_ids = ids
+        self.base_offsets = offsets
+        self.base_blob = blob
+        self.added: Dict[int, str] = {}
+        self.removed = set()  # Base ids removed or replaced by an added entry
+        self.count = len(ids)
+
+    @classmethod
+    def load(cls, prefix: str) -> 'PathMapping':
+        ids_file, offsets_file, paths_file = mapping_files(prefix)
+        ids = np.load(ids_file, mmap_mode='r')
+        offsets = np.load(offsets_file, mmap_mode='r')
+        if os.path.getsize(paths_file):
+            blob = np.memmap(paths_file, dtype=np.uint8, mode='r')
+        else:
+            blob = EMPTY_BLOB  # Zero-length files cannot be mapped
+        if len(offsets) != len(ids) + 1 or int(offsets[-1]) != len(blob):
+            raise ValueError(f"Inconsistent path mapping files at {prefix}")
+        return cls(ids, offsets, blob)
+
+    @classmethod
+    def from_dict(cls, mapping: Dict[int, str]) -> 'PathMapping':
+        result = cls()
+        for index_id, file_path in mapping.items():
+            result[index_id] = file_path
+        return result
+
+    def base_position(self, index_id: int) -> Optional[int]:
+        position = int(np.searchsorted(self.base_ids, index_id))
+        if position < len(self.base_ids) and int(self.base_ids[position]) == index_id:
+            return position
+        return None
+
+    def in_base(self, index_id: int) -> bool:
+        return index_id not in self.removed and self.base_position(index_id) is not None
+
+    def __contains__(self, index_id: int) -> bool:
+        return index_id in self.added or self.in_base(index_id)
+
+    def get(self, index_id: int, default: Optional[str] = None) -> Optional[str]:
+        file_path = self.added.get(index_id)
+        if file_path is not None:
+            return file_path
+        if index_id in self.removed:
+            return default
+        position = self.base_position(index_id)
+        if position is None:
+            return default
+        start, end = int(self.base_offsets[position]), int(self.base_offsets[position + 1])
+        return bytes(self.base_blob[start:end]).decode('utf-8')
+
+    def __getitem__(self, index_id: int) -> str:
+        file_path = self.get(index_id)
+        if file_path is None:
+            raise KeyError(index_id)
+        return file_path
+
+    def __setitem__(self, index_id: int, file_path: str):
+        if index_id not in self:
+            self.count += 1
+        if self.base_position(index_id) is not None:
+            self.removed.add(index_id)
+        self.added[index_id] = file_path
+
+    def __delitem__(self, index_id: int):
+        if index_id not in self:
+            raise KeyError(index_id)
+        self.added.pop(index_id, None)
+        if self.base_position(index_id) is not None:
+            self.removed.add(index_id)
+        self.count -= 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    def kept_base_positions(self) -> np.ndarray:
+        if not self.removed:
+            return np.arange(len(self.base_ids))
+        removed = np.fromiter(self.removed, dtype=np.int64, count=len(self.removed))
+        return np.flatnonzero(~np.isin(self.base_ids, removed))
+
+    def ids(self) -> np.ndarray:
+        """All ids, sorted"""
+        added = np.fromiter(self.added.keys(), dtype=np.int64, count=len(self.added))
+        return np.union1d(np.asarray(self.base_ids)[self.kept_base_positions()], added)
+
+    def items(self) -> Iterator[Tuple[int, str]]:
+        for index_id in self.ids().tolist():
+            yield index_id, self[index_id]
+
+    def save(self, prefix: str):
+        """Write the merged mapping to <prefix>.ids.npy/.offsets.npy/.paths, synced to disk"""
+        kept = self.kept_base_positions()
+        base_offsets = np.asarray(self.base_offsets, dtype=np.int64)
+        starts = base_offsets[kept]
+        lengths = base_offsets[kept + 1] - starts
+        base_blob = gather_segments(np.asarray(self.base_blob), starts, lengths)
+
+        added_paths = [file_path.encode('utf-8') for file_path in self.added.values()]
+        added_lengths = np.fromiter((len(path) for path in added_paths), dtype=np.int64, count=len(added_paths))
+        blob = np.concatenate((base_blob, np.frombuffer(b''.join(added_paths), dtype=np.uint8)))
+        ids = np.concatenate((np.asarray(self.base_ids)[kept],
+                              np.fromiter(self.added.keys(), dtype=np.int64, count=len(self.added))))
+        lengths = np.concatenate((lengths, added_lengths))
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else EMPTY_IDS
+
+        order = np.argsort(ids, kind='stable')
+        ids_file, offsets_file, paths_file = mapping_files(prefix)
+        write_synced(ids_file, ids[order])
+        write_synced(offsets_file, np.concatenate(([0], np.cumsum(lengths[order]))).astype(np.int64))
+        write_synced(paths_file, gather_segments(blob, starts[order], lengths[order]), as_npy=False)
@@ -1,18 +1,132 @@
 import os
-from typing import List, Dict, Any, Tuple
-from .embeddings import EmbeddingsGenerator
-from .faiss_index import FaissIndexManager
+import time
+import atexit
+import threading
+import numpy as np
+from typing import List, Dict, Any, Tuple, Optional
+from .embeddings import EmbeddingsGenerator, EmbeddingBackend, OllamaEmbeddingBackend
+from .hashing_embedder import HashingEmbeddingBackend
+from .embedding_cache import EmbeddingCache
+from .faiss_index import FaissIndexManager, similarity, DEFAULT_FLUSH_THRESHOLD, DEFAULT_FLUSH_INTERVAL
+from .lexical_index import LexicalIndex, tokenize
+from .metadata_store import MetadataStore
+from .chunking import ChunkIndex, CHUNK_AGGREGATIONS
 import logging
 
 logger = logging.getLogger(__name__)
 
+SEARCH_MODES = ('auto', 'hybrid', 'vector', 'lexical')
+# Reciprocal-rank fusion constant: a result at rank r contributes 1 / (RRF_K + r)
+RRF_K = 60
+# Results taken from each ranking before fusing, per requested result
+FUSION_DEPTH_FACTOR = 4
+# Cosine similarity threshold_search uses when none is given
+DEFAULT_MIN_SIMILARITY = 0.8
+
+def is_keyword_query(query: str) -> bool:
+    """Quoted queries and identifiers like "CS101" or "INV-2024-0042".
+
+    A query is an identifier when every whitespace-separated word contains
+    a digit; parts joined by hyphens, underscores or dots ("INV-0007",
+    "tax_2023_final") count as one word.
+    """
+    stripped = query.strip()
+    if len(stripped) > 1 and stripped[0] == stripped[-1] and stripped[0] in '"\'':
+        return True
+    words = [tokens for tokens in (tokenize(word) for word in stripped.split()) if tokens]
+    return bool(words) and all(any(char.isdigit() for token in tokens for char in token) for tokens in words)
+
+def file_metadata(file_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Path, size and mtime of a file, from file_info or the file system"""
+    size, mtime = file_info.get('size'), file_info.get('mtime')
+    if size is None or mtime is None:
+        try:
+            stat = os.stat(file_info['path'])
+            size = stat.st_size if size is None else size
+            mtime = stat.st_mtime if mtime is None else mtime
+        except OSError:
+            pass
+    return {'path': file_info['path'], 'size': size, 'mtime': mtime}
+
+def file_vector_hit(file_path: str, distance: float) -> Dict[str, Any]:
+    """Vector hit, shaped like a ChunkIndex hit, for a file that only has a file vector"""
+    return {'file_path': file_path, 'score': similarity(distance), 'similarity': similarity(distance),
+            'distance': distance, 'passage': None, 'passage_start': None, 'passage_end': None}
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Combine ranked lists of file paths by summing 1 / (k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, file_path in enumerate(ranking, start=1):
+            scores[file_path] = scores.get(file_path, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def select_embedding_backend(client) -> EmbeddingBackend:
+    """Ollama embeddings when the server answers and has the model, else the built-in hashing embedder"""
+    if client is not None:
+        backend = OllamaEmbeddingBackend(client)
+        try:
+            backend.embed(['ping'])
+            return backend
+        except Exception as e:
+            logger.warning(f"Ollama embeddings unavailable ({str(e)}); using the hashing embedder")
+    return HashingEmbeddingBackend()
+
 class SearchManager:
-    def __init__(self, client):
+    def __init__(self, client, embedding_backend: Optional[EmbeddingBackend] = None, index_path: str = "data/search_index",
+                 embedding_cache_dir: Optional[str] = None, index_storage: str = 'float32',
+                 chunk_aggregation: str = 'max', flush_threshold: int = DEFAULT_FLUSH_THRESHOLD,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        if chunk_aggregation not in CHUNK_AGGREGATIONS:
+            raise ValueError(f"Unknown chunk aggregation {chunk_aggregation!r}, expected one of {', '.join(CHUNK_AGGREGATIONS)}")
         self.client = client
-        self.embeddings_generator = EmbeddingsGenerator(client)
-        self.index_manager = FaissIndexManager()
+        self.chunk_aggregation = chunk_aggregation
+        # The stores are written together once this many files have changed
+        # or the oldest change is flush_interval seconds old (see mark_changed)
+        self.flush_threshold = flush_threshold
+        self.flush_interval = flush_interval
+        self.pending_changes = 0
+        self.first_pending_time = None
+        self.commit_lock = threading.Lock()
+        # Independent of the embedding model, so shared by every backend
+        self.lexical_index = LexicalIndex(f"{index_path}_lexical")
+        self.metadata_store = MetadataStore(f"{index_path}_metadata")
+        if embedding_backend is None:
+            embedding_backend, index_path = self.select_backend(client, index_path)
+        self.embedding_cache = EmbeddingCache(
+            embedding_cache_dir or os.path.join(os.path.dirname(index_path) or '.', 'embedding_cache'),
+            embedding_backend.model_id,
+            embedding_backend.dimension
+        )
+        self.embeddings_generator = EmbeddingsGenerator(client, embedding_backend, self.embedding_cache)
+        self.index_manager = FaissIndexManager(
+            index_path,
+            dimension=self.embeddings_generator.dimension,
+            model_id=self.embeddings_generator.model_id,
+            storage=index_storage
+        )
+        # Chunk vectors depend on the model, so they follow the model's index path
+        self.chunk_index = ChunkIndex(
+            f"{index_path}_chunks",
+            dimension=self.embeddings_generator.dimension,
+            model_id=self.embeddings_generator.model_id,
+            storage=index_storage
+        )
+        atexit.register(self.commit)
         self.setup_logging()
     
+    @staticmethod
+    def select_backend(client, index_path: str) -> Tuple[EmbeddingBackend, str]:
+        """Use Ollama embeddings when the server answers, else the built-in hashing embedder.
+        
+        The fallback gets its own index file so the Ollama index survives
+        while the server is down.
+        """
+        backend = select_embedding_backend(client)
+        if isinstance(backend, HashingEmbeddingBackend):
+            return backend, f"{index_path}_hashing"
+        return backend, index_path
+    
     def setup_logging(self):
         """Setup logging configuration"""
         logging.basicConfig(
@@ -20,74 +134,294 @@ class SearchManager:
             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
     
-    def index_file(self, file_path: str, content: str) -> bool:
-        """Index a single file"""
-        try:
-            # Generate embedding for the file content
-            embedding = self.embeddings_generator.generate_embedding(content)
-            if embedding is None:
-                logger.error(f"Failed to generate embedding for {file_path}")
-                return False
-            
-            # Add to FAISS index
-            self.index_manager.add_vectors([embedding], [file_path])
-            logger.info(f"Successfully indexed {file_path}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error indexing {file_path}: {str(e)}")
-            return False
+    def index_file(self, file_path: str, content: str, summary: Optional[str] = None) -> bool:
+        """Index a single file; see index_files"""
+        return self.index_files([{'path': file_path, 'content': content, 'summary': summary}])[file_path]
     
     def index_files(self, files: List[Dict[str, str]]) -> Dict[str, bool]:
-        """Index multiple files"""
-        results = {}
-        for file_info in files:
-            file_path = file_info['path']
-            content = file_info['content']
-            success = self.index_file(file_path, content)
-            results[file_path] = success
+        """Index multiple files with batched embedding requests
+        
+        Each entry has 'path' and 'content' and optionally 'summary', 'size'
+        and 'mtime' (read from the file when missing). Contents are split into
+        chunks for the chunk index, and all new chunks are embedded together;
+        files get no whole-content vector, and a file vector left from before
+        chunking is dropped once the file is chunked. Files whose chunks were
+        all embedded also go to the lexical index and the metadata store; a
+        file that failed is removed from every index, so it is never
+        searchable with missing vectors.
+        """
+        results = {file_info['path']: False for file_info in files}
+        try:
+            chunked = self.chunk_index.update([(file_info['path'], file_info['content']) for file_info in files],
+                                              self.embeddings_generator.generate_embeddings_batch)
+            indexed = [file_info for file_info in files if chunked[file_info['path']]]
+            for file_info in files:
+                file_path = file_info['path']
+                if not chunked[file_path]:
+                    logger.error(f"Failed to embed some chunks of {file_path}")
+                    self.discard_file(file_path)
+                else:
+                    self.index_manager.remove_file(file_path)
+            self.lexical_index.add_documents([
+                {'path': file_info['path'], 'summary': file_info.get('summary'), 'text': file_info['content']}
+                for file_info in indexed
+            ])
+            self.metadata_store.add_files([file_metadata(file_info) for file_info in indexed])
+            for file_info in indexed:
+                results[file_info['path']] = True
+            logger.info(f"Successfully indexed {len(indexed)} files")
+        except Exception as e:
+            logger.error(f"Error indexing files: {str(e)}")
+            for file_path in results:
+                self.discard_file(file_path)
+        self.mark_changed(len(files))
         return results
     
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Search for files using a text query"""
+    def search(self, query: str, k: int = 5, mode: str = 'auto',
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search for files using a text query
+        
+        mode is one of:
+        - 'lexical': BM25 over file names, summaries and text; no model call
+        - 'vector': nearest neighbours of the query embedding
+        - 'hybrid': both rankings combined with reciprocal-rank fusion
+        - 'auto': 'lexical' for keyword queries (see is_keyword_query) that
+          have lexical hits, else 'hybrid'
+        
+        filters limit results to matching files, e.g.
+        {"extensions": ["pdf"], "folders": ["/Users/me/Academic"],
+        "modified_after": 1696118400}; see MetadataStore.select. They are
+        applied inside both searches, so up to k matching files are returned.
+        
+        Vector and hybrid results carry the file's best-matching 'passage',
+        its 'passage_start' offset in the indexed content and its cosine
+        'similarity' to the query. To get every file above a similarity
+        instead of the top k, use threshold_search.
+        """
+        return self.search_many([query], k, mode, filters)[0]
+    
+    def search_many(self, queries: List[str], k: int = 5, mode: str = 'auto',
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Run several searches at once; returns one result list per query
+        
+        Same modes and filters as search(), but the queries that need a
+        vector search are embedded in one batch and looked up with a single
+        matrix search, which FAISS spreads over its thread pool.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {', '.join(SEARCH_MODES)}")
         try:
-            # Generate embedding for the query
-            query_embedding = self.embeddings_generator.generate_embedding(query)
-            if query_embedding is None:
-                logger.error("Failed to generate query embedding")
-                return []
-            
-            # Search the index
-            results = self.index_manager.search(query_embedding, k)
-            
-            # Format results
-            formatted_results = []
-            for file_path, distance in results:
-                formatted_results.append({
-                    'file_path': file_path,
-                    'relevance_score': 1.0 / (1.0 + distance),  # Convert distance to similarity score
-                    'distance': distance
-                })
-            
-            return formatted_results
+            allowed_ids = self.metadata_store.select(filters) if filters else None
+            depth = k if mode in ('lexical', 'vector') else k * FUSION_DEPTH_FACTOR
+            lexical = [
+                self.lexical_index.search(query, depth, allowed_ids) if mode != 'vector' else []
+                for query in queries
+            ]
+            lexical_only = [
+                mode == 'lexical' or (mode == 'auto' and bool(hits) and is_keyword_query(query))
+                for query, hits in zip(queries, lexical)
+            ]
+            vector_queries = [query for query, skip in zip(queries, lexical_only) if not skip]
+            vector = iter(self.vector_search_many(vector_queries, depth, allowed_ids))
+            return [
+                self.merge_results(hits, [] if skip else next(vector), k, 'lexical' if skip else mode)
+                for hits, skip in zip(lexical, lexical_only)
+            ]
             
         except Exception as e:
             logger.error(f"Error during search: {str(e)}")
+            return [[] for _ in queries]
+    
+    @staticmethod
+    def merge_results(lexical: List[Tuple[str, float]], vector: List[Dict[str, Any]],
+                      k: int, mode: str) -> List[Dict[str, Any]]:
+        """Result dicts for one query from its lexical ranking and vector hits"""
+        if mode == 'lexical':
+            return [
+                {'file_path': file_path, 'relevance_score': score, 'lexical_score': score}
+                for file_path, score in lexical[:k]
+            ]
+        if mode == 'vector':
+            return [
+                {
+                    'file_path': hit['file_path'],
+                    'relevance_score': hit['score'],
+                    'similarity': hit['similarity'],
+                    'distance': hit['distance'],
+                    'passage': hit['passage'],
+                    'passage_start': hit['passage_start']
+                }
+                for hit in vector[:k]
+            ]
+        
+        vector_hits = {hit['file_path']: hit for hit in vector}
+        lexical_scores = dict(lexical)
+        fused = reciprocal_rank_fusion([[hit['file_path'] for hit in vector], [file_path for file_path, _ in lexical]])
+        return [
+            {
+                'file_path': file_path,
+                'relevance_score': score,
+                'similarity': vector_hits[file_path]['similarity'] if file_path in vector_hits else None,
+                'distance': vector_hits[file_path]['distance'] if file_path in vector_hits else None,
+                'lexical_score': lexical_scores.get(file_path),
+                'passage': vector_hits[file_path]['passage'] if file_path in vector_hits else None,
+                'passage_start': vector_hits[file_path]['passage_start'] if file_path in vector_hits else None
+            }
+            for file_path, score in fused[:k]
+        ]
+    
+    def vector_search(self, query: str, k: int, allowed_ids=None) -> List[Dict[str, Any]]:
+        """Files nearest to the query embedding, best first; see vector_search_many"""
+        return self.vector_search_many([query], k, allowed_ids)[0]
+    
+    def vector_search_many(self, queries: List[str], k: int, allowed_ids=None) -> List[List[Dict[str, Any]]]:
+        """Vector hits for several queries with one embedding batch and one index search each
+        
+        Files are ranked by their chunks (see ChunkIndex), with 'score',
+        the best chunk's 'distance' and its 'passage'. Files indexed before
+        chunking only have a file vector until they are indexed again; they
+        are searched separately and scored as if that vector were their one
+        chunk, with no passage.
+        """
+        if not queries:
             return []
+        try:
+            query_embeddings = self.embeddings_generator.generate_embeddings(queries)
+        except Exception as e:
+            logger.error(f"Failed to generate query embeddings: {str(e)}")
+            return [[] for _ in queries]
+        results = self.chunk_index.search(query_embeddings, k, allowed_ids, self.chunk_aggregation)
+        unchunked = self.unchunked_file_ids(allowed_ids)
+        if unchunked is None or len(unchunked):
+            file_hits = self.index_manager.search_many(query_embeddings, k, unchunked)
+            for hits, extra in zip(results, file_hits):
+                hits.extend(file_vector_hit(file_path, distance) for file_path, distance in extra)
+                hits.sort(key=lambda hit: hit['score'], reverse=True)
+                del hits[k:]
+        return results
+    
+    def unchunked_file_ids(self, allowed_ids=None) -> Optional[np.ndarray]:
+        """Sorted ids of the (allowed) files that only have a file vector; None means every file"""
+        if not self.index_manager.get_total_files():
+            return np.zeros(0, dtype=np.int64)
+        unchunked = None
+        if self.chunk_index.file_count():
+            unchunked = np.setdiff1d(self.index_manager.file_mapping.ids(), self.chunk_index.file_ids())
+        if allowed_ids is not None:
+            unchunked = allowed_ids if unchunked is None else np.intersect1d(unchunked, allowed_ids)
+        return unchunked
+    
+    def indexed_file_count(self) -> int:
+        """Chunked files plus files that only have a file vector"""
+        unchunked = self.unchunked_file_ids()
+        return self.chunk_index.file_count() + (self.index_manager.get_total_files() if unchunked is None else len(unchunked))
+    
+    def threshold_search(self, query: str, min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                         filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Every file whose best chunk has at least min_similarity to the query, most similar first
+        
+        Unlike search() there is no k: the vector index is range-searched
+        with the radius matching the threshold, so the result is the same
+        for any corpus size. 'relevance_score' and 'similarity' are the
+        cosine similarity of the best chunk, comparable across queries.
+        filters are as in search().
+        """
+        try:
+            allowed_ids = self.metadata_store.select(filters) if filters else None
+            query_embeddings = self.embeddings_generator.generate_embeddings([query])
+            hits = self.chunk_index.range_search(query_embeddings, min_similarity, allowed_ids)[0]
+            unchunked = self.unchunked_file_ids(allowed_ids)
+            if unchunked is None or len(unchunked):
+                hits.extend(
+                    file_vector_hit(file_path, distance)
+                    for file_path, distance in self.index_manager.range_search(query_embeddings, min_similarity, unchunked)
+                )
+                hits.sort(key=lambda hit: hit['similarity'], reverse=True)
+            return [
+                {
+                    'file_path': hit['file_path'],
+                    'relevance_score': hit['similarity'],
+                    'similarity': hit['similarity'],
+                    'distance': hit['distance'],
+                    'passage': hit['passage'],
+                    'passage_start': hit['passage_start']
+                }
+                for hit in hits
+            ]
+        except Exception as e:
+            logger.error(f"Error during threshold search: {str(e)}")
+            return []
+    
+    def mark_changed(self, changes: int = 1):
+        """Record changed files and commit once a threshold has been crossed
+        
+        Like FaissIndexManager.mark_changed: indexing a file only updates the
+        stores in memory, and they are all written after flush_threshold
+        changes or flush_interval seconds, on commit() or at exit.
+        """
+        with self.commit_lock:
+            self.pending_changes += changes
+            if self.first_pending_time is None:
+                self.first_pending_time = time.time()
+            due = (self.pending_changes >= self.flush_threshold
+                   or time.time() - self.first_pending_time >= self.flush_interval)
+        if due:
+            self.commit()
+    
+    def commit(self):
+        """Write pending index changes and cached embeddings to disk"""
+        with self.commit_lock:
+            self.pending_changes = 0
+            self.first_pending_time = None
+        self.index_manager.commit()
+        self.embedding_cache.flush()
+        self.lexical_index.commit()
+        self.metadata_store.commit()
+        self.chunk_index.commit()
+    
+    def discard_file(self, file_path: str) -> bool:
+        """Drop a file from every store; returns False if none of them had it"""
+        in_lexical_index = self.lexical_index.remove(file_path)
+        self.metadata_store.remove(file_path)
+        in_chunk_index = self.chunk_index.remove(file_path)
+        # Only files indexed before chunking have a file vector
+        has_file_vector = self.index_manager.remove_file(file_path)
+        return in_lexical_index or in_chunk_index or has_file_vector
     
     def remove_file(self, file_path: str) -> bool:
         """Remove a file from the index"""
         try:
-            self.index_manager.remove_file(file_path)
+            removed = self.discard_file(file_path)
+            self.mark_changed()
+            if not removed:
+                logger.info(f"{file_path} was not in the index")
+                return False
             logger.info(f"Successfully removed {file_path} from index")
             return True
         except Exception as e:
             logger.error(f"Error removing {file_path} from index: {str(e)}")
             return False
     
-    def get_index_stats(self) -> Dict[str, Any]:
-        """Get statistics about the search index"""
+    def get_index_stats(self, measure_recall: bool = False) -> Dict[str, Any]:
+        """Get statistics about the search index
+        
+        Index memory and recall come from the chunk vectors, which hold
+        every file indexed since chunking; recall is the last measured value
+        unless measure_recall is set, which compares the index against
+        exact search on a sample of its own vectors. 'file_vectors' counts
+        the files indexed before chunking that still have a file vector.
+        """
+        if measure_recall:
+            self.chunk_index.vectors.measure_recall()
         return {
-            'total_files': self.index_manager.get_total_files(),
-            'index_path': self.index_manager.index_path
+            'total_files': self.indexed_file_count(),
+            'index_path': self.index_manager.index_path,
+            'model_id': self.embeddings_generator.model_id,
+            'dimension': self.embeddings_generator.dimension,
+            'cached_embeddings': len(self.embedding_cache),
+            'lexical_documents': len(self.lexical_index),
+            'chunked_files': self.chunk_index.file_count(),
+            'chunks': len(self.chunk_index),
+            'file_vectors': self.index_manager.get_total_files(),
+            **self.chunk_index.vectors.describe()
         } 
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import threading
+import numpy as np
+from typing import List
+
+class VectorStore:
+    """Full-precision vectors keyed by index id, stored memory-mapped.
+
+    Used to re-rank candidates from a compressed FAISS index with exact
+    distances. Vectors live in a float32 slot file of shape
+    (capacity, dimension) and the id stored in each slot (-1 for a free
+    slot) in a parallel int64 file, so the id -> slot table is rebuilt
+    from disk on load and no separate index has to be kept in sync.
+    Both files grow by doubling. Only the pages that are read stay in
+    memory, and the operating system can drop them at any time.
+    """
+
+    def __init__(self, path: str, dimension: int):
+        self.dimension = dimension
+        self.vectors_path = f"{path}.f32"
+        self.ids_path = f"{path}.ids"
+        self.lock = threading.RLock()
+        self.id_slots = {}
+        self.free_slots = []
+        self.capacity = 0
+        self.vectors = None
+        self.slot_ids = None
+        self.load()
+
+    def load(self):
+        capacity = 0
+        if os.path.exists(self.ids_path) and os.path.exists(self.vectors_path):
+            capacity = os.path.getsize(self.ids_path) // 8
+            if os.path.getsize(self.vectors_path) < capacity * self.dimension * 4:
+                capacity = 0
+        if capacity:
+            self.open_arrays(capacity)
+            slot_ids = np.asarray(self.slot_ids)
+            used = np.flatnonzero(slot_ids >= 0)
+            self.id_slots = dict(zip(slot_ids[used].tolist(), used.tolist()))
+            self.free_slots = np.flatnonzero(slot_ids < 0)[::-1].tolist()
+        else:
+            self.open_arrays(1024, reset=True)
+
+    def open_arrays(self, capacity: int, reset: bool = False):
+        """Map the slot files, creating or growing them to capacity"""
+        old_capacity = 0 if reset else self.capacity
+        for path, itemsize in ((self.vectors_path, 4 * self.dimension), (self.ids_path, 8)):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            mode = 'wb' if reset or not os.path.exists(path) else 'r+b'
+            with open(path, mode) as f:
+                f.truncate(capacity * itemsize)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dimension))
+        self.slot_ids = np.memmap(self.ids_path, dtype=np.int64, mode='r+', shape=(capacity,))
+        if capacity > old_capacity and (reset or self.capacity):
+            # New slots start out free
+            self.slot_ids[old_capacity:] = -1
+            self.free_slots = list(range(capacity - 1, old_capacity - 1, -1)) + self.free_slots
+        if reset:
+            self.id_slots = {}
+        self.capacity = capacity
+
+    def grow(self):
+        self.vectors.flush()
+        self.slot_ids.flush()
+        self.vectors = None
+        self.slot_ids = None
+        self.open_arrays(self.capacity * 2)
+
+    def put(self, ids: np.ndarray, vectors: np.ndarray):
+        with self.lock:
+            for index_id, vector in zip(np.asarray(ids).tolist(), vectors):
+                slot = self.id_slots.get(index_id)
+                if slot is None:
+                    if not self.free_slots:
+                        self.grow()
+                    slot = self.free_slots.pop()
+                    self.id_slots[index_id] = slot
+                self.vectors[slot] = vector
+                self.slot_ids[slot] = index_id
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        """Vectors for ids (all must be present), as a new array"""
+        with self.lock:
+            slots = [self.id_slots[index_id] for index_id in np.asarray(ids).tolist()]
+            return np.array(self.vectors[slots])
+
+    def remove(self, ids: List[int]):
+        with self.lock:
+            for index_id in ids:
+                slot = self.id_slots.pop(index_id, None)
+                if slot is not None:
+                    self.slot_ids[slot] = -1
+                    self.free_slots.append(slot)
+
+    def __contains__(self, index_id: int) -> bool:
+        return index_id in self.id_slots
+
+    def __len__(self) -> int:
+        return len(self.id_slots)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the vector file on disk"""
+        return self.capacity * self.dimension * 4
+
+    def flush(self):
+        with self.lock:
+            self.vectors.flush()
+            self.slot_ids.flush()
+
+    def delete(self):
+        with self.lock:
+            self.vectors = None
+            self.slot_ids = None
+            for path in (self.vectors_path, self.ids_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
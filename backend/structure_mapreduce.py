@@ -0,0 +1,296 @@
+import os
+import re
+import json
+import logging
+from summarizer import summarize_files, estimate_tokens
+
+logger = logging.getLogger('structure_mapreduce')
+
+# Above this many files the structure step switches to map-reduce
+MAP_REDUCE_THRESHOLD = 40
+# Prompt-token budget for one category proposal or merge request
+PROPOSAL_TOKEN_BUDGET = 3000
+# Files assigned per request
+ASSIGNMENT_BATCH_SIZE = 40
+# Size of the final taxonomy
+MAX_CATEGORIES = 12
+# Category for files the LLM did not place
+FALLBACK_CATEGORY = "Uncategorized"
+
+PROPOSE_PROMPT = """
+You will be provided with a JSON array of files, each with a "file_path" and a "summary" of its contents. Propose folder categories that would organize these files well, using known conventions and best practices. Categories should be simple like: Academic, Research, Images, Documents, etc. Use at most {max_categories} categories and name them with underscores instead of spaces.
+
+Respond with ONLY valid JSON matching the following schema:
+
+```json
+{{
+    "categories": [
+        {{
+            "name": "Category_Name",
+            "description": "what belongs in this category"
+        }}
+    ]
+}}
+```
+""".strip()
+
+MERGE_PROMPT = """
+You will be provided with a JSON array of folder categories proposed independently for different parts of the same directory. Merge them into a single taxonomy of at most {max_categories} categories. Combine categories that mean the same thing, keep the names simple and use underscores instead of spaces.
+
+Respond with ONLY valid JSON matching the following schema:
+
+```json
+{{
+    "categories": [
+        {{
+            "name": "Category_Name",
+            "description": "what belongs in this category"
+        }}
+    ]
+}}
+```
+""".strip()
+
+ASSIGN_PROMPT = """
+You will be provided with a list of folder categories and a JSON array of files, each with an "id", the "file_name" and a "summary" of its contents. Assign every file to exactly one of the given categories. Only use category names from the list.
+
+Categories:
+{categories}
+
+Respond with ONLY valid JSON with exactly one entry per input file, matching the following schema:
+
+```json
+{{
+    "assignments": [
+        {{
+            "id": "id of the file from the input",
+            "category": "Category_Name"
+        }}
+    ]
+}}
+```
+""".strip()
+
+def parse_json_object(content):
+    """Parse the first JSON object in an LLM response"""
+    start = content.find('{')
+    end = content.rfind('}') + 1
+    if start < 0 or end <= start:
+        raise ValueError("Response does not contain a JSON object")
+    return json.loads(content[start:end])
+
+def normalize_category(name):
+    """Turn an LLM category name into a single safe folder name"""
+    name = re.sub(r'[\\/:*?"<>|]+', ' ', str(name)).strip()
+    return re.sub(r'\s+', '_', name)
+
+def chunk_by_tokens(entries, token_budget, max_size=None):
+    """Split entries into consecutive chunks whose JSON fits a token budget"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for entry in entries:
+        entry_tokens = estimate_tokens(json.dumps(entry))
+        if current and (current_tokens + entry_tokens > token_budget or (max_size and len(current) >= max_size)):
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(entry)
+        current_tokens += entry_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def parse_categories(content):
+    categories = []
+    for category in parse_json_object(content).get('categories', []):
+        if isinstance(category, dict) and category.get('name'):
+            name = normalize_category(category['name'])
+            if name:
+                categories.append({"name": name, "description": str(category.get('description', ''))})
+        elif isinstance(category, str) and normalize_category(category):
+            categories.append({"name": normalize_category(category), "description": ""})
+    return categories
+
+def dedupe_categories(categories):
+    """Drop categories whose names differ only in case"""
+    seen = {}
+    for category in categories:
+        seen.setdefault(category['name'].lower(), category)
+    return list(seen.values())
+
+def propose_categories(entries, chat_fn, online_mode=False, max_workers=None,
+                       token_budget=PROPOSAL_TOKEN_BUDGET, max_categories=MAX_CATEGORIES):
+    """Map step: propose categories for chunks of summaries in parallel"""
+    chunks = chunk_by_tokens(entries, token_budget)
+    prompt = PROPOSE_PROMPT.format(max_categories=max_categories)
+    logger.info(f"Proposing categories for {len(entries)} files in {len(chunks)} chunks")
+
+    def propose(chunk, mode):
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": json.dumps(chunk)}
+        ]
+        try:
+            return parse_categories(chat_fn(messages, 512))
+        except Exception as e:
+            logger.error(f"Error proposing categories for a chunk of {len(chunk)} files: {str(e)}")
+            return []
+
+    return summarize_files(chunks, propose, online_mode=online_mode, max_workers=max_workers)
+
+def merge_categories(proposals, chat_fn, online_mode=False, max_workers=None,
+                     token_budget=PROPOSAL_TOKEN_BUDGET, max_categories=MAX_CATEGORIES):
+    """Reduce step: merge proposed categories into one taxonomy.
+
+    Proposals are merged in rounds of groups that fit the token budget, so
+    no single request grows with the number of chunks.
+    """
+    prompt = MERGE_PROMPT.format(max_categories=max_categories)
+    categories = dedupe_categories([category for proposal in proposals for category in proposal])
+
+    def merge(group, mode):
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": json.dumps(group)}
+        ]
+        try:
+            merged = dedupe_categories(parse_categories(chat_fn(messages, 512)))
+        except Exception as e:
+            logger.error(f"Error merging {len(group)} categories: {str(e)}")
+            merged = []
+        # Never let a failed merge lose categories
+        return merged or group[:max_categories]
+
+    while len(categories) > max_categories:
+        groups = chunk_by_tokens(categories, token_budget)
+        logger.info(f"Merging {len(categories)} categories in {len(groups)} groups")
+        merged = dedupe_categories([
+            category for group in summarize_files(groups, merge, online_mode=online_mode, max_workers=max_workers)
+            for category in group
+        ])
+        if len(groups) == 1 or len(merged) >= len(categories):
+            # The LLM is not shrinking the list any further; keep the first ones
+            categories = merged[:max_categories]
+            break
+        categories = merged
+    return categories
+
+def assign_categories(entries, taxonomy, chat_fn, online_mode=False, max_workers=None,
+                      batch_size=ASSIGNMENT_BATCH_SIZE):
+    """Assign files to taxonomy categories in parallel batches.
+
+    Returns a dict of file_path -> category. Files the LLM skips are retried
+    once in a smaller batch; anything still unplaced is left out.
+    """
+    names = {category['name'].lower(): category['name'] for category in taxonomy}
+    prompt = ASSIGN_PROMPT.format(categories=json.dumps(taxonomy, indent=2))
+
+    def assign(batch, mode):
+        request = [
+            {"id": str(index), "file_name": os.path.basename(entry["file_path"]), "summary": entry["summary"]}
+            for index, entry in enumerate(batch)
+        ]
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": json.dumps(request)}
+        ]
+        assignments = {}
+        try:
+            content = chat_fn(messages, min(4096, 24 * len(batch) + 64))
+            for assignment in parse_json_object(content).get('assignments', []):
+                if not isinstance(assignment, dict):
+                    continue
+                try:
+                    entry = batch[int(assignment.get('id'))]
+                except (TypeError, ValueError, IndexError):
+                    continue
+                category = names.get(normalize_category(assignment.get('category', '')).lower())
+                if category:
+                    assignments[entry['file_path']] = category
+        except Exception as e:
+            logger.error(f"Error assigning categories for {len(batch)} files: {str(e)}")
+        return assignments
+
+    batches = [entries[start:start + batch_size] for start in range(0, len(entries), batch_size)]
+    logger.info(f"Assigning {len(entries)} files to {len(taxonomy)} categories in {len(batches)} batches")
+    assignments = {}
+    for result in summarize_files(batches, assign, online_mode=online_mode, max_workers=max_workers):
+        assignments.update(result)
+
+    missing = [entry for entry in entries if entry['file_path'] not in assignments]
+    if missing and len(missing) < len(entries):
+        logger.info(f"Retrying category assignment for {len(missing)} files")
+        retry_batches = [missing[start:start + max(1, batch_size // 4)] for start in range(0, len(missing), max(1, batch_size // 4))]
+        for result in summarize_files(retry_batches, assign, online_mode=online_mode, max_workers=max_workers):
+            assignments.update(result)
+    return assignments
+
+def validate_plan(file_paths, plan, dst_builder, fallback_category=FALLBACK_CATEGORY):
+    """Make sure every source file appears exactly once in the plan.
+
+    Entries for unknown or repeated sources are dropped and files without
+    an entry are placed in fallback_category.
+    """
+    expected = set(file_paths)
+    seen = set()
+    validated = []
+    for entry in plan:
+        src_path = entry.get('src_path')
+        if src_path not in expected or src_path in seen or not entry.get('dst_path'):
+            logger.warning(f"Dropping invalid plan entry: {entry}")
+            continue
+        seen.add(src_path)
+        validated.append(entry)
+    for file_path in file_paths:
+        if file_path not in seen:
+            logger.warning(f"No category for {file_path}, using {fallback_category}")
+            validated.append({"src_path": file_path, "dst_path": dst_builder(file_path, fallback_category)})
+    return validated
+
+def build_structure(file_summaries, chat_fn, dst_builder, online_mode=False, max_workers=None,
+                    max_categories=MAX_CATEGORIES):
+    """Generate a file structure with map-reduce over the summaries.
+
+    file_summaries are {"file_path", "summary"} dicts, optionally with a
+    "duplicate_group"; only the first file of each group is sent to the LLM
+    and its copies follow it. chat_fn is called as chat_fn(messages, max_tokens)
+    and returns the response text. dst_builder(src_path, category) returns
+    the destination path. Returns a list of {"src_path", "dst_path"} with
+    every input file exactly once, the same shape as generate_file_structure.
+    """
+    file_paths = [entry['file_path'] for entry in file_summaries]
+    representatives = {}
+    entries = []
+    for entry in file_summaries:
+        group = entry.get('duplicate_group')
+        if group is not None:
+            if group in representatives:
+                continue
+            representatives[group] = entry['file_path']
+        entries.append({"file_path": entry['file_path'], "summary": entry['summary']})
+
+    proposals = propose_categories(entries, chat_fn, online_mode, max_workers, max_categories=max_categories)
+    taxonomy = merge_categories(proposals, chat_fn, online_mode, max_workers, max_categories=max_categories)
+    if not taxonomy:
+        logger.error("No categories were proposed")
+        return validate_plan(file_paths, [], dst_builder)
+    logger.info(f"Taxonomy: {', '.join(category['name'] for category in taxonomy)}")
+
+    assignments = assign_categories(entries, taxonomy, chat_fn, online_mode, max_workers)
+    plan = []
+    for entry in file_summaries:
+        group = entry.get('duplicate_group')
+        source = representatives.get(group, entry['file_path']) if group is not None else entry['file_path']
+        category = assignments.get(source)
+        if category:
+            plan.append({"src_path": entry['file_path'], "dst_path": dst_builder(entry['file_path'], category)})
+    return validate_plan(file_paths, plan, dst_builder)
+
+def nested_destination(src_path, category):
+    """original_dir/category/filename, as used by the initial organizer"""
+    return os.path.join(os.path.dirname(src_path), category, os.path.basename(src_path))
+
+def relative_destination(src_path, category):
+    """category/filename, as used by file_organizer"""
+    return os.path.join(category, os.path.basename(src_path))
@@ -0,0 +1,220 @@
+import os
+import json
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('summarizer')
+
+# Maximum number of in-flight summary requests per provider.
+# OpenAI handles many parallel requests; a local Ollama server
+# usually serves one or two generations at a time.
+DEFAULT_CONCURRENCY = {
+    'openai': 8,
+    'ollama': 2
+}
+
+# Prompt-token budget for a single batched summary request
+DEFAULT_BATCH_TOKEN_BUDGET = 6000
+# Upper bound on files per batched request, regardless of budget
+MAX_BATCH_SIZE = 20
+# Completion tokens reserved per file in a batched request
+BATCH_TOKENS_PER_SUMMARY = 120
+
+BATCH_SUMMARY_PROMPT = """
+You will be provided with a JSON array of files. Each entry has an "id", the "file_path" and an excerpt of the file "content". Provide a summary of the contents of each file. The purpose of the summaries is to organize files based on their content. To this end provide a concise but informative summary for every file. Make each summary as specific to its file as possible.
+
+Write your response as a JSON array with exactly one object per input file, using the following schema:
+
+```json
+[
+    {
+        "id": "id of the file from the input",
+        "summary": "summary of the content"
+    }
+]
+```
+""".strip()
+
+def get_provider(online_mode):
+    """Return the provider name used for the given mode"""
+    return 'openai' if online_mode else 'ollama'
+
+def get_concurrency_limit(online_mode, override=None):
+    """Resolve the concurrency limit for a provider.
+
+    An explicit override wins, then the FYLR_<PROVIDER>_CONCURRENCY
+    environment variable, then DEFAULT_CONCURRENCY.
+    """
+    provider = get_provider(online_mode)
+    limit = override
+    if limit is None:
+        env_value = os.getenv(f"FYLR_{provider.upper()}_CONCURRENCY")
+        if env_value:
+            try:
+                limit = int(env_value)
+            except ValueError:
+                logger.warning(f"Ignoring invalid FYLR_{provider.upper()}_CONCURRENCY value: {env_value}")
+    if limit is None:
+        limit = DEFAULT_CONCURRENCY[provider]
+    return max(1, int(limit))
+
+def summarize_files(file_paths, summarize_fn, online_mode=False, max_workers=None, progress_callback=None):
+    """Summarize files concurrently with a bounded number of in-flight LLM calls.
+
+    summarize_fn is called as summarize_fn(file_path, online_mode) and may
+    return None. Results are returned in the same order as file_paths.
+    progress_callback, if given, is called as
+    progress_callback(completed, total, file_path, summary) after each file.
+    """
+    total = len(file_paths)
+    results = [None] * total
+    if total == 0:
+        return results
+
+    workers = min(get_concurrency_limit(online_mode, max_workers), total)
+    logger.info(f"Summarizing {total} files with {workers} concurrent {get_provider(online_mode)} requests")
+
+    progress_lock = threading.Lock()
+    completed = 0
+
+    def run(index, file_path):
+        nonlocal completed
+        try:
+            summary = summarize_fn(file_path, online_mode)
+        except Exception as e:
+            logger.error(f"Error summarizing {file_path}: {str(e)}")
+            summary = None
+        results[index] = summary
+
+        with progress_lock:
+            completed += 1
+            if progress_callback:
+                try:
+                    progress_callback(completed, total, file_path, summary)
+                except Exception as e:
+                    logger.error(f"Error in progress callback: {str(e)}")
+
+    if workers == 1:
+        for index, file_path in enumerate(file_paths):
+            run(index, file_path)
+        return results
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='summarizer') as executor:
+        futures = [executor.submit(run, index, file_path) for index, file_path in enumerate(file_paths)]
+        for future in futures:
+            future.result()
+
+    return results
+
+def estimate_tokens(text):
+    """Cheap token estimate (roughly four characters per token)"""
+    return len(text) // 4 + 1
+
+def pack_batches(items, token_budget=DEFAULT_BATCH_TOKEN_BUDGET, max_batch_size=MAX_BATCH_SIZE):
+    """Pack {"id", "file_path", "content"} items into batches that fit a token budget.
+
+    The system prompt is counted once per batch. An item that exceeds the
+    budget on its own is still placed in a batch of one.
+    """
+    overhead = estimate_tokens(BATCH_SUMMARY_PROMPT)
+    batches = []
+    current = []
+    current_tokens = overhead
+    for item in items:
+        item_tokens = estimate_tokens(json.dumps(item)) + BATCH_TOKENS_PER_SUMMARY
+        if current and (current_tokens + item_tokens > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+            current_tokens = overhead
+        current.append(item)
+        current_tokens += item_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_batch_response(content):
+    """Parse a batched summary response into a dict of id -> summary"""
+    start = content.find('[')
+    end = content.rfind(']') + 1
+    if start < 0 or end <= start:
+        raise ValueError("Response does not contain a JSON array")
+    entries = json.loads(content[start:end])
+    summaries = {}
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get('id') is not None and entry.get('summary'):
+            summaries[str(entry['id'])] = str(entry['summary']).strip()
+    return summaries
+
+def summarize_batch(batch, chat_fn):
+    """Summarize one batch with a single request.
+
+    chat_fn is called as chat_fn(messages, max_tokens) and returns the
+    response text. Returns a dict of id -> summary for the ids that were
+    answered; missing ids are left for the caller to retry.
+    """
+    messages = [
+        {"role": "system", "content": BATCH_SUMMARY_PROMPT},
+        {"role": "user", "content": json.dumps(batch)}
+    ]
+    max_tokens = min(4096, BATCH_TOKENS_PER_SUMMARY * len(batch) + 64)
+    content = chat_fn(messages, max_tokens)
+    summaries = parse_batch_response(content)
+    expected_ids = {item['id'] for item in batch}
+    return {item_id: summary for item_id, summary in summaries.items() if item_id in expected_ids}
+
+def summarize_batch_with_retry(batch, chat_fn):
+    """Summarize a batch, splitting and retrying only the parts that failed"""
+    try:
+        summaries = summarize_batch(batch, chat_fn)
+    except Exception as e:
+        logger.error(f"Batched summary request for {len(batch)} files failed: {str(e)}")
+        summaries = {}
+
+    missing = [item for item in batch if item['id'] not in summaries]
+    if not missing:
+        return summaries
+    if len(batch) == 1:
+        logger.warning(f"No summary returned for {batch[0]['file_path']}")
+        return summaries
+
+    # Retry only the unanswered files, split in two so a single bad
+    # excerpt cannot keep failing the whole request
+    logger.info(f"Retrying {len(missing)} of {len(batch)} files from a failed batch")
+    if len(missing) == len(batch):
+        middle = len(missing) // 2
+        halves = [missing[:middle], missing[middle:]]
+    else:
+        halves = [missing]
+    for half in halves:
+        summaries.update(summarize_batch_with_retry(half, chat_fn))
+    return summaries
+
+def summarize_texts_batched(items, chat_fn, online_mode=False, token_budget=None, max_workers=None, progress_callback=None):
+    """Summarize {"id", "file_path", "content"} items using multi-file requests.
+
+    Returns a dict of id -> summary. Batches are sent concurrently with the
+    same per-provider limits as summarize_files. progress_callback, if given,
+    is called as progress_callback(completed, total) with file counts.
+    """
+    if not items:
+        return {}
+    batches = pack_batches(items, token_budget or DEFAULT_BATCH_TOKEN_BUDGET)
+    logger.info(f"Packed {len(items)} files into {len(batches)} batched summary requests")
+
+    total = len(items)
+    summaries = {}
+    progress = {'completed': 0}
+    progress_lock = threading.Lock()
+
+    def run(batch, online_mode):
+        result = summarize_batch_with_retry(batch, chat_fn)
+        with progress_lock:
+            summaries.update(result)
+            progress['completed'] += len(batch)
+            if progress_callback:
+                progress_callback(progress['completed'], total)
+        return result
+
+    summarize_files(batches, run, online_mode=online_mode, max_workers=max_workers)
+    return summaries
@@ -0,0 +1,204 @@
+import os
+import csv
+import time
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger('summary_store')
+
+# SQLite database shared by the backend caches
+CACHE_DB_PATH = os.getenv('FYLR_CACHE_DB', os.path.join(os.getcwd(), "file_summaries_cache.db"))
+# Legacy append-only cache, imported once into the database
+LEGACY_CSV_PATH = os.path.join(os.getcwd(), "file_summaries_cache.csv")
+
+# Eviction defaults
+MAX_ENTRIES = 100000
+MAX_AGE_DAYS = 180
+
+def connect_cache_db(db_path=CACHE_DB_PATH):
+    """Open the cache database in WAL mode so readers never block the writer"""
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+class SummaryStore:
+    """File summaries keyed by content hash, stored in SQLite"""
+
+    def __init__(self, db_path=CACHE_DB_PATH, legacy_csv_path=LEGACY_CSV_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = connect_cache_db(db_path)
+        self.create_tables()
+        if legacy_csv_path:
+            self.import_legacy_csv(legacy_csv_path)
+
+    def create_tables(self):
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    file_hash TEXT PRIMARY KEY,
+                    file_path TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    last_modified REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_last_accessed ON summaries (last_accessed)"
+            )
+
+    def import_legacy_csv(self, csv_path):
+        """Import file_summaries_cache.csv once, keeping the newest row per hash"""
+        if not os.path.exists(csv_path):
+            return 0
+        imported_marker = f"{csv_path}.imported"
+        if os.path.exists(imported_marker):
+            return 0
+        try:
+            entries = {}
+            with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+                for row in csv.DictReader(csvfile):
+                    previous = entries.get(row['file_hash'])
+                    if previous is None or float(row['last_modified']) >= previous['last_modified']:
+                        entries[row['file_hash']] = {
+                            'file_hash': row['file_hash'],
+                            'file_path': row['file_path'],
+                            'summary': row['summary'],
+                            'last_modified': float(row['last_modified'])
+                        }
+            self.put_many(entries.values())
+            open(imported_marker, 'w').close()
+            logger.info(f"Imported {len(entries)} summaries from legacy cache {csv_path}")
+            return len(entries)
+        except Exception as e:
+            logger.error(f"Error importing legacy summaries cache: {str(e)}")
+            return 0
+
+    def get(self, file_hash, last_modified=None):
+        """Return the cached summary for a hash, or None.
+
+        If last_modified is given, entries older than it are ignored.
+        """
+        mtimes = {file_hash: last_modified} if last_modified is not None else None
+        return self.get_many([file_hash], mtimes).get(file_hash)
+
+    def get_many(self, file_hashes, last_modified=None):
+        """Point lookups for several hashes; returns a dict of hash -> summary.
+
+        last_modified may map hashes to the file's current mtime, in which
+        case entries recorded for an older mtime are treated as misses.
+        """
+        file_hashes = list(dict.fromkeys(file_hashes))
+        results = {}
+        if not file_hashes:
+            return results
+        now = time.time()
+        with self.lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(file_hashes), 500):
+                chunk = file_hashes[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT file_hash, summary, last_modified FROM summaries WHERE file_hash IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for file_hash, summary, cached_modified in rows:
+                    if last_modified and file_hash in last_modified and cached_modified < last_modified[file_hash]:
+                        continue
+                    results[file_hash] = summary
+            if results:
+                with self.connection:
+                    self.connection.executemany(
+                        "UPDATE summaries SET last_accessed = ? WHERE file_hash = ?",
+                        [(now, file_hash) for file_hash in results]
+                    )
+        return results
+
+    def put(self, file_hash, file_path, summary, last_modified):
+        self.put_many([{
+            'file_hash': file_hash,
+            'file_path': file_path,
+            'summary': summary,
+            'last_modified': last_modified
+        }])
+
+    def put_many(self, entries):
+        """Insert or replace many summaries in a single transaction"""
+        now = time.time()
+        rows = [
+            (entry['file_hash'], entry['file_path'], entry['summary'], float(entry['last_modified']), now)
+            for entry in entries
+        ]
+        if not rows:
+            return 0
+        with self.lock, self.connection:
+            self.connection.executemany(
+                """
+                INSERT INTO summaries (file_hash, file_path, summary, last_modified, last_accessed)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(file_hash) DO UPDATE SET
+                    file_path = excluded.file_path,
+                    summary = excluded.summary,
+                    last_modified = excluded.last_modified,
+                    last_accessed = excluded.last_accessed
+                """,
+                rows
+            )
+        return len(rows)
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def evict(self, max_entries=MAX_ENTRIES, max_age_days=MAX_AGE_DAYS):
+        """Drop entries not used within max_age_days, then the least recently
+        used entries beyond max_entries. Returns the number of rows removed."""
+        removed = 0
+        with self.lock, self.connection:
+            if max_age_days is not None:
+                cutoff = time.time() - max_age_days * 86400
+                removed += self.connection.execute(
+                    "DELETE FROM summaries WHERE last_accessed < ?", (cutoff,)
+                ).rowcount
+            if max_entries is not None:
+                removed += self.connection.execute(
+                    """
+                    DELETE FROM summaries WHERE file_hash IN (
+                        SELECT file_hash FROM summaries
+                        ORDER BY last_accessed DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (max_entries,)
+                ).rowcount
+        if removed:
+            logger.info(f"Evicted {removed} cached summaries")
+        return removed
+
+    def compact(self):
+        """Reclaim space left by evicted rows and checkpoint the WAL"""
+        with self.lock:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.connection.execute("VACUUM")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_summary_store():
+    """Return the process-wide summary store, opening it on first use"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SummaryStore()
+            if _default_store.evict() > 1000:
+                _default_store.compact()
+        return _default_store
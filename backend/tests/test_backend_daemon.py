@@ -0,0 +1,33 @@
+import io
+import json
+
+import pytest
+
+from backend_daemon import BackendDaemon, METHOD_NOT_FOUND
+
+
+def request(daemon, method, params=None, request_id=1):
+    return daemon.handle(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}))
+
+
+def test_ping_round_trip():
+    daemon = BackendDaemon(io.StringIO())
+    assert request(daemon, 'ping') == {"jsonrpc": "2.0", "id": 1, "result": "pong"}
+
+
+def test_unknown_method():
+    daemon = BackendDaemon(io.StringIO())
+    assert request(daemon, 'nope')['error']['code'] == METHOD_NOT_FOUND
+
+
+def test_usage_budget_is_reset_for_each_request():
+    organizer = pytest.importorskip('initial_organize_electron')
+    daemon = BackendDaemon(io.StringIO())
+    request(daemon, 'ping')
+    for _ in range(organizer.CALL_LIMIT):
+        organizer.update_token_usage(0, 'test')
+    assert not organizer.update_token_usage(0, 'test')
+
+    request(daemon, 'ping', request_id=2)
+    assert organizer.total_api_calls == 0
+    assert organizer.update_token_usage(0, 'test')
@@ -0,0 +1,41 @@
+import json
+
+from cluster_organizer import cluster_structure
+from search import EmbeddingsGenerator, HashingEmbeddingBackend, select_embedding_backend
+from structure_mapreduce import relative_destination
+
+SUMMARIES = [
+    {'file_path': '/docs/tax_2023.pdf', 'summary': 'Federal income tax return for 2023'},
+    {'file_path': '/docs/tax_2022.pdf', 'summary': 'Federal income tax return for 2022'},
+    {'file_path': '/docs/beach.txt', 'summary': 'Notes from a beach holiday in Spain'},
+]
+
+
+class FailingEmbedder:
+    def generate_embeddings_batch(self, texts):
+        return [None] * len(texts)
+
+
+class MissingModelClient:
+    def embed(self, model, input):
+        raise RuntimeError(f"model '{model}' not found, try pulling it first")
+
+
+def name_chat(messages, max_tokens):
+    return json.dumps({'name': 'Documents'})
+
+
+def test_unreachable_ollama_falls_back_to_hashing_embeddings():
+    assert isinstance(select_embedding_backend(None), HashingEmbeddingBackend)
+    assert isinstance(select_embedding_backend(MissingModelClient()), HashingEmbeddingBackend)
+
+
+def test_cluster_structure_without_embeddings_returns_none():
+    assert cluster_structure(SUMMARIES, FailingEmbedder(), name_chat, relative_destination) is None
+
+
+def test_cluster_structure_with_hashing_embeddings_places_every_file():
+    generator = EmbeddingsGenerator(None, select_embedding_backend(None))
+    plan = cluster_structure(SUMMARIES, generator, name_chat, relative_destination)
+    assert sorted(entry['src_path'] for entry in plan) == sorted(entry['file_path'] for entry in SUMMARIES)
+    assert all(not entry['dst_path'].startswith('Uncategorized') for entry in plan)
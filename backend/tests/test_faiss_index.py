@@ -0,0 +1,86 @@
+import faiss
+import numpy as np
+import pytest
+
+from search import faiss_index
+from search.faiss_index import FaissIndexManager, path_id, range_margin, similarity_radius
+
+DIMENSION = 32
+
+
+def unit_vectors(count, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_ivf(tmp_path, vectors, storage):
+    manager = FaissIndexManager(str(tmp_path / 'index'), dimension=DIMENSION, storage=storage,
+                                approximate_threshold=len(vectors))
+    manager.add_vectors(list(vectors), [f'/docs/{i}.txt' for i in range(len(vectors))])
+    manager.builder.join()
+    assert manager.is_approximate
+    return manager
+
+
+@pytest.fixture
+def small_pq_training(monkeypatch):
+    # 4 * 256 = 1024 training vectors, so a PQ index can be built quickly
+    monkeypatch.setattr(faiss_index, 'PQ_POINTS_PER_CENTROID', 4)
+
+
+def test_range_margin_covers_the_encoding_error():
+    radius, error = similarity_radius(0.9), 0.3
+    assert range_margin(radius, 0.0) == 0.0
+    assert radius + range_margin(radius, error) == pytest.approx((np.sqrt(radius) + error) ** 2)
+
+
+def test_pq_range_search_finds_exact_matches(tmp_path, small_pq_training):
+    vectors = unit_vectors(1500)
+    manager = build_ivf(tmp_path, vectors, 'pq')
+    assert isinstance(manager.index, faiss.IndexIVFPQ)
+    assert manager.encoding_error > 0
+
+    for row in range(0, 1500, 50):
+        hits = manager.range_search_vectors(vectors[row], 0.99)[0]
+        assert [index_id for index_id, _ in hits] == [path_id(f'/docs/{row}.txt')]
+
+
+def test_pq_range_search_matches_exact_search(tmp_path, small_pq_training):
+    vectors = unit_vectors(1500)
+    manager = build_ivf(tmp_path, vectors, 'pq')
+    manager.set_search_params(nprobe=manager.index.nlist)
+    queries = vectors[:20]
+    radius = similarity_radius(0.3)
+
+    found = manager.range_search_vectors(queries, 0.3)
+    exact = manager.exact_range_search(queries, radius, manager.file_mapping.ids())
+    for hits, expected in zip(found, exact):
+        assert [index_id for index_id, _ in hits] == [index_id for index_id, _ in expected]
+
+
+def test_small_pq_index_uses_sq8_codes(tmp_path, small_pq_training):
+    manager = build_ivf(tmp_path, unit_vectors(600), 'pq')
+    assert isinstance(manager.index, faiss.IndexIVFScalarQuantizer)
+
+
+@pytest.mark.parametrize('storage', ['float32', 'fp16'])
+def test_adding_after_a_removal_keeps_the_removal_pending(tmp_path, storage):
+    vectors = unit_vectors(5)
+    manager = FaissIndexManager(str(tmp_path / 'index'), dimension=DIMENSION, storage=storage)
+    manager.add_vectors(list(vectors[:3]), ['/docs/0.txt', '/docs/1.txt', '/docs/2.txt'])
+    manager.remove_file('/docs/0.txt')
+    manager.add_vectors([vectors[3]], ['/docs/3.txt'])
+    # Replacing a file's vector does not purge either
+    manager.add_vectors([vectors[4]], ['/docs/1.txt'])
+    assert manager.deleted_ids == {path_id('/docs/0.txt')}
+    assert manager.index.ntotal == 4
+
+    assert manager.search(vectors[4], 1)[0][0] == '/docs/1.txt'
+    assert manager.search(vectors[4], 1)[0][1] == pytest.approx(0.0, abs=1e-3)
+    assert '/docs/0.txt' not in [file_path for file_path, _ in manager.search(vectors[0], 4)]
+
+    # Re-adding a removed file reuses its slot in the index
+    manager.add_vectors([vectors[0]], ['/docs/0.txt'])
+    assert manager.deleted_ids == set()
+    assert manager.index.ntotal == 4
+    assert manager.search(vectors[0], 1)[0][0] == '/docs/0.txt'
@@ -0,0 +1,51 @@
+import os
+
+from fingerprints import FingerprintIndex, PATH_KEY_DEVICE, fingerprint_key, hash_file
+
+
+class WindowsStat:
+    """stat result shaped like a Windows scandir entry: no device or inode number"""
+
+    def __init__(self, stat_result):
+        self.st_dev = 0
+        self.st_ino = 0
+        self.st_size = stat_result.st_size
+        self.st_mtime_ns = stat_result.st_mtime_ns
+
+
+def write(path, content, mtime_ns):
+    path.write_bytes(content)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def test_inode_key(tmp_path):
+    file_path = write(tmp_path / 'a.txt', b'aaaa', 10**18)
+    stat_result = os.stat(file_path)
+    assert fingerprint_key(file_path, stat_result) == (stat_result.st_dev, stat_result.st_ino)
+
+
+def test_path_key_without_inode(tmp_path, monkeypatch):
+    first = write(tmp_path / 'a.txt', b'aaaa', 10**18)
+    second = write(tmp_path / 'b.txt', b'bbbb', 10**18)
+    stats = {path: WindowsStat(os.stat(path)) for path in (first, second)}
+    monkeypatch.setattr(os, 'stat', lambda path, *args, **kwargs: stats[str(path)])
+
+    first_key = fingerprint_key(first, stats[first])
+    assert first_key[0] == PATH_KEY_DEVICE
+    assert first_key != fingerprint_key(second, stats[second])
+
+
+def test_same_size_and_mtime_without_inode_do_not_collide(tmp_path, monkeypatch):
+    first = write(tmp_path / 'a.txt', b'aaaa', 10**18)
+    second = write(tmp_path / 'b.txt', b'bbbb', 10**18)
+    stats = {path: WindowsStat(os.stat(path)) for path in (first, second)}
+    real_stat = os.stat
+    monkeypatch.setattr(os, 'stat', lambda path, *args, **kwargs: stats.get(str(path)) or real_stat(path, *args, **kwargs))
+
+    index = FingerprintIndex(str(tmp_path / 'cache.db'))
+    assert index.get_hash(first, stats[first]) == hash_file(first)
+    index.flush()
+    assert index.get_hash(second, stats[second]) == hash_file(second)
+    assert index.get_hash(first, stats[first]) == hash_file(first)
+    index.close()
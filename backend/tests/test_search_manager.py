@@ -0,0 +1,77 @@
+import os
+
+from search.search_manager import SearchManager
+
+
+def make_manager(tmp_path, **kwargs):
+    # No Ollama client, so the built-in hashing embedder is used
+    return SearchManager(None, index_path=str(tmp_path / 'search_index'),
+                         embedding_cache_dir=str(tmp_path / 'embedding_cache'), **kwargs)
+
+
+def test_index_file_defers_writes_until_commit(tmp_path):
+    manager = make_manager(tmp_path)
+    assert manager.index_file('/docs/notes.txt', 'lecture notes on linear algebra')
+    assert manager.pending_changes == 1
+    assert not os.path.exists(manager.lexical_index.manifest_path)
+
+    manager.commit()
+    assert manager.pending_changes == 0
+    reopened = make_manager(tmp_path)
+    assert len(reopened.lexical_index) == 1
+    assert reopened.chunk_index.file_count() == 1
+
+
+def test_index_file_commits_at_flush_threshold(tmp_path):
+    manager = make_manager(tmp_path, flush_threshold=2)
+    manager.index_file('/docs/a.txt', 'first document')
+    assert not os.path.exists(manager.lexical_index.manifest_path)
+    manager.index_file('/docs/b.txt', 'second document')
+    assert manager.pending_changes == 0
+    assert len(make_manager(tmp_path).lexical_index) == 2
+
+
+def test_failed_embedding_leaves_file_unindexed(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path)
+    monkeypatch.setattr(manager.embeddings_generator, 'generate_embeddings_batch', lambda texts: [None] * len(texts))
+    assert not manager.index_file('/docs/broken.txt', 'unreadable invoice text')
+    assert len(manager.lexical_index) == 0
+    assert len(manager.metadata_store) == 0
+    assert manager.search('invoice', mode='lexical') == []
+
+
+def test_index_files_skips_files_that_failed_to_embed(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path)
+    generate = manager.embeddings_generator.generate_embeddings_batch
+    monkeypatch.setattr(manager.embeddings_generator, 'generate_embeddings_batch',
+                        lambda texts: [None if 'broken' in text else vector
+                                       for text, vector in zip(texts, generate(texts))])
+    results = manager.index_files([
+        {'path': '/docs/good.txt', 'content': 'good invoice text'},
+        {'path': '/docs/bad.txt', 'content': 'broken invoice text'},
+    ])
+    assert results == {'/docs/good.txt': True, '/docs/bad.txt': False}
+    assert [hit['file_path'] for hit in manager.search('invoice', mode='lexical')] == ['/docs/good.txt']
+
+
+def test_files_get_chunk_vectors_only(tmp_path):
+    manager = make_manager(tmp_path)
+    manager.index_file('/docs/notes.txt', 'lecture notes on linear algebra')
+    stats = manager.get_index_stats()
+    assert stats['total_files'] == 1
+    assert stats['chunked_files'] == 1
+    assert stats['file_vectors'] == 0
+
+
+def test_reindexing_replaces_a_legacy_file_vector(tmp_path):
+    manager = make_manager(tmp_path)
+    content = 'scanned receipt from the hardware store'
+    manager.index_manager.add_vectors([manager.embeddings_generator.generate_embedding(content)], ['/docs/old.txt'])
+    manager.index_file('/docs/new.txt', 'lecture notes on linear algebra')
+    assert manager.get_index_stats()['total_files'] == 2
+    assert manager.vector_search(content, 1)[0]['file_path'] == '/docs/old.txt'
+
+    manager.index_file('/docs/old.txt', content)
+    assert manager.index_manager.get_total_files() == 0
+    assert manager.get_index_stats()['total_files'] == 2
+    assert manager.vector_search(content, 1)[0]['passage'] == content
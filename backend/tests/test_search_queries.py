@@ -0,0 +1,34 @@
+import pytest
+
+from search.search_manager import is_keyword_query, reciprocal_rank_fusion
+
+
+@pytest.mark.parametrize('query', [
+    'CS101',
+    'INV-2024-0042',
+    'INV-0007',
+    'tax_2023_final',
+    'report-v2.pdf',
+    '"quarterly report"',
+    'CS101 MATH-2210',
+])
+def test_identifier_queries_are_keyword_queries(query):
+    assert is_keyword_query(query)
+
+
+@pytest.mark.parametrize('query', [
+    'invoice',
+    'invoice 2024',
+    'notes for CS101',
+    'photos from the beach',
+    '',
+    '   ',
+])
+def test_natural_language_queries_are_not_keyword_queries(query):
+    assert not is_keyword_query(query)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'a', 'd']])
+    assert {file_path for file_path, _ in fused[:2]} == {'a', 'b'}
+    assert dict(fused)['a'] > dict(fused)['c']
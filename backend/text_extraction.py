@@ -0,0 +1,192 @@
+import os
+import queue
+import atexit
+import threading
+import multiprocessing
+import logging
+import PyPDF2
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; workers then run without a memory cap
+    resource = None
+
+logger = logging.getLogger('text_extraction')
+
+# Number of characters sent to the LLM for each file
+MAX_EXCERPT_CHARS = 1000
+
+# A PDF that takes longer than this is abandoned and its worker killed
+EXTRACTION_TIMEOUT_SECONDS = 30
+# Address-space cap for each extraction worker
+WORKER_MEMORY_LIMIT_MB = 1024
+# Workers are replaced after this many files to shed leaked memory
+MAX_FILES_PER_WORKER = 100
+
+def extract_pdf_text(file_path, max_chars=MAX_EXCERPT_CHARS):
+    """Extract up to max_chars characters from a PDF in the current process"""
+    text = ""
+    logger.debug(f"Extracting text from PDF file: {file_path}")
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page in reader.pages:
+            page_text = page.extract_text()
+            if page_text:
+                text += page_text
+                if len(text) >= max_chars:
+                    text = text[:max_chars]
+                    break
+    return text
+
+def extract_text(file_path, max_chars=MAX_EXCERPT_CHARS):
+    """Extract up to max_chars characters of text from a PDF or text file.
+
+    PDFs are parsed in the shared extraction pool so a slow or hostile
+    document cannot stall or exhaust the calling process.
+    """
+    if file_path.lower().endswith('.pdf'):
+        return get_extraction_pool().extract(file_path, max_chars)
+    logger.debug(f"Reading text file: {file_path}")
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read(max_chars)
+
+def run_worker(connection, memory_limit_mb):
+    """Worker process loop: receive (file_path, max_chars), send (ok, result, retire)"""
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not cap extraction worker memory: {str(e)}")
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        file_path, max_chars = request
+        try:
+            connection.send((True, extract_pdf_text(file_path, max_chars), False))
+        except MemoryError:
+            # The heap is likely fragmented; let the pool start a fresh worker
+            connection.send((False, f"ran out of memory (limit {memory_limit_mb} MB)", True))
+            break
+        except Exception as e:
+            connection.send((False, str(e), False))
+
+class ExtractionWorker:
+    """One extraction process and the pipe used to talk to it"""
+
+    def __init__(self, context, memory_limit_mb):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_worker,
+            args=(child_connection, memory_limit_mb),
+            name='pdf-extraction',
+            daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.files_handled = 0
+        self.retired = False
+
+    def extract(self, file_path, max_chars, timeout):
+        self.files_handled += 1
+        try:
+            self.connection.send((file_path, max_chars))
+            ready = self.connection.poll(timeout)
+            if ready:
+                ok, result, retire = self.connection.recv()
+        except (EOFError, OSError) as e:
+            self.stop(force=True)
+            raise RuntimeError(f"Extraction worker exited while reading {file_path}") from e
+        if not ready:
+            self.stop(force=True)
+            raise TimeoutError(f"Extraction of {file_path} timed out after {timeout}s")
+        if retire:
+            self.stop(force=True)
+        if not ok:
+            raise RuntimeError(f"Could not extract text from {file_path}: {result}")
+        return result
+
+    def stop(self, force=False):
+        self.retired = True
+        if not force:
+            try:
+                self.connection.send(None)
+                self.process.join(timeout=1)
+            except (EOFError, OSError):
+                pass
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1)
+        self.connection.close()
+
+class ExtractionPool:
+    """A pool of PDF extraction processes with per-file timeouts.
+
+    Each worker runs with an address-space limit (where the platform
+    supports it) and is replaced after max_files_per_worker files, after a
+    timeout, or after it dies. Workers are started on demand with the
+    spawn method so the pool is safe to use from threaded callers.
+    """
+
+    def __init__(self, max_workers=None, timeout=EXTRACTION_TIMEOUT_SECONDS,
+                 memory_limit_mb=WORKER_MEMORY_LIMIT_MB, max_files_per_worker=MAX_FILES_PER_WORKER):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_files_per_worker = max_files_per_worker
+        self.context = multiprocessing.get_context('spawn')
+        self.slots = threading.Semaphore(self.max_workers)
+        self.idle = queue.LifoQueue()
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            try:
+                return ExtractionWorker(self.context, self.memory_limit_mb)
+            except Exception:
+                self.slots.release()
+                raise
+
+    def release(self, worker):
+        if worker.retired:
+            pass
+        elif worker.files_handled >= self.max_files_per_worker or not worker.process.is_alive():
+            worker.stop()
+        else:
+            self.idle.put(worker)
+        self.slots.release()
+
+    def extract(self, file_path, max_chars=MAX_EXCERPT_CHARS):
+        """Extract text from a PDF in a worker process, blocking until done"""
+        worker = self.acquire()
+        try:
+            return worker.extract(file_path, max_chars, self.timeout)
+        finally:
+            self.release(worker)
+
+    def close(self):
+        """Stop the idle workers; workers in use stop when released"""
+        while True:
+            try:
+                self.idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_extraction_pool():
+    """Return the process-wide extraction pool, creating it on first use"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ExtractionPool()
+            atexit.register(_default_pool.close)
+        return _default_pool
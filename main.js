@@ -1,6 +1,8 @@
 const { app, BrowserWindow, ipcMain, dialog } = require('electron');
 const path = require('path');
 const { PythonShell } = require('python-shell');
+const { spawn } = require('child_process');
+const readline = require('readline');
 const fs = require('fs');
 const { getPythonPath } = require('./find_python.js');
 
@@ -77,7 +79,97 @@ function createWindow() {
   });
 }
 
-app.on('ready', createWindow);
+// Long-lived Python backend (backend/backend_daemon.py) speaking JSON-RPC
+// over stdio. Started once so imports, clients and models stay warm.
+let backendProcess = null;
+let backendRequestId = 0;
+const pendingBackendRequests = new Map();
+
+function startBackend() {
+  if (backendProcess) return backendProcess;
+
+  const scriptPath = path.join(__dirname, 'backend', 'backend_daemon.py');
+  const pythonPath = getPythonPath();
+  debug(`Starting backend daemon: ${pythonPath} ${scriptPath}`);
+
+  const child = spawn(pythonPath, ['-u', scriptPath], { stdio: ['pipe', 'pipe', 'pipe'] });
+  backendProcess = child;
+
+  const lines = readline.createInterface({ input: child.stdout });
+  lines.on('line', (line) => {
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      debug('Non-JSON backend output:', line);
+      return;
+    }
+
+    if (message.method === 'output') {
+      // Lines printed by the backend while handling a request
+      const { id, line: outputLine } = message.params || {};
+      const pending = pendingBackendRequests.get(id);
+      debug('Python output:', outputLine);
+      if (pending && pending.onOutput) {
+        pending.onOutput(outputLine);
+      }
+      return;
+    }
+
+    const pending = pendingBackendRequests.get(message.id);
+    if (!pending) return;
+    pendingBackendRequests.delete(message.id);
+    if (message.error) {
+      pending.reject(new Error(message.error.message));
+    } else {
+      pending.resolve(message.result);
+    }
+  });
+
+  child.stderr.on('data', (data) => {
+    debug('Python error:', data.toString());
+  });
+
+  child.on('exit', (code) => {
+    debug(`Backend daemon exited with code ${code}`);
+    if (backendProcess === child) backendProcess = null;
+    for (const pending of pendingBackendRequests.values()) {
+      pending.reject(new Error(`Python backend exited with code ${code}`));
+    }
+    pendingBackendRequests.clear();
+  });
+
+  child.on('error', (err) => {
+    console.error('Backend daemon error:', err);
+  });
+
+  return child;
+}
+
+function callBackend(method, params = {}, onOutput = null) {
+  const child = startBackend();
+  const id = ++backendRequestId;
+  return new Promise((resolve, reject) => {
+    pendingBackendRequests.set(id, { resolve, reject, onOutput });
+    debug(`Calling backend method ${method}`);
+    child.stdin.write(JSON.stringify({ jsonrpc: '2.0', id, method, params }) + '\n');
+  });
+}
+
+function stopBackend() {
+  if (backendProcess) {
+    backendProcess.stdin.end();
+    backendProcess = null;
+  }
+}
+
+app.on('ready', () => {
+  createWindow();
+  // Start the backend early and import modules while the UI loads
+  callBackend('warmup').catch((err) => debug('Backend warmup failed:', err));
+});
+
+app.on('will-quit', stopBackend);
 
 app.on('window-all-closed', () => {
   if (process.platform !== 'darwin') app.quit();
@@ -109,147 +201,38 @@ ipcMain.handle('select-directory', async () => {
   return null;
 });
 
-// Run Python script to analyze directory
+// Run directory analysis in the backend daemon
 ipcMain.handle('analyze-directory', async (event, directoryPath) => {
   debug(`Starting directory analysis: ${directoryPath}`);
   debug(`Current online mode state: ${isOnlineMode}`);
-  return new Promise((resolve, reject) => {
-    // Create a temporary JSON file to pass the directory path to Python
-    const configPath = path.join(app.getPath('temp'), 'file_organizer_config.json');
-    debug(`Creating config file at: ${configPath}`);
-    
-    const configData = { 
-      directory: directoryPath,
-      online_mode: isOnlineMode  // Include online mode in config
-    };
-    
-    debug(`Config data for Python: ${JSON.stringify(configData)}`);
-    fs.writeFileSync(configPath, JSON.stringify(configData));
-    
-    // Path to Python script
-    const scriptPath = path.join(__dirname, 'backend', 'initial_organize_electron.py');
-    debug(`Using Python script: ${scriptPath}`);
-    
-    // Get the path to the virtual environment's Python executable
-    const pythonPath = getPythonPath();
-    debug(`Using Python interpreter: ${pythonPath}`);
-    
-    const options = {
-      mode: 'text',
-      pythonPath: pythonPath,
-      pythonOptions: ['-u'],
-      args: [configPath]
-    };
-    
-    debug('Starting Python process with options', options);
-    const pythonProcess = PythonShell.run(scriptPath, options, (err, results) => {
-      if (err) {
-        console.error('Python script error:', err);
-        debug('Python execution failed with error', err);
-        reject(err);
-        return;
-      }
-      
-      debug(`Python script execution completed with ${results.length} lines of output`);
-      
-      // Process results and track token usage
-      let jsonOutput = '';
-      let foundRawLLMResponse = false;
-      
-      for (const line of results) {
-        if (line.startsWith('TOKEN_USAGE:') && isOnlineMode) {
-          // Only track tokens and calls in online mode
-          const tokens = parseInt(line.split(':')[1]);
-          updateTokenUsage(tokens);
-          updateCallUsage();
-        } else if (foundRawLLMResponse) {
-          jsonOutput += line;
-        } else if (line.includes('RAW LLM RESPONSE:')) {
-          foundRawLLMResponse = true;
-          debug('Found LLM response marker in output');
-        }
-      }
-      
-      try {
-        const jsonRegex = /{(?:[^{}]|{(?:[^{}]|{[^{}]*})*})*}/g;
-        const matches = jsonOutput.match(jsonRegex);
-        
-        if (matches && matches.length > 0) {
-          debug(`Found ${matches.length} potential JSON matches`);
-          let result = null;
-          for (const match of matches) {
-            try {
-              debug('Trying to parse JSON match', match.substring(0, 100) + '...');
-              result = JSON.parse(match);
-              if (result) {
-                debug('Successfully parsed JSON data');
-                break;
-              }
-            } catch (e) {
-              debug(`Failed to parse potential JSON match: ${e.message}`);
-            }
-          }
-          
-          if (result) {
-            debug('Returning parsed result structure', result);
-            resolve(result);
-          } else {
-            debug('No valid JSON structures found');
-            throw new Error('None of the extracted JSON structures were valid');
-          }
-        } else {
-          debug('No JSON patterns found in output');
-          throw new Error('Could not find valid JSON structure in Python output');
-        }
-      } catch (error) {
-        console.error('Error parsing Python output:', error);
-        debug('Error parsing output', error);
-        debug('Raw output:', results.join('\n'));
-        reject(error);
-      }
-    });
-    
-    // Handle process output
-    pythonProcess.on('message', (message) => {
-      if (message.startsWith('TOKEN_USAGE:') && isOnlineMode) {
-        // Only track tokens and calls in online mode
-        const tokens = parseInt(message.split(':')[1]);
-        updateTokenUsage(tokens);
-        updateCallUsage();
-      }
-    });
+
+  const result = await callBackend('analyze_directory', {
+    directory: directoryPath,
+    online_mode: isOnlineMode
+  }, (line) => {
+    if (line.startsWith('TOKEN_USAGE:') && isOnlineMode) {
+      // Only track tokens and calls in online mode
+      const tokens = parseInt(line.split(':')[1]);
+      updateTokenUsage(tokens);
+      updateCallUsage();
+    } else if (line.startsWith('PROGRESS:') && mainWindow) {
+      // Per-file progress from the concurrent summarization stage
+      const [completed, total] = line.split(':')[1].split('/').map(Number);
+      mainWindow.webContents.send('analysis-progress', { completed, total });
+    }
   });
+
+  debug('Returning parsed result structure', result);
+  return result;
 });
 
 // Apply changes
 ipcMain.handle('apply-changes', async (event, fileStructure) => {
-  return new Promise((resolve, reject) => {
-    // Create a temporary JSON file to pass the file structure to Python
-    const structurePath = path.join(app.getPath('temp'), 'file_structure.json');
-    fs.writeFileSync(structurePath, JSON.stringify(fileStructure));
-    
-    // Path to Python script
-    const scriptPath = path.join(__dirname, 'backend', 'apply_changes.py');
-    
-    // Get the path to the virtual environment's Python executable
-    const pythonPath = getPythonPath();
-    
-    const options = {
-      mode: 'text',
-      pythonPath: pythonPath,
-      pythonOptions: ['-u'],
-      args: [structurePath]
-    };
-    
-    PythonShell.run(scriptPath, options, (err, results) => {
-      if (err) {
-        reject(err);
-        return;
-      }
-      
-      resolve({ success: true, message: results.join('\n') });
-    });
-  });
+  const result = await callBackend('apply_changes', { structure: fileStructure });
+  if (!result.success) {
+    throw new Error(result.message);
+  }
+  return { success: true, message: result.message };
 });
 
 // Check if test.json exists in the project root directory
@@ -274,10 +257,6 @@ ipcMain.handle('read-test-json', async (event) => {
 
 ipcMain.handle('chat-query', async (event, { message, currentFileStructure }) => {
   try {
-    const configPath = path.join(app.getPath('temp'), 'chat_query_config.json');
-    const scriptPath = path.join(__dirname, 'backend', 'chat_agent_runner.py');
-    const pythonPath = getPythonPath();
-
     // Check for API key in online mode
     if (isOnlineMode) {
       const apiKey = process.env.OPENAI_API_KEY;
@@ -290,67 +269,34 @@ ipcMain.handle('chat-query', async (event, { message, currentFileStructure }) =>
       }
     }
 
-    // Include the current online mode in the configuration
-    fs.writeFileSync(configPath, JSON.stringify({
-      message,
-      currentFileStructure,
-      online_mode: isOnlineMode
-    }));
-
     // Call usage will only be updated if we're in online mode 
     // due to the check inside updateCallUsage
     updateCallUsage();
 
-    const options = {
-      mode: 'text',
-      pythonPath: pythonPath,
-      pythonOptions: ['-u'],
-      args: [configPath]
-    };
-
-    return new Promise((resolve, reject) => {
-      PythonShell.run(scriptPath, options, (err, results) => {
-        if (err) {
-          console.error('Chat agent error:', err);
-          
-          // Provide a more helpful error message
-          if (err.message && err.message.includes('OPENAI_API_KEY environment variable is required')) {
-            resolve({
-              message: "OpenAI API key not found. Please add your API key or switch to offline mode.",
-              updatedFileStructure: null
-            });
-          } else {
-            reject(err);
-          }
-          return;
-        }
-
-        try {
-          // Process results for token usage tracking
-          let lastLine = '';
-          for (const line of results) {
-            // Only track token usage when in online mode
-            if (line.startsWith('TOKEN_USAGE:') && isOnlineMode) {
-              const tokens = parseInt(line.split(':')[1]);
-              updateTokenUsage(tokens);
-            } else {
-              lastLine = line;
-            }
-          }
-          
-          // If no content was found, use the last line
-          if (!lastLine && results.length > 0) {
-            lastLine = results[results.length - 1];
-          }
-          
-          const data = JSON.parse(lastLine);
-          resolve(data);
-        } catch (parseError) {
-          console.error('Failed to parse chat agent output:', parseError);
-          reject(parseError);
+    try {
+      return await callBackend('chat_query', {
+        message,
+        currentFileStructure,
+        online_mode: isOnlineMode
+      }, (line) => {
+        // Only track token usage when in online mode
+        if (line.startsWith('TOKEN_USAGE:') && isOnlineMode) {
+          const tokens = parseInt(line.split(':')[1]);
+          updateTokenUsage(tokens);
         }
       });
-    });
+    } catch (err) {
+      console.error('Chat agent error:', err);
+
+      // Provide a more helpful error message
+      if (err.message && err.message.includes('OPENAI_API_KEY environment variable is required')) {
+        return {
+          message: "OpenAI API key not found. Please add your API key or switch to offline mode.",
+          updatedFileStructure: null
+        };
+      }
+      throw err;
+    }
 
   } catch (err) {
     console.error('Error in chat-query handler:', err);
@@ -395,10 +341,6 @@ ipcMain.handle('get-online-mode', async (event) => {
 // Update generate-filenames handler
 ipcMain.handle('generate-filenames', async (event, { files, online_mode }) => {
   try {
-    const configPath = path.join(app.getPath('temp'), 'rename_files_config.json');
-    const scriptPath = path.join(__dirname, 'backend', 'rename_files.py');
-    const pythonPath = getPythonPath();
-
     debug('Generating filenames with config:', { files, online_mode });
     
     // Add check for online mode and API key availability
@@ -419,75 +361,25 @@ ipcMain.handle('generate-filenames', async (event, { files, online_mode }) => {
     if (online_mode) {
       updateCallUsage();
     }
-    
-    fs.writeFileSync(configPath, JSON.stringify({
-      action: 'generate',
-      files: files,
-      online_mode: online_mode
-    }));
 
-    const options = {
-      mode: 'text',
-      pythonPath: pythonPath,
-      pythonOptions: ['-u'],
-      args: [configPath]
-    };
-
-    return new Promise((resolve, reject) => {
-      debug('Starting Python process with options:', options);
-      const pythonProcess = PythonShell.run(scriptPath, options, (err, results) => {
-        if (err) {
-          console.error('Python script error:', err);
-          debug('Python execution failed with error:', err);
-          
-          // Provide a more helpful error message
-          if (err.message && err.message.includes('ModuleNotFoundError: No module named \'moondream\'')) {
-            reject(new Error('The Moondream module is not installed. Try using online mode or install the required dependencies.'));
-          } else {
-            reject(err);
-          }
-          return;
-        }
-
-        debug('Python script output:', results);
-        try {
-          // Process all output lines to capture token usage
-          let lastLine = '';
-          for (const line of results) {
-            // Only track token usage when in online mode
-            if (line.startsWith('TOKEN_USAGE:') && online_mode) {
-              const tokens = parseInt(line.split(':')[1]);
-              updateTokenUsage(tokens);
-            } else {
-              lastLine = line;
-            }
-          }
-
-          // Parse the final JSON result
-          debug('Last line of output:', lastLine);
-          const data = JSON.parse(lastLine);
-          resolve(data);
-        } catch (parseError) {
-          console.error('Failed to parse Python output:', parseError);
-          debug('Failed to parse output:', parseError);
-          reject(parseError);
-        }
-      });
-
-      // Handle process output in real-time
-      pythonProcess.on('message', (message) => {
+    try {
+      return await callBackend('generate_filenames', { files, online_mode }, (line) => {
         // Only track token usage when in online mode
-        if (message.startsWith('TOKEN_USAGE:') && online_mode) {
-          const tokens = parseInt(message.split(':')[1]);
+        if (line.startsWith('TOKEN_USAGE:') && online_mode) {
+          const tokens = parseInt(line.split(':')[1]);
           updateTokenUsage(tokens);
         }
       });
+    } catch (err) {
+      console.error('Python backend error:', err);
+      debug('Filename generation failed with error:', err);
 
-      pythonProcess.on('error', (error) => {
-        console.error('Python process error:', error);
-        debug('Python process error:', error);
-      });
-    });
+      // Provide a more helpful error message
+      if (err.message && err.message.includes('No module named \'moondream\'')) {
+        throw new Error('The Moondream module is not installed. Try using online mode or install the required dependencies.');
+      }
+      throw err;
+    }
   } catch (error) {
     console.error('Error in generate-filenames handler:', error);
     debug('Error in generate-filenames handler:', error);
@@ -498,11 +390,7 @@ ipcMain.handle('generate-filenames', async (event, { files, online_mode }) => {
 // Update rename-files handler
 ipcMain.handle('rename-files', async (event, filesToProcess) => {
   try {
-    const configPath = path.join(app.getPath('temp'), 'rename_files_config.json');
-    const scriptPath = path.join(__dirname, 'backend', 'rename_files.py');
-    const pythonPath = getPythonPath();
-
-    // Convert the file list to the format expected by the Python script
+    // Convert the file list to the format expected by the Python backend
     const files = filesToProcess.map(file => ({
       path: file.oldPath,
       name: path.basename(file.oldPath)
@@ -517,53 +405,16 @@ ipcMain.handle('rename-files', async (event, filesToProcess) => {
     // due to the check inside updateCallUsage
     updateCallUsage();
 
-    fs.writeFileSync(configPath, JSON.stringify({
-      action: 'rename',
+    return await callBackend('rename_files', {
       files: files,
       new_names: new_names,
       online_mode: isOnlineMode
-    }));
-
-    const options = {
-      mode: 'text',
-      pythonPath: pythonPath,
-      pythonOptions: ['-u'],
-      args: [configPath]
-    };
-
-    return new Promise((resolve, reject) => {
-      PythonShell.run(scriptPath, options, (err, results) => {
-        if (err) {
-          console.error('Python script error:', err);
-          reject(err);
-          return;
-        }
-
-        try {
-          // Process results for token usage (if any) and get the last line
-          let lastLine = '';
-          for (const line of results) {
-            // Only track token usage when in online mode
-            if (line.startsWith('TOKEN_USAGE:') && isOnlineMode) {
-              const tokens = parseInt(line.split(':')[1]);
-              updateTokenUsage(tokens);
-            } else {
-              lastLine = line;
-            }
-          }
-          
-          // If no content was found in the results, use the last line
-          if (!lastLine && results.length > 0) {
-            lastLine = results[results.length - 1];
-          }
-          
-          const data = JSON.parse(lastLine);
-          resolve(data);
-        } catch (parseError) {
-          console.error('Failed to parse Python output:', parseError);
-          reject(parseError);
-        }
-      });
+    }, (line) => {
+      // Only track token usage when in online mode
+      if (line.startsWith('TOKEN_USAGE:') && isOnlineMode) {
+        const tokens = parseInt(line.split(':')[1]);
+        updateTokenUsage(tokens);
+      }
     });
   } catch (error) {
     console.error('Error in rename-files handler:', error);
@@ -5,7 +5,8 @@ const { contextBridge, ipcRenderer } = require('electron');
 contextBridge.exposeInMainWorld(
   'electronAPI', {
     selectDirectory: () => ipcRenderer.invoke('select-directory'),
-    sendChatQuery: (data) => ipcRenderer.invoke('send-chat-query', data)
+    sendChatQuery: (data) => ipcRenderer.invoke('send-chat-query', data),
+    onAnalysisProgress: (callback) => ipcRenderer.on('analysis-progress', (event, progress) => callback(progress))
     // Add any other methods you need to expose
   }
 ); 
\ No newline at end of file
@@ -7,6 +7,8 @@ const directoryInput = document.getElementById('directoryPath');
 const browseBtn = document.getElementById('browseBtn');
 const analyzeBtn = document.getElementById('analyzeBtn');
 const loader = document.getElementById('loader');
+const loaderText = document.getElementById('loaderText');
+const LOADER_MESSAGE = 'Analyzing files and generating structure...';
 const resultsContainer = document.getElementById('resultsContainer');
 const fileTree = document.getElementById('fileTree');
 const applyBtn = document.getElementById('applyBtn');
@@ -90,6 +92,13 @@ ipcRenderer.on('update-call-usage', (event, usage) => {
   }
 });
 
+// Per-file progress while the backend summarizes the directory
+ipcRenderer.on('analysis-progress', (event, { completed, total }) => {
+  if (loaderText) {
+    loaderText.textContent = `Summarizing files... ${completed}/${total}`;
+  }
+});
+
 // Function to update limits box visibility
 function updateLimitsBoxVisibility() {
   if (modeToggle.checked) {
@@ -145,6 +154,7 @@ analyzeBtn.addEventListener('click', async () => {
   await ipcRenderer.invoke('update-call-usage');
   
   analyzeBtn.disabled = true;
+  loaderText.textContent = LOADER_MESSAGE;
   loader.style.display = 'flex';
   resultsContainer.style.display = 'none';
   showMessage('Analyzing files and generating structure...', 'info');